@@ -25,7 +25,7 @@ class EmployeeInline(admin.StackedInline):
 
     def face_registration_status(self, obj):
         """Hiển thị trạng thái đăng ký khuôn mặt"""
-        if obj and obj.face_embeddings:
+        if obj and obj.has_face:
             return format_html('<span style="color: green; font-weight: bold;">✓ Đã đăng ký khuôn mặt</span>')
         return format_html('<span style="color: red;">✗ Chưa đăng ký khuôn mặt</span>')
     face_registration_status.short_description = "Đăng ký khuôn mặt"
@@ -64,10 +64,11 @@ class EmployeeAdmin(admin.ModelAdmin):
 
     def face_embeddings_status(self, obj):
         """Hiển thị trạng thái dữ liệu khuôn mặt"""
-        if obj.face_embeddings:
+        if obj.has_face:
             return format_html('<span style="color: green;">Đã đăng ký</span>')
         return format_html('<span style="color: red;">Chưa đăng ký</span>')
     face_embeddings_status.short_description = "Dữ liệu khuôn mặt"
+    face_embeddings_status.admin_order_field = 'face_sample_count'
 
     fieldsets = (
         ('Thông tin cơ bản', {
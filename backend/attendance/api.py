@@ -72,7 +72,7 @@ def login_api(request):
                             'employee_id': employee.employee_id,
                             'department': employee.department.name if employee.department else None,
                             'position': employee.position,
-                            'avatar': employee.face_embeddings is not None # Check if face registered
+                            'avatar': employee.has_face # Check if face registered
                         }
                     })
                 except Employee.DoesNotExist:
@@ -170,7 +170,7 @@ def employees_without_face_api(request):
     try:
         employees = Employee.objects.filter(
             is_active=True
-        ).select_related('user').order_by('first_name', 'last_name')
+        ).select_related('user', 'department').order_by('first_name', 'last_name')
         
         employee_list = []
         for emp in employees:
@@ -179,7 +179,7 @@ def employees_without_face_api(request):
                 'full_name': emp.get_full_name(),
                 'department': emp.department.name if emp.department else None,
                 'position': emp.position,
-                'has_face': bool(emp.face_embeddings)
+                'has_face': emp.has_face
             })
         
         return JsonResponse({
@@ -1,6 +1,22 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class AttendanceConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "attendance"
+
+    def ready(self):
+        if settings.FACE_SERVER_INFERENCE:
+            # Nạp và chạy thử model ngay khi khởi động thay vì ở lượt quét đầu tiên. Với
+            # gunicorn --preload, worker fork ra bỏ embedder này và tự tạo embedder riêng
+            # khi dùng lần đầu (thread của batcher không còn sau fork)
+            from .face_recognition.onnx_embedder import warmup_face_embedder
+            try:
+                warmup_face_embedder()
+            except Exception as e:
+                logger.error(f"[AttendanceConfig] Không khởi tạo được model embedding: {e}")
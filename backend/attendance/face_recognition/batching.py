@@ -0,0 +1,138 @@
+"""
+Gom lô động (micro-batching) cho suy luận embedding phía server.
+
+Các request đồng thời gửi ảnh vào một hàng đợi chung; luồng worker lấy
+request đầu tiên rồi chờ thêm tối đa `max_wait_ms` (hoặc đến khi đủ
+`max_batch_size` ảnh) để chạy cả nhóm thành một tensor duy nhất, sau đó trả
+kết quả về đúng request đang chờ. Một lô lớn tận dụng SIMD/GEMM tốt hơn nhiều
+lần chạy batch = 1, đổi lại mỗi request chờ thêm tối đa một cửa sổ gom lô.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from ..metrics import METRICS_WINDOW, summarize
+
+
+class _Pending:
+    __slots__ = ('items', 'future', 'enqueued_at')
+
+    def __init__(self, items):
+        self.items = items
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=2.0, workers=1, name='inference'):
+        # run_batch(list các item) -> mảng kết quả có cùng số hàng, theo đúng thứ tự
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._closed = False
+
+        self._metrics_lock = threading.Lock()
+        self._batches_total = 0
+        self._items_total = 0
+        self._requests_total = 0
+        self._errors_total = 0
+        self._batch_sizes = deque(maxlen=METRICS_WINDOW)
+        self._wait_ms = deque(maxlen=METRICS_WINDOW)
+        self._run_ms = deque(maxlen=METRICS_WINDOW)
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f'{name}-batcher-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, items):
+        """Đưa một nhóm item (ảnh của một request) vào hàng đợi, trả về Future của kết quả"""
+        if self._closed:
+            raise RuntimeError(f'{self.name} batcher đã dừng')
+        pending = _Pending(list(items))
+        self._queue.put(pending)
+        return pending.future
+
+    def infer(self, items, timeout=None):
+        return self.submit(items).result(timeout=timeout)
+
+    def close(self, timeout=None):
+        """Dừng các worker sau khi xử lý hết các request đã vào hàng đợi"""
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        size = len(first.items)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                pending = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                # Tín hiệu dừng: trả lại cho worker khác / vòng lặp sau
+                self._queue.put(None)
+                break
+            batch.append(pending)
+            size += len(pending.items)
+        return batch
+
+    def _worker(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            items = [item for pending in batch for item in pending.items]
+
+            started = time.perf_counter()
+            try:
+                results = self.run_batch(items)
+            except Exception as e:
+                for pending in batch:
+                    pending.future.set_exception(e)
+                with self._metrics_lock:
+                    self._errors_total += 1
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for pending in batch:
+                count = len(pending.items)
+                pending.future.set_result(results[offset:offset + count])
+                offset += count
+
+            with self._metrics_lock:
+                self._batches_total += 1
+                self._items_total += len(items)
+                self._requests_total += len(batch)
+                self._batch_sizes.append(len(items))
+                self._run_ms.append((finished - started) * 1000)
+                self._wait_ms.extend((started - pending.enqueued_at) * 1000 for pending in batch)
+
+    def stats(self):
+        """Metrics: độ sâu hàng đợi, kích thước lô, thời gian chờ gom lô và thời gian chạy"""
+        with self._metrics_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches_total': self._batches_total,
+                'items_total': self._items_total,
+                'requests_total': self._requests_total,
+                'errors_total': self._errors_total,
+                'batch_size': summarize(self._batch_sizes),
+                'wait_ms': summarize(self._wait_ms),
+                'run_ms': summarize(self._run_ms),
+            }
@@ -0,0 +1,142 @@
+"""
+Nạp gallery khuôn mặt bằng COPY nhị phân.
+
+Đọc qua ORM, mỗi vector được gửi dưới dạng text '[0.1,0.2,...]' rồi được
+pgvector-python parse thành np.array riêng cho từng hàng. Ở đây dùng
+COPY ... TO STDOUT (FORMAT binary): mỗi hàng (employee_id bigint, embedding
+vector(512)) có kích thước cố định, nên từng khối dữ liệu được đọc bằng một
+structured dtype NumPy và ghi thẳng vào mảng float32 cấp phát sẵn. Bộ nhớ
+tạm chỉ bằng một khối (flush_bytes).
+
+Định dạng pgvector (vector_send): int16 số chiều, int16 dự phòng, rồi các
+float4 big-endian.
+"""
+import numpy as np
+from django.db import connection, transaction
+
+from .gallery import EMBEDDING_DIM
+
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+TRAILER = b'\xff\xff'
+
+# Một hàng COPY nhị phân: số cột, (độ dài, employee_id), (độ dài, số chiều, dự phòng, vector)
+ROW_DTYPE = np.dtype([
+    ('field_count', '>i2'),
+    ('id_length', '>i4'),
+    ('employee_id', '>i8'),
+    ('vector_length', '>i4'),
+    ('dim', '>i2'),
+    ('unused', '>i2'),
+    ('vector', '>f4', (EMBEDDING_DIM,)),
+])
+
+
+class _RowSink:
+    """Nhận dữ liệu COPY (file-like write) và giải mã vào mảng đích.
+
+    psycopg2 gọi write() một lần cho mỗi hàng, nên các hàng được gom lại và
+    chỉ giải mã bằng NumPy khi đủ flush_bytes.
+    """
+
+    def __init__(self, capacity, flush_bytes=1 << 20):
+        self.employee_ids = np.empty(capacity, dtype=np.int64)
+        self.matrix = np.empty((capacity, EMBEDDING_DIM), dtype=np.float32)
+        self.count = 0
+        self.flush_bytes = flush_bytes
+        self._chunks = []
+        self._buffered = 0
+        self._header_done = False
+        self._finished = False
+
+    def _grow(self, needed):
+        capacity = max(needed, len(self.employee_ids) * 2, 1024)
+        self.employee_ids = np.resize(self.employee_ids, capacity)
+        matrix = np.empty((capacity, EMBEDDING_DIM), dtype=np.float32)
+        matrix[:self.count] = self.matrix[:self.count]
+        self.matrix = matrix
+
+    def write(self, chunk):
+        if self._finished:
+            return
+        self._chunks.append(bytes(chunk))
+        self._buffered += len(chunk)
+        if self._buffered >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        """Giải mã mọi hàng đầy đủ đang chờ, giữ lại phần dư (một hàng bị cắt giữa hai khối)"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self._buffered = 0
+
+        offset = 0
+        if not self._header_done:
+            # Chữ ký 11 byte + cờ int32 + độ dài phần mở rộng int32 (+ phần mở rộng)
+            if len(data) >= 11 and data[:11] != COPY_SIGNATURE:
+                raise ValueError('Dữ liệu COPY nhị phân không hợp lệ')
+            if len(data) < 19 or len(data) < 19 + int.from_bytes(data[15:19], 'big'):
+                self._keep(data)
+                return
+            offset = 19 + int.from_bytes(data[15:19], 'big')
+            self._header_done = True
+
+        rows = (len(data) - offset) // ROW_DTYPE.itemsize
+        if rows:
+            records = np.frombuffer(data, dtype=ROW_DTYPE, count=rows, offset=offset)
+            trailer = np.flatnonzero(records['field_count'] != 2)
+            if len(trailer):
+                # Trailer (-1) nằm giữa khối: chỉ lấy các hàng trước nó
+                rows = int(trailer[0])
+                records = records[:rows]
+                self._finished = True
+            if np.any(records['dim'] != EMBEDDING_DIM):
+                raise ValueError(f'Embedding trong database không phải {EMBEDDING_DIM} chiều')
+            end = self.count + rows
+            if end > len(self.employee_ids):
+                self._grow(end)
+            self.employee_ids[self.count:end] = records['employee_id']
+            # Chuyển byte order ngay khi gán vào mảng float32 native, không qua mảng trung gian
+            self.matrix[self.count:end] = records['vector']
+            self.count = end
+            offset += rows * ROW_DTYPE.itemsize
+
+        if data[offset:offset + 2] == TRAILER:
+            self._finished = True
+        if not self._finished:
+            self._keep(data[offset:])
+
+    def _keep(self, remainder):
+        if remainder:
+            self._chunks.append(remainder)
+            self._buffered = len(remainder)
+
+    def result(self):
+        self.flush()
+        if not self._finished:
+            raise ValueError('Dữ liệu COPY nhị phân bị cắt cụt')
+        return self.employee_ids[:self.count], self.matrix[:self.count]
+
+
+def load_gallery_arrays(flush_bytes=4 << 20):
+    """(employee_ids, matrix) của các embedding thuộc nhân viên đang hoạt động, sắp theo nhân viên.
+
+    flush_bytes: kích thước khối giải mã (giới hạn bộ nhớ tạm ngoài mảng kết quả).
+    """
+    from ..models import Employee, EmployeeFaceEmbedding
+
+    embedding_table = EmployeeFaceEmbedding._meta.db_table
+    employee_table = Employee._meta.db_table
+    active = f"""
+        FROM {embedding_table} emb
+        JOIN {employee_table} e ON e.id = emb.employee_id
+        WHERE e.is_active"""
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Đếm trước để cấp phát một lần; hàng thêm vào giữa hai câu lệnh được xử lý bằng _grow
+        cursor.execute(f"SELECT count(*) {active}")
+        sink = _RowSink(cursor.fetchone()[0], flush_bytes=flush_bytes)
+        cursor.cursor.copy_expert(
+            f"COPY (SELECT emb.employee_id, emb.embedding {active} ORDER BY emb.employee_id, emb.id) "
+            f"TO STDOUT (FORMAT binary)",
+            sink)
+    return sink.result()
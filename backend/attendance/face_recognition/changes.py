@@ -0,0 +1,61 @@
+"""
+Đọc nhật ký thay đổi gallery khuôn mặt (FaceGalleryChange).
+
+Mỗi khi mẫu khuôn mặt hoặc trạng thái của một nhân viên thay đổi, một dòng
+(employee_pk, txid) được ghi trong cùng transaction. Worker không nạp lại toàn
+bộ gallery mà chỉ đọc các dòng mới và nạp lại mẫu của những nhân viên đó.
+
+Các transaction có thể commit khác thứ tự id/txid, nên không thể chỉ nhớ id
+lớn nhất đã đọc. Thay vào đó worker nhớ watermark = xmin của snapshot
+PostgreSQL lấy trước khi đọc: mọi transaction có txid < xmin đã kết thúc,
+nên các dòng đó đã hiển thị (hoặc không bao giờ tồn tại). Lần đọc sau lấy mọi
+dòng có txid >= watermark, bỏ qua các id đã áp dụng.
+"""
+import numpy as np
+from django.db import connection
+
+from .gallery import EMBEDDING_DIM
+
+
+def current_watermark():
+    """txid nhỏ nhất còn đang chạy tại thời điểm gọi"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return cursor.fetchone()[0]
+
+
+def fetch_changes(watermark, seen_ids=frozenset()):
+    """Đọc các thay đổi chưa áp dụng.
+
+    Trả về (employee_pks đã thay đổi, watermark mới, seen_ids mới). seen_ids là
+    id các dòng có txid >= watermark mới đã áp dụng, để lần đọc sau bỏ qua.
+    """
+    from ..models import FaceGalleryChange
+
+    new_watermark = current_watermark()
+    rows = list(FaceGalleryChange.objects.filter(txid__gte=watermark).values_list('id', 'employee_pk', 'txid'))
+    employee_pks = {employee_pk for change_id, employee_pk, _ in rows if change_id not in seen_ids}
+    seen = frozenset(change_id for change_id, _, txid in rows if txid >= new_watermark)
+    return employee_pks, new_watermark, seen
+
+
+def load_employee_rows(employee_pks):
+    """(employee_ids, matrix) hiện tại của các nhân viên đã thay đổi (chỉ nhân viên đang hoạt động)"""
+    from ..models import EmployeeFaceEmbedding
+
+    rows = list(EmployeeFaceEmbedding.objects.filter(
+        employee_id__in=employee_pks, employee__is_active=True
+    ).values_list('employee_id', 'embedding'))
+    employee_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    matrix = np.array([r[1] for r in rows], dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    return employee_ids, matrix
+
+
+def prune_changes(older_than):
+    """Xóa các dòng nhật ký cũ hơn older_than (timedelta), trả về số dòng đã xóa"""
+    from django.utils import timezone
+
+    from ..models import FaceGalleryChange
+
+    deleted, _ = FaceGalleryChange.objects.filter(created_at__lt=timezone.now() - older_than).delete()
+    return deleted
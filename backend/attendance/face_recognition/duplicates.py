@@ -0,0 +1,100 @@
+"""
+Kiểm tra trùng khuôn mặt trên toàn bộ gallery (mọi cặp mẫu).
+
+Ma trận mẫu đã chuẩn hóa (N x 512) được chia thành các khối B hàng; mỗi tác
+vụ tính cosine của một cặp khối (i, j), j >= i, bằng một phép nhân ma trận
+B x B và chỉ trả về các cặp nhân viên khác nhau có similarity >= ngưỡng (đã
+gộp theo cặp nhân viên). Các tác vụ chạy trong process pool; mỗi tiến trình
+mmap cùng một file .npy nên bộ nhớ mỗi tiến trình chỉ thêm một ma trận B x B.
+"""
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+_worker_state = {}
+
+
+def _init_worker(matrix_path, ids_path):
+    _worker_state['matrix'] = np.load(matrix_path, mmap_mode='r')
+    _worker_state['employee_ids'] = np.load(ids_path, mmap_mode='r')
+
+
+def aggregate_pairs(employee_a, employee_b, scores):
+    """Gộp các cặp mẫu thành cặp nhân viên (a < b): (a, b, similarity lớn nhất, số cặp mẫu)"""
+    low = np.minimum(employee_a, employee_b)
+    high = np.maximum(employee_a, employee_b)
+    order = np.lexsort((-scores, high, low))
+    low, high, scores = low[order], high[order], scores[order]
+    first = np.ones(len(low), dtype=bool)
+    first[1:] = (low[1:] != low[:-1]) | (high[1:] != high[:-1])
+    starts = np.flatnonzero(first)
+    counts = np.diff(np.append(starts, len(low)))
+    return low[starts], high[starts], scores[starts], counts
+
+
+def compare_blocks(matrix, employee_ids, i_start, i_end, j_start, j_end, threshold):
+    """Các cặp mẫu của hai nhân viên khác nhau giữa khối hàng [i_start, i_end) và [j_start, j_end)"""
+    scores = np.asarray(matrix[i_start:i_end]) @ np.asarray(matrix[j_start:j_end]).T
+    rows, cols = np.nonzero(scores >= threshold)
+    if i_start == j_start:
+        # Khối trên đường chéo: mỗi cặp chỉ tính một lần
+        upper = cols > rows
+        rows, cols = rows[upper], cols[upper]
+    employee_a = np.asarray(employee_ids[i_start + rows])
+    employee_b = np.asarray(employee_ids[j_start + cols])
+    different = employee_a != employee_b
+    return aggregate_pairs(employee_a[different], employee_b[different], scores[rows, cols][different])
+
+
+def _compare_task(task):
+    return compare_blocks(_worker_state['matrix'], _worker_state['employee_ids'], *task)
+
+
+def block_tasks(rows, block_size, threshold):
+    for i_start in range(0, rows, block_size):
+        for j_start in range(i_start, rows, block_size):
+            yield (i_start, min(i_start + block_size, rows), j_start, min(j_start + block_size, rows), threshold)
+
+
+def merge_pairs(results):
+    """Gộp kết quả của các khối: {(a, b): [similarity lớn nhất, số cặp mẫu]}"""
+    pairs = {}
+    for low, high, scores, counts in results:
+        for a, b, score, count in zip(low.tolist(), high.tolist(), scores.tolist(), counts.tolist()):
+            entry = pairs.get((a, b))
+            if entry is None:
+                pairs[(a, b)] = [score, count]
+            else:
+                entry[0] = max(entry[0], score)
+                entry[1] += count
+    return pairs
+
+
+def find_duplicate_pairs(matrix, employee_ids, threshold, block_size=2048, workers=None):
+    """Các cặp nhân viên có ít nhất một cặp mẫu với cosine >= threshold.
+
+    matrix: (N x 512) đã chuẩn hóa L2. Trả về list (a, b, similarity lớn nhất,
+    số cặp mẫu vượt ngưỡng), giảm dần theo similarity.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    employee_ids = np.ascontiguousarray(employee_ids, dtype=np.int64)
+    tasks = block_tasks(len(matrix), block_size, threshold)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        pairs = merge_pairs(compare_blocks(matrix, employee_ids, *task) for task in tasks)
+    else:
+        with tempfile.TemporaryDirectory(prefix='face-audit-') as directory:
+            matrix_path = os.path.join(directory, 'matrix.npy')
+            ids_path = os.path.join(directory, 'employee_ids.npy')
+            np.save(matrix_path, matrix)
+            np.save(ids_path, employee_ids)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(matrix_path, ids_path)) as executor:
+                pairs = merge_pairs(executor.map(_compare_task, tasks, chunksize=4))
+
+    result = [(a, b, score, count) for (a, b), (score, count) in pairs.items()]
+    result.sort(key=lambda pair: -pair[2])
+    return result
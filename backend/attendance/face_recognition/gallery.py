@@ -0,0 +1,558 @@
+"""
+Bộ nhớ đệm gallery khuôn mặt trong tiến trình (in-process).
+
+Toàn bộ embedding của nhân viên đang hoạt động được giữ trong một ma trận
+float32 liên tục (N x 512) đã chuẩn hóa L2, nên một lần quét chỉ còn là một
+phép nhân ma trận-vector và argmax thay vì một truy vấn pgvector.
+
+Các hàng được sắp theo nhân viên, kèm ma trận centroid (E x 512) để tìm kiếm
+hai bước: lọc top-M nhân viên theo centroid rồi chỉ tính lại chính xác các
+mẫu của họ (FACE_SHORTLIST_SIZE).
+
+Khi đặt FACE_GALLERY_SHARED_PATH, các worker không tự nạp từ database mà map
+chung một file gallery do tiến trình thay đổi dữ liệu (hoặc lệnh
+publish_face_gallery) xuất bản, xem shared_gallery.py.
+
+Thay đổi của từng nhân viên (đăng ký/xóa khuôn mặt, nghỉ việc) không buộc nạp
+lại toàn bộ: worker đọc nhật ký FaceGalleryChange mỗi
+FACE_GALLERY_CHANGE_POLL_INTERVAL giây và chỉ nạp lại mẫu của các nhân viên đó
+(GallerySnapshot: base + tombstone + delta, gộp lại khi delta đủ lớn).
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+
+_gallery_instance = None
+_gallery_instance_lock = threading.Lock()
+
+
+def normalize_rows(matrix, copy=True):
+    """Chuẩn hóa L2 từng hàng (bỏ qua hàng toàn 0); copy=False chuẩn hóa tại chỗ"""
+    # einsum không tạo ma trận tạm matrix ** 2 như np.linalg.norm
+    norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))[:, None]
+    norms[norms == 0] = 1.0
+    if not copy:
+        matrix /= norms
+        return matrix
+    return matrix / norms
+
+
+# matrix: (N x 512) các mẫu, employee_ids: (N,) nhân viên của từng hàng,
+# centroids: (E x 512), centroid_employee_ids: (E,), offsets: (E + 1,) sao cho
+# các mẫu của nhân viên thứ e nằm ở matrix[offsets[e]:offsets[e + 1]]
+GalleryData = namedtuple('GalleryData', ['matrix', 'employee_ids', 'centroids', 'centroid_employee_ids', 'offsets'])
+
+
+def _segment_means(matrix, starts, counts, block=8192):
+    """Trung bình các hàng của từng nhân viên (matrix đã sắp theo nhân viên).
+
+    np.add.reduceat theo axis 0 rất chậm với ma trận lớn; ở đây cộng lần lượt
+    mẫu thứ k của mọi nhân viên, theo từng khối `block` nhân viên để ma trận
+    tạm không lớn theo số nhân viên.
+    """
+    means = np.zeros((len(starts), matrix.shape[1]), dtype=np.float32)
+    for begin in range(0, len(starts), block):
+        block_starts = starts[begin:begin + block]
+        block_counts = counts[begin:begin + block]
+        block_means = means[begin:begin + block]
+        for k in range(int(block_counts.max())):
+            has_sample = np.flatnonzero(block_counts > k)
+            if len(has_sample) == len(block_starts):
+                block_means += matrix[block_starts + k]
+            else:
+                block_means[has_sample] += matrix[block_starts[has_sample] + k]
+    means /= counts[:, None]
+    return means
+
+
+def build_gallery_data(employee_ids, vectors, copy=True):
+    """Tạo GalleryData từ danh sách employee id và embedding tương ứng.
+
+    copy=False: vectors là mảng float32 của riêng gallery (ví dụ từ bulk_loader)
+    và được chuẩn hóa tại chỗ, không cấp phát thêm một ma trận N x 512.
+    """
+    employee_ids = np.asarray(employee_ids, dtype=np.int64)
+    if len(employee_ids) == 0:
+        empty = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        return GalleryData(empty, employee_ids, empty, employee_ids, np.zeros(1, dtype=np.int64))
+
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    if np.any(employee_ids[1:] < employee_ids[:-1]):
+        order = np.argsort(employee_ids, kind='stable')
+        employee_ids = employee_ids[order]
+        matrix = matrix[order]
+        copy = False
+    matrix = normalize_rows(matrix, copy=copy)
+
+    centroid_employee_ids, starts, counts = np.unique(employee_ids, return_index=True, return_counts=True)
+    centroids = normalize_rows(_segment_means(matrix, starts, counts), copy=False)
+    offsets = np.append(starts, len(employee_ids)).astype(np.int64)
+    return GalleryData(
+        np.ascontiguousarray(matrix, dtype=np.float32),
+        employee_ids,
+        np.ascontiguousarray(centroids, dtype=np.float32),
+        centroid_employee_ids.astype(np.int64),
+        offsets,
+    )
+
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def load_gallery_data():
+    """Đọc toàn bộ embedding của nhân viên đang hoạt động từ database.
+
+    Trên PostgreSQL dùng COPY nhị phân (bulk_loader.py), nhanh hơn và ít bộ
+    nhớ hơn nhiều so với tạo một đối tượng Python cho từng hàng.
+    """
+    from django.db import connection
+
+    if settings.FACE_GALLERY_BULK_LOAD and connection.vendor == 'postgresql':
+        from .bulk_loader import load_gallery_arrays
+        return build_gallery_data(*load_gallery_arrays(), copy=False)
+    return load_gallery_data_orm()
+
+
+def load_gallery_data_orm():
+    """Đọc embedding qua ORM (mỗi hàng một np.array do pgvector-python parse)"""
+    from ..models import EmployeeFaceEmbedding
+
+    rows = EmployeeFaceEmbedding.objects.filter(
+        employee__is_active=True
+    ).values_list('employee_id', 'embedding')
+
+    employee_ids = []
+    vectors = []
+    for employee_id, embedding in rows:
+        employee_ids.append(employee_id)
+        vectors.append(embedding)
+    return build_gallery_data(employee_ids, vectors)
+
+
+def search_gallery_data(data, queries, k, shortlist, alive_rows=None, alive_centroids=None):
+    """Tìm k mẫu gần nhất cho từng truy vấn (đã chuẩn hóa) trong một GalleryData.
+
+    alive_rows / alive_centroids: mặt nạ bool bỏ qua các nhân viên đã bị đánh
+    dấu xóa (tombstone). Trả về list (employee_pks, similarities) theo thứ tự truy vấn.
+    """
+    if len(data.employee_ids) == 0:
+        return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+
+    if shortlist <= 0 or shortlist >= len(data.centroid_employee_ids):
+        scores = queries @ data.matrix.T
+        if alive_rows is not None:
+            scores[:, ~alive_rows] = -np.inf
+        results = []
+        for row in scores:
+            top = _top_k(row, k)
+            top = top[np.isfinite(row[top])]
+            results.append((data.employee_ids[top], row[top]))
+        return results
+
+    centroid_scores = queries @ data.centroids.T
+    if alive_centroids is not None:
+        centroid_scores[:, ~alive_centroids] = -np.inf
+    shortlisted = np.argpartition(-centroid_scores, shortlist - 1, axis=1)[:, :shortlist]
+    results = []
+    for query, employees, employee_scores in zip(queries, shortlisted, centroid_scores):
+        employees = employees[np.isfinite(employee_scores[employees])]
+        if len(employees) == 0:
+            results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+            continue
+        rows = np.concatenate([np.arange(data.offsets[e], data.offsets[e + 1]) for e in employees])
+        scores = data.matrix[rows] @ query
+        top = _top_k(scores, k)
+        results.append((data.employee_ids[rows[top]], scores[top]))
+    return results
+
+
+class GallerySnapshot:
+    """Gallery bất biến = base (nạp toàn bộ hoặc mmap) + các thay đổi tăng dần.
+
+    Nhân viên thay đổi sau khi nạp base bị đánh dấu xóa (tombstone) trong base
+    và mẫu hiện tại của họ nằm trong delta (nhỏ). apply() trả về snapshot mới
+    với chi phí theo số mẫu thay đổi (cộng một lần sao chép mặt nạ bool N byte);
+    compact() gộp delta vào base khi delta/tombstone đủ lớn.
+    """
+
+    def __init__(self, base, delta=None, alive_rows=None, alive_centroids=None, version=0):
+        self.base = base
+        self.version = version
+        self.delta = delta if delta is not None else build_gallery_data([], [])
+        self.alive_rows = alive_rows
+        self.alive_centroids = alive_centroids
+
+    def __len__(self):
+        return self.base_rows + len(self.delta.employee_ids)
+
+    @property
+    def base_rows(self):
+        if self.alive_rows is None:
+            return len(self.base.employee_ids)
+        return int(np.count_nonzero(self.alive_rows))
+
+    @property
+    def pending_rows(self):
+        """Số mẫu nằm ngoài base (delta) cộng số mẫu đã bị xóa khỏi base"""
+        return len(self.delta.employee_ids) + len(self.base.employee_ids) - self.base_rows
+
+    def apply(self, employee_pks, employee_ids, vectors):
+        """Snapshot mới: mẫu của employee_pks được thay bằng (employee_ids, vectors)"""
+        changed = np.asarray(sorted(employee_pks), dtype=np.int64)
+        base = self.base
+        alive_rows, alive_centroids = self.alive_rows, self.alive_centroids
+
+        positions = np.searchsorted(base.centroid_employee_ids, changed)
+        positions = positions[positions < len(base.centroid_employee_ids)]
+        positions = positions[np.isin(base.centroid_employee_ids[positions], changed)]
+        if len(positions):
+            alive_rows = np.ones(len(base.employee_ids), dtype=bool) if alive_rows is None else alive_rows.copy()
+            alive_centroids = (np.ones(len(base.centroid_employee_ids), dtype=bool)
+                               if alive_centroids is None else alive_centroids.copy())
+            alive_centroids[positions] = False
+            for position in positions:
+                alive_rows[base.offsets[position]:base.offsets[position + 1]] = False
+
+        keep = ~np.isin(self.delta.employee_ids, changed)
+        delta = build_gallery_data(
+            np.concatenate([self.delta.employee_ids[keep], np.asarray(employee_ids, dtype=np.int64)]),
+            np.concatenate([self.delta.matrix[keep], np.asarray(vectors, dtype=np.float32).reshape(-1, EMBEDDING_DIM)]),
+        )
+        return GallerySnapshot(base, delta, alive_rows, alive_centroids, self.version)
+
+    def needs_compaction(self, ratio):
+        # Ngưỡng tối thiểu để gallery nhỏ không bị gộp lại sau mỗi thay đổi
+        return self.pending_rows > max(ratio * len(self.base.employee_ids), 256)
+
+    def compact(self):
+        """Gộp base còn sống và delta thành một base mới (không đọc database)"""
+        base_ids, base_matrix = self.base.employee_ids, self.base.matrix
+        if self.alive_rows is not None:
+            base_ids, base_matrix = base_ids[self.alive_rows], base_matrix[self.alive_rows]
+        return GallerySnapshot(build_gallery_data(
+            np.concatenate([base_ids, self.delta.employee_ids]),
+            np.concatenate([base_matrix, self.delta.matrix]),
+            copy=False,
+        ), version=self.version)
+
+    def search_top_many(self, queries, k, shortlist):
+        results = search_gallery_data(self.base, queries, k, shortlist, self.alive_rows, self.alive_centroids)
+        if len(self.delta.employee_ids) == 0:
+            return results
+        merged = []
+        for (base_pks, base_scores), (delta_pks, delta_scores) in zip(
+                results, search_gallery_data(self.delta, queries, k, shortlist)):
+            employee_pks = np.concatenate([base_pks, delta_pks])
+            scores = np.concatenate([base_scores, delta_scores])
+            top = _top_k(scores, k) if len(scores) else np.empty(0, dtype=np.intp)
+            merged.append((employee_pks[top], scores[top]))
+        return merged
+
+
+class FaceGallery:
+    """Gallery của một worker, cập nhật theo kiểu read-copy-update.
+
+    Người đọc lấy tham chiếu tới GallerySnapshot hiện tại (bất biến) một lần
+    cho mỗi lượt tìm kiếm và không bao giờ chờ khóa. Snapshot mới được dựng
+    hoàn chỉnh ở nơi khác rồi thay bằng một phép gán tham chiếu duy nhất:
+    - nạp lại toàn bộ (hết TTL, file dùng chung được xuất bản lại) và gộp
+      delta chạy ở một luồng nền, trong lúc đó người đọc dùng snapshot cũ;
+    - thay đổi tăng dần (nhỏ) được áp dụng bởi luồng đầu tiên lấy được khóa,
+      các luồng khác không chờ mà dùng snapshot hiện tại.
+    Chỉ khi chưa có snapshot dùng được (khởi động, hoặc reload() sau khi dữ
+    liệu bị thay hàng loạt) người đọc mới phải chờ nạp xong.
+    """
+
+    def __init__(self, ttl=None, shared_path=None, check_interval=1.0, poll_interval=1.0, compact_ratio=0.1,
+                 change_retention=None, load_data=None):
+        # ttl: số giây tối đa giữ gallery trước khi nạp lại toàn bộ.
+        self.ttl = ttl
+        # shared_path: file gallery dùng chung; mỗi check_interval giây kiểm tra
+        # file đã được xuất bản lại chưa (một lần stat)
+        self.shared_path = shared_path
+        self.check_interval = check_interval
+        # poll_interval: chu kỳ (giây) đọc nhật ký FaceGalleryChange và áp dụng
+        # thay đổi tăng dần; 0 = không dùng nhật ký, mọi thay đổi nạp lại toàn bộ
+        self.poll_interval = poll_interval
+        self.compact_ratio = compact_ratio
+        # Nhật ký cũ hơn change_retention giây có thể đã bị xóa: chưa đọc lâu
+        # hơn nửa khoảng đó thì nạp lại toàn bộ thay vì đọc nhật ký
+        self.change_retention = change_retention
+        self.load_data = load_data or load_gallery_data
+        self._shared_signature = None
+        self._checked_at = 0.0
+        # Khóa của phía ghi (nạp, áp dụng thay đổi, gộp); người đọc không dùng
+        self._lock = threading.Lock()
+        self._background_lock = threading.Lock()
+        self._background_thread = None
+        self._snapshot = GallerySnapshot(build_gallery_data([], []))
+        self._loads = 0
+        self._loaded_at = None
+        self._dirty = True
+        self._changes_pending = False
+        self._watermark = 0
+        self._seen_changes = frozenset()
+        self._polled_at = 0.0
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    @property
+    def uses_change_log(self):
+        return self.poll_interval > 0
+
+    def invalidate(self):
+        """Dữ liệu đã thay đổi: đọc nhật ký ngay ở lần tìm kiếm tới (hoặc nạp lại toàn bộ nếu không dùng nhật ký)"""
+        if self.uses_change_log:
+            self._changes_pending = True
+        else:
+            self._dirty = True
+
+    def reload(self):
+        """Bỏ snapshot hiện tại: lần tìm kiếm tới chờ nạp lại toàn bộ"""
+        self._dirty = True
+
+    def refresh(self):
+        """Dựng lại snapshot ở luồng nền, người đọc tiếp tục dùng snapshot hiện tại"""
+        self._run_in_background(self._locked_load)
+
+    def wait_idle(self, timeout=None):
+        """Chờ luồng nền (nạp lại/gộp) đang chạy kết thúc"""
+        thread = self._background_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run_in_background(self, target):
+        # Tối đa một luồng nền; yêu cầu đến khi đang chạy bị bỏ qua vì luồng
+        # đó sẽ tạo snapshot mới nhất
+        with self._background_lock:
+            if self._background_thread is not None and self._background_thread.is_alive():
+                return
+            self._background_thread = threading.Thread(
+                target=self._background_task, args=(target,), name='face-gallery-builder', daemon=True)
+            self._background_thread.start()
+
+    def _background_task(self, target):
+        from django.db import connection
+
+        try:
+            target()
+        except Exception as e:
+            logger.warning(f"[FaceGallery] Không dựng được snapshot mới: {e}")
+        finally:
+            # Kết nối database của luồng nền không được Django tự đóng
+            connection.close()
+
+    def _needs_refresh(self, now):
+        if self.ttl is not None and now - self._loaded_at > self.ttl:
+            return True
+        if (self.uses_change_log and self.change_retention
+                and now - self._polled_at > self.change_retention / 2):
+            return True
+        if self.shared_path and now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            from .shared_gallery import file_signature
+            return file_signature(self.shared_path) != self._shared_signature
+        return False
+
+    def _needs_poll(self, now):
+        return self.uses_change_log and (self._changes_pending or now - self._polled_at >= self.poll_interval)
+
+    def _locked_load(self):
+        with self._lock:
+            self.load()
+
+    def load(self):
+        """Dựng snapshot mới: map file dùng chung hoặc đọc từ database, áp dụng nhật ký, rồi thay một lần.
+
+        Gọi khi đang giữ self._lock.
+        """
+        from .changes import current_watermark
+
+        if self.shared_path:
+            from .shared_gallery import file_signature, map_shared_gallery, publish_face_gallery
+            if file_signature(self.shared_path) is None:
+                # Worker đầu tiên khởi động khi chưa có file: tự xuất bản
+                publish_face_gallery(self.shared_path, self.load_data, current_watermark)
+            try:
+                shared = map_shared_gallery(self.shared_path)
+            except ValueError:
+                # File hỏng hoặc định dạng cũ: xuất bản lại
+                publish_face_gallery(self.shared_path, self.load_data, current_watermark)
+                shared = map_shared_gallery(self.shared_path)
+            snapshot = GallerySnapshot(shared.data, version=shared.version)
+            self._shared_signature = shared.signature
+            watermark = shared.watermark
+        else:
+            # Lấy watermark trước khi đọc: thay đổi commit trong lúc đọc sẽ được áp dụng lại
+            watermark = current_watermark() if self.uses_change_log else 0
+            self._loads += 1
+            snapshot = GallerySnapshot(self.load_data(), version=self._loads)
+
+        self._watermark, self._seen_changes = watermark, frozenset()
+        if self.uses_change_log:
+            snapshot = self._apply_changes(snapshot)
+        self._snapshot = snapshot
+        self._loaded_at = self._checked_at = time.monotonic()
+
+    def _apply_changes(self, snapshot):
+        from .changes import fetch_changes, load_employee_rows
+
+        self._changes_pending = False
+        self._polled_at = time.monotonic()
+        employee_pks, watermark, seen = fetch_changes(self._watermark, self._seen_changes)
+        if employee_pks:
+            employee_ids, vectors = load_employee_rows(employee_pks)
+            snapshot = snapshot.apply(employee_pks, employee_ids, vectors)
+        self._watermark, self._seen_changes = watermark, seen
+        return snapshot
+
+    def apply_changes(self):
+        """Đọc nhật ký và áp dụng thay đổi tăng dần (gọi khi đang giữ self._lock)"""
+        self._snapshot = self._apply_changes(self._snapshot)
+        if self._snapshot.needs_compaction(self.compact_ratio):
+            self._run_in_background(self._locked_compact)
+
+    def _locked_compact(self):
+        with self._lock:
+            if not self._snapshot.needs_compaction(self.compact_ratio):
+                return
+            if self.shared_path:
+                # Gallery dùng chung: gộp bằng cách xuất bản lại file, các worker khác map lại theo chu kỳ
+                from .changes import current_watermark
+                from .shared_gallery import publish_face_gallery
+                publish_face_gallery(self.shared_path, self.load_data, current_watermark)
+                self.load()
+            else:
+                self._snapshot = self._snapshot.compact()
+
+    def ensure_loaded(self):
+        if self._dirty or self._loaded_at is None:
+            # Chưa có snapshot dùng được: phải chờ nạp
+            with self._lock:
+                if self._dirty or self._loaded_at is None:
+                    # Xóa cờ trước khi nạp: reload() xảy ra trong lúc nạp sẽ
+                    # đặt lại cờ và lần gọi sau sẽ nạp tiếp.
+                    self._dirty = False
+                    try:
+                        self.load()
+                    except Exception:
+                        self._dirty = True
+                        raise
+            return
+
+        now = time.monotonic()
+        if self._needs_refresh(now):
+            self.refresh()
+        elif self._needs_poll(now) and self._lock.acquire(blocking=False):
+            # Luồng khác đang ghi thì dùng snapshot hiện tại, không chờ
+            try:
+                if self._needs_poll(time.monotonic()):
+                    self.apply_changes()
+            finally:
+                self._lock.release()
+
+    def search_top(self, query, k, shortlist=None):
+        """Trả về (employee_pks, similarities) của k embedding gần nhất, giảm dần theo similarity"""
+        return self.search_top_many([query], k, shortlist=shortlist)[0]
+
+    def search_top_many(self, queries, k, shortlist=None):
+        """Phiên bản theo lô của search_top: queries là ma trận (B x 512).
+
+        Không lọc sơ bộ: một phép nhân ma trận (B x N) cho cả lô. Có lọc sơ bộ
+        (shortlist > 0, mặc định FACE_SHORTLIST_SIZE): một phép nhân với ma trận
+        centroid (B x E), sau đó mỗi truy vấn chỉ tính lại các mẫu của top-M
+        nhân viên. Trả về list (employee_pks, similarities) theo thứ tự truy vấn.
+        """
+        self.ensure_loaded()
+        # Chỉ đọc self._snapshot một lần: cả lượt tìm kiếm dùng cùng một snapshot
+        snapshot = self._snapshot
+        if shortlist is None:
+            shortlist = settings.FACE_SHORTLIST_SIZE
+        queries = normalize_rows(np.asarray(queries, dtype=np.float32).reshape(-1, EMBEDDING_DIM))
+        return snapshot.search_top_many(queries, k, shortlist)
+
+    def search(self, query):
+        """Trả về (employee_pk, cosine similarity) của embedding gần nhất, hoặc (None, 0.0)"""
+        employee_pks, scores = self.search_top(query, 1)
+        if len(employee_pks) == 0:
+            return None, 0.0
+        return int(employee_pks[0]), float(scores[0])
+
+
+def get_face_gallery():
+    global _gallery_instance
+    if _gallery_instance is None:
+        with _gallery_instance_lock:
+            if _gallery_instance is None:
+                _gallery_instance = FaceGallery(
+                    ttl=settings.FACE_GALLERY_TTL or None,
+                    shared_path=settings.FACE_GALLERY_SHARED_PATH or None,
+                    check_interval=settings.FACE_GALLERY_SHARED_CHECK_INTERVAL,
+                    poll_interval=settings.FACE_GALLERY_CHANGE_POLL_INTERVAL,
+                    compact_ratio=settings.FACE_GALLERY_COMPACT_RATIO,
+                    change_retention=settings.FACE_GALLERY_CHANGE_RETENTION,
+                )
+    return _gallery_instance
+
+
+def publish_shared_gallery():
+    """Xuất bản lại file gallery dùng chung từ database, trả về version mới (None nếu không bật)"""
+    if not settings.FACE_GALLERY_SHARED_PATH:
+        return None
+    from .changes import current_watermark
+    from .shared_gallery import publish_face_gallery
+    return publish_face_gallery(settings.FACE_GALLERY_SHARED_PATH, load_gallery_data, current_watermark)
+
+
+def invalidate_face_gallery():
+    """Đánh dấu gallery cần nạp lại toàn bộ (dữ liệu bị thay hàng loạt, ví dụ benchmark/nhập dữ liệu)"""
+    if settings.FACE_MATCH_BACKEND == 'memory' and settings.FACE_GALLERY_SHARED_PATH:
+        # Các worker khác thấy file mới qua lần kiểm tra định kỳ
+        publish_shared_gallery()
+    if _gallery_instance is not None:
+        _gallery_instance.reload()
+
+
+def notify_face_gallery_changed():
+    """Báo gallery trong tiến trình này đọc nhật ký thay đổi ngay (gọi sau khi commit FaceGalleryChange)"""
+    if settings.FACE_GALLERY_CHANGE_POLL_INTERVAL <= 0:
+        # Không dùng nhật ký thay đổi: nạp lại toàn bộ như trước
+        invalidate_face_gallery()
+    elif _gallery_instance is not None:
+        _gallery_instance.invalidate()
+
+
+def preload_face_gallery():
+    """Nạp (hoặc map) gallery ngay khi khởi động, gọi từ config.wsgi / config.asgi"""
+    if settings.FACE_MATCH_BACKEND != 'memory':
+        return
+    try:
+        get_face_gallery().ensure_loaded()
+    except Exception as e:
+        # Chưa có database lúc khởi động: lượt quét đầu tiên sẽ nạp lại
+        logger.warning(f"[preload_face_gallery] Không nạp được gallery: {e}")
+    finally:
+        # Với gunicorn --preload hàm này chạy trong master: đóng connection để các
+        # worker fork ra không dùng chung một socket database
+        connections.close_all()
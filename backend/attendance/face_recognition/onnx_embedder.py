@@ -0,0 +1,194 @@
+"""
+Trích xuất embedding khuôn mặt phía server bằng onnxruntime (CPU).
+
+Dành cho các kiosk cấu hình yếu không chạy nổi model trong trình duyệt: kiosk
+chỉ gửi ảnh khuôn mặt (JPEG/PNG, đã căn chỉnh hoặc kèm 5 điểm landmark), server
+tính embedding 512 chiều với cùng chuẩn hóa như frontend (xem preprocess.py).
+
+Mỗi InferenceSession được cấu hình với FACE_ONNX_INTRA_OP_THREADS luồng; pool
+gồm FACE_ONNX_POOL_SIZE session (mặc định: số lõi / số luồng mỗi session) để
+các request song song không tranh nhau cùng một session và không vượt số lõi.
+Khi FACE_INFERENCE_BATCH_WINDOW_MS > 0, ảnh từ các request đồng thời được gom
+thành một lô (xem batching.py). onnxruntime chỉ được import khi bật
+FACE_SERVER_INFERENCE.
+"""
+import base64
+import binascii
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from .batching import MicroBatcher
+from .gallery import EMBEDDING_DIM, normalize_rows
+from .preprocess import INPUT_SIZE, FaceImageError, preprocess_batch
+from .quantization import resolve_model_path
+
+logger = logging.getLogger(__name__)
+
+_embedder_instance = None
+_embedder_instance_lock = threading.Lock()
+
+
+def decode_base64_image(value):
+    """Giải mã ảnh base64 (chấp nhận cả data URL 'data:image/jpeg;base64,...')"""
+    if not isinstance(value, str):
+        raise FaceImageError('Ảnh phải là chuỗi base64')
+    if value.startswith('data:'):
+        value = value.split(',', 1)[-1]
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise FaceImageError('Ảnh base64 không hợp lệ')
+
+
+class OnnxFaceEmbedder:
+    def __init__(self, model_path, pool_size=0, intra_op_threads=1, inter_op_threads=1,
+                 batch_window_ms=0, max_batch_size=16):
+        import onnxruntime as ort
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f'Không tìm thấy model embedding: {model_path}')
+        if pool_size <= 0:
+            pool_size = max(1, (os.cpu_count() or 1) // max(1, intra_op_threads))
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.model_path = model_path
+        self.pool_size = pool_size
+        self._sessions = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._sessions.put(ort.InferenceSession(
+                model_path, sess_options=options, providers=['CPUExecutionProvider']))
+
+        with self._session() as session:
+            model_input = session.get_inputs()[0]
+            model_output = session.get_outputs()[0]
+        if model_output.shape[-1] != EMBEDDING_DIM:
+            raise ValueError(
+                f'{model_path} không phải model embedding {EMBEDDING_DIM} chiều '
+                f'(output {model_output.name}: {model_output.shape})')
+        self.input_name = model_input.name
+        height, width = model_input.shape[2], model_input.shape[3]
+        self.input_size = height if isinstance(height, int) and height == width else INPUT_SIZE
+        # Model xuất với batch cố định = 1 phải chạy từng ảnh một
+        self.fixed_batch = isinstance(model_input.shape[0], int)
+
+        # Gom lô chỉ có ích khi model nhận batch động; mỗi session trong pool
+        # có một worker để các lô có thể chạy song song
+        self.batcher = None
+        if batch_window_ms > 0 and not self.fixed_batch:
+            self.batcher = MicroBatcher(
+                self._run_rows, max_batch_size=max_batch_size, max_wait_ms=batch_window_ms,
+                workers=pool_size, name='face_embedding')
+
+    @contextmanager
+    def _session(self):
+        session = self._sessions.get()
+        try:
+            yield session
+        finally:
+            self._sessions.put(session)
+
+    def _run(self, tensor):
+        with self._session() as session:
+            if self.fixed_batch:
+                outputs = [session.run(None, {self.input_name: tensor[i:i + 1]})[0] for i in range(len(tensor))]
+                return np.concatenate(outputs)
+            return session.run(None, {self.input_name: tensor})[0]
+
+    def _run_rows(self, rows):
+        # Các hàng đã tiền xử lý từ nhiều request: ghép thành một tensor
+        return self._run(np.stack(rows)).reshape(len(rows), -1)
+
+    def embed(self, images, landmarks=None):
+        """Tính embedding đã chuẩn hóa L2 (N x 512) cho list ảnh (bytes JPEG/PNG hoặc mảng RGB).
+
+        landmarks: list 5 điểm (hoặc None) cho từng ảnh; không có thì ảnh được
+        coi là khuôn mặt đã căn chỉnh.
+        """
+        if not images:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        # Tiền xử lý ngay trong luồng của request, ghi thẳng vào tensor đầu vào
+        tensor = preprocess_batch(images, landmarks, size=self.input_size)
+        if self.batcher is not None:
+            embeddings = self.batcher.infer(list(tensor))
+        else:
+            embeddings = self._run(tensor).reshape(len(images), -1)
+        return normalize_rows(embeddings.astype(np.float32))
+
+    def stats(self):
+        return {
+            'model': os.path.basename(self.model_path),
+            'pool_size': self.pool_size,
+            'idle_sessions': self._sessions.qsize(),
+            'batching': self.batcher.stats() if self.batcher is not None else None,
+        }
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def warmup(self):
+        """Chạy thử mọi session trong pool để lần quét đầu tiên không phải chịu chi phí khởi tạo"""
+        dummy = np.zeros((1, 3, self.input_size, self.input_size), dtype=np.float32)
+        sessions = [self._sessions.get() for _ in range(self.pool_size)]
+        try:
+            for session in sessions:
+                session.run(None, {self.input_name: dummy})
+        finally:
+            for session in sessions:
+                self._sessions.put(session)
+
+
+def get_face_embedder():
+    """Embedder dùng chung trong tiến trình, None nếu không bật FACE_SERVER_INFERENCE"""
+    global _embedder_instance
+    if not settings.FACE_SERVER_INFERENCE:
+        return None
+    if _embedder_instance is None:
+        with _embedder_instance_lock:
+            if _embedder_instance is None:
+                _embedder_instance = OnnxFaceEmbedder(
+                    resolve_model_path(),
+                    pool_size=settings.FACE_ONNX_POOL_SIZE,
+                    intra_op_threads=settings.FACE_ONNX_INTRA_OP_THREADS,
+                    inter_op_threads=settings.FACE_ONNX_INTER_OP_THREADS,
+                    batch_window_ms=settings.FACE_INFERENCE_BATCH_WINDOW_MS,
+                    max_batch_size=settings.FACE_INFERENCE_MAX_BATCH,
+                )
+                logger.info(f'[onnx_embedder] Loaded {_embedder_instance.model_path} '
+                            f'({_embedder_instance.pool_size} sessions)')
+    return _embedder_instance
+
+
+def _reset_after_fork():
+    """Tiến trình con (gunicorn --preload fork từ master) không có thread worker của
+    MicroBatcher và không dùng chung được session onnxruntime: bỏ embedder kế thừa,
+    lần dùng đầu tiên trong tiến trình con tạo embedder mới"""
+    global _embedder_instance, _embedder_instance_lock
+    _embedder_instance = None
+    _embedder_instance_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def warmup_face_embedder():
+    embedder = get_face_embedder()
+    if embedder is not None:
+        embedder.warmup()
+
+
+def face_embedder_stats():
+    """Metrics của embedder đã khởi tạo trong tiến trình (không tự nạp model), None nếu chưa có"""
+    embedder = _embedder_instance
+    return embedder.stats() if embedder is not None else None
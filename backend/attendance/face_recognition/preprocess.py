@@ -0,0 +1,200 @@
+"""
+Tiền xử lý ảnh khuôn mặt cho suy luận phía server.
+
+Luồng xử lý cho mỗi ảnh:
+1. Giải mã JPEG ở độ phân giải giảm (Pillow draft mode: giải mã DCT ở 1/2,
+   1/4, 1/8) vừa đủ để khuôn mặt không phải phóng to, thay vì giải mã toàn bộ
+   khung hình 1080p rồi mới thu nhỏ.
+2. Căn chỉnh 5 điểm (mắt trái, mắt phải, mũi, hai khóe miệng) về template
+   ArcFace 112x112 bằng phép biến đổi tương tự (Umeyama). Không có landmark
+   thì coi ảnh là khuôn mặt đã căn chỉnh và chỉ resize.
+3. Warp affine + nội suy song tuyến bằng NumPy, chuẩn hóa (pixel - 127.5) / 128
+   và ghi thẳng vào một hàng của buffer NCHW float32 đã cấp phát sẵn.
+"""
+import io
+import math
+
+import numpy as np
+
+INPUT_SIZE = 112
+
+# Vị trí chuẩn của 5 điểm landmark trong ảnh 112x112 (template ArcFace/InsightFace)
+ARCFACE_TEMPLATE = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+], dtype=np.float64)
+
+_grid_cache = {}
+
+
+class FaceImageError(ValueError):
+    """Ảnh khuôn mặt gửi lên không đọc được"""
+
+
+def parse_landmarks(value):
+    """Chuyển [[x, y] x 5] (tọa độ pixel trên ảnh gốc) thành mảng (5, 2); None nếu không có"""
+    if value is None:
+        return None
+    try:
+        landmarks = np.asarray(value, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise FaceImageError('Landmark không hợp lệ')
+    if landmarks.shape != (5, 2) or not np.all(np.isfinite(landmarks)):
+        raise FaceImageError('Cần đúng 5 điểm landmark [[x, y], ...]')
+    return landmarks
+
+
+def estimate_similarity_transform(src, dst):
+    """Phép biến đổi tương tự (xoay + tỉ lệ đều + tịnh tiến) đưa src về dst, ma trận 2x3 (Umeyama 1991)"""
+    src_mean = src.mean(axis=0)
+    dst_mean = dst.mean(axis=0)
+    src_centered = src - src_mean
+    dst_centered = dst - dst_mean
+
+    covariance = dst_centered.T @ src_centered / len(src)
+    u, s, vt = np.linalg.svd(covariance)
+    d = np.ones(2)
+    if np.linalg.det(u) * np.linalg.det(vt) < 0:
+        d[1] = -1
+    rotation = u @ np.diag(d) @ vt
+    variance = (src_centered ** 2).sum() / len(src)
+    scale = (s * d).sum() / variance if variance > 0 else 1.0
+
+    matrix = np.empty((2, 3))
+    matrix[:, :2] = scale * rotation
+    matrix[:, 2] = dst_mean - scale * rotation @ src_mean
+    return matrix
+
+
+def _resize_matrix(width, height, size):
+    # Căn tâm pixel: dst = (src + 0.5) * size / width - 0.5
+    sx, sy = size / width, size / height
+    return np.array([[sx, 0.0, 0.5 * sx - 0.5], [0.0, sy, 0.5 * sy - 0.5]])
+
+
+def _required_scale(width, height, landmarks, size):
+    """Tỉ lệ thu nhỏ lớn nhất mà khuôn mặt vẫn không phải phóng to khi căn chỉnh"""
+    if landmarks is None:
+        return size / min(width, height)
+    eye_distance = np.linalg.norm(landmarks[1] - landmarks[0])
+    template_distance = np.linalg.norm(ARCFACE_TEMPLATE[1] - ARCFACE_TEMPLATE[0]) * size / INPUT_SIZE
+    if eye_distance <= 0:
+        return 1.0
+    return template_distance / eye_distance
+
+
+def decode_image(data, landmarks=None, size=INPUT_SIZE):
+    """Giải mã ảnh JPEG/PNG thành mảng RGB uint8 ở độ phân giải nhỏ nhất vẫn đủ cho khuôn mặt.
+
+    Trả về (image, scale) với scale = kích thước đã giải mã / kích thước gốc,
+    dùng để quy đổi tọa độ landmark.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        min_scale = min(1.0, max(_required_scale(width, height, landmarks, size), 1e-3))
+        if image.format == 'JPEG' and min_scale < 1.0:
+            # Giải mã DCT ở tỉ lệ 1/2, 1/4, 1/8 nhưng không nhỏ hơn kích thước yêu cầu
+            image.draft('RGB', (math.ceil(width * min_scale), math.ceil(height * min_scale)))
+        if image.mode not in ('L', 'RGB'):
+            # reduce() không hỗ trợ ảnh palette ('P'), '1', 'I;16'...
+            image = image.convert('RGB')
+        factor = int(image.size[0] / (width * min_scale))
+        if factor >= 2:
+            # PNG (hoặc JPEG đã giải mã ở 1/8 mà vẫn còn quá lớn): thu nhỏ theo khối
+            image = image.reduce(factor)
+        image = image.convert('RGB')
+    except (UnidentifiedImageError, OSError, ValueError):
+        raise FaceImageError('Không đọc được ảnh khuôn mặt (chỉ hỗ trợ JPEG/PNG)')
+    return np.asarray(image, dtype=np.uint8), image.size[0] / width
+
+
+def _output_grid(size):
+    grid = _grid_cache.get(size)
+    if grid is None:
+        ys, xs = np.mgrid[0:size, 0:size].astype(np.float32)
+        grid = np.stack([xs.ravel(), ys.ravel()])
+        _grid_cache[size] = grid
+    return grid
+
+
+def warp_into(image, matrix, out):
+    """Warp affine ảnh RGB uint8 (H x W x 3) theo ma trận 2x3 (nguồn -> đích) vào out (3 x S x S).
+
+    Nội suy song tuyến, pixel ngoài ảnh gốc bằng 0 (giống cv2.warpAffine),
+    kết quả đã chuẩn hóa (pixel - 127.5) / 128.
+    """
+    height, width = image.shape[:2]
+    size = out.shape[-1]
+    forward = np.vstack([matrix, [0.0, 0.0, 1.0]])
+    inverse = np.linalg.inv(forward)[:2].astype(np.float32)
+
+    grid = _output_grid(size)
+    src = inverse[:, :2] @ grid
+    src += inverse[:, 2:]
+    src_x, src_y = src
+
+    inside = (src_x > -1) & (src_x < width) & (src_y > -1) & (src_y < height)
+    x0 = np.floor(src_x)
+    y0 = np.floor(src_y)
+    fx = (src_x - x0)[:, None]
+    fy = (src_y - y0)[:, None]
+    x0 = x0.astype(np.intp)
+    y0 = y0.astype(np.intp)
+    x1 = np.clip(x0 + 1, 0, width - 1)
+    y1 = np.clip(y0 + 1, 0, height - 1)
+    np.clip(x0, 0, width - 1, out=x0)
+    np.clip(y0, 0, height - 1, out=y0)
+
+    flat = image.reshape(-1, 3)
+    row0 = y0 * width
+    row1 = y1 * width
+    top = flat[row0 + x0].astype(np.float32)
+    top += (flat[row0 + x1] - top) * fx
+    bottom = flat[row1 + x0].astype(np.float32)
+    bottom += (flat[row1 + x1] - bottom) * fx
+    top += (bottom - top) * fy
+    top[~inside] = 0.0
+
+    top -= 127.5
+    top *= 1.0 / 128.0
+    # out là một hàng liên tục của buffer NCHW nên reshape chỉ tạo view
+    out.reshape(3, size * size)[...] = top.T
+    return out
+
+
+def preprocess_face(source, out, landmarks=None):
+    """Giải mã, căn chỉnh và chuẩn hóa một khuôn mặt, ghi vào out (3 x S x S float32).
+
+    source: bytes JPEG/PNG hoặc mảng RGB uint8 (H x W x 3); landmarks: 5 điểm
+    trên ảnh gốc hoặc None nếu ảnh đã là khuôn mặt căn chỉnh.
+    """
+    size = out.shape[-1]
+    if isinstance(source, np.ndarray):
+        if source.ndim != 3 or source.shape[2] != 3:
+            raise FaceImageError('Ảnh phải có dạng H x W x 3 (RGB)')
+        image, scale = np.ascontiguousarray(source, dtype=np.uint8), 1.0
+    else:
+        image, scale = decode_image(source, landmarks, size)
+
+    if landmarks is None:
+        matrix = _resize_matrix(image.shape[1], image.shape[0], size)
+    else:
+        matrix = estimate_similarity_transform(landmarks * scale, ARCFACE_TEMPLATE * (size / INPUT_SIZE))
+    return warp_into(image, matrix, out)
+
+
+def preprocess_batch(sources, landmarks=None, size=INPUT_SIZE, out=None):
+    """Tiền xử lý list ảnh vào buffer NCHW float32 (N x 3 x size x size), cấp phát nếu out là None"""
+    if out is None:
+        out = np.empty((len(sources), 3, size, size), dtype=np.float32)
+    if landmarks is None:
+        landmarks = [None] * len(sources)
+    for index, (source, points) in enumerate(zip(sources, landmarks)):
+        preprocess_face(source, out[index], points)
+    return out
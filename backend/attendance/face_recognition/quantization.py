@@ -0,0 +1,99 @@
+"""
+Lượng tử hóa tĩnh INT8 model embedding khuôn mặt cho suy luận CPU.
+
+Model INT8 được hiệu chỉnh (calibration) trên một thư mục ảnh khuôn mặt đã căn
+chỉnh, dùng đúng tiền xử lý của server (preprocess.py). Chọn model khi chạy
+bằng FACE_MODEL_VARIANT ('fp32' hoặc 'int8'). Trước khi bật INT8 cần chạy
+benchmark_face_quantization để kiểm tra embedding INT8 còn đủ gần embedding
+FP32, vì gallery hiện có được đăng ký bằng model FP32.
+"""
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .preprocess import INPUT_SIZE, preprocess_batch
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def list_face_crops(directory, limit=None):
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in Path(directory).glob(pattern))
+    return paths[:limit] if limit else paths
+
+
+def load_face_crops(paths, size=INPUT_SIZE):
+    """Đọc các ảnh khuôn mặt đã căn chỉnh thành tensor NCHW float32"""
+    return preprocess_batch([Path(p).read_bytes() for p in paths], size=size)
+
+
+def int8_model_path(model_path):
+    path = Path(model_path)
+    return path.with_name(f'{path.stem}_int8{path.suffix}')
+
+
+def resolve_model_path(variant=None):
+    """Đường dẫn model theo FACE_MODEL_VARIANT ('fp32' | 'int8')"""
+    variant = variant or settings.FACE_MODEL_VARIANT
+    if variant == 'fp32':
+        return str(settings.FACE_EMBEDDING_MODEL_PATH)
+    if variant == 'int8':
+        return str(settings.FACE_EMBEDDING_INT8_MODEL_PATH or int8_model_path(settings.FACE_EMBEDDING_MODEL_PATH))
+    raise ValueError(f"FACE_MODEL_VARIANT không hợp lệ: {variant} (chỉ hỗ trợ 'fp32', 'int8')")
+
+
+def _model_input(model_path):
+    """(tên input, kích thước ảnh, batch cố định hay không) của model"""
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
+    model_input = session.get_inputs()[0]
+    height = model_input.shape[2]
+    return model_input.name, (height if isinstance(height, int) else INPUT_SIZE), isinstance(model_input.shape[0], int)
+
+
+def quantize_face_model(model_path, output_path, crop_paths, per_channel=True, batch_size=8):
+    """Lượng tử hóa tĩnh (QDQ, activation uint8, weight int8) với dữ liệu hiệu chỉnh là các ảnh khuôn mặt"""
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name, size, fixed_batch = _model_input(model_path)
+    if fixed_batch:
+        # Model batch cố định chỉ nhận từng ảnh một
+        batch_size = 1
+
+    class FaceCropReader(CalibrationDataReader):
+        def __init__(self):
+            self._batches = iter(range(0, len(crop_paths), batch_size))
+
+        def get_next(self):
+            start = next(self._batches, None)
+            if start is None:
+                return None
+            return {input_name: load_face_crops(crop_paths[start:start + batch_size], size)}
+
+    # Tiền xử lý khuyến nghị của onnxruntime (shape inference + tối ưu đồ thị) trước khi lượng tử hóa
+    output_path = Path(output_path)
+    prepared_path = output_path.with_name(f'{output_path.stem}_prep{output_path.suffix}')
+    quant_pre_process(str(model_path), str(prepared_path), skip_symbolic_shape=True)
+    try:
+        quantize_static(
+            str(prepared_path), str(output_path), FaceCropReader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=per_channel,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    finally:
+        prepared_path.unlink(missing_ok=True)
+    return output_path
+
+
+def cosine_agreement(reference, candidate):
+    """Cosine giữa embedding FP32 và INT8 của cùng ảnh (từng hàng)"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(reference * candidate, axis=1)
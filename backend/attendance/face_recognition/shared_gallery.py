@@ -0,0 +1,151 @@
+"""
+Gallery khuôn mặt dùng chung giữa các worker qua file memory-mapped.
+
+Thay vì mỗi worker gunicorn tự nạp toàn bộ embedding từ Postgres và giữ một
+bản sao riêng, gallery được ghi một lần ra file nhị phân (FACE_GALLERY_SHARED_PATH)
+và mọi worker mmap read-only cùng các trang bộ nhớ đó (zero-copy, page cache
+của hệ điều hành dùng chung).
+
+Định dạng file (little-endian, các khối căn 64 byte):
+    header 64 byte: magic 'FGAL', format, version, số mẫu N, số nhân viên E, số chiều D,
+                    watermark nhật ký thay đổi (xem changes.py)
+    employee_ids int64[N] | centroid_employee_ids int64[E] | offsets int64[E + 1]
+    matrix float32[N x D] | centroids float32[E x D]
+
+Xuất bản phiên bản mới = ghi file tạm trong cùng thư mục rồi os.replace()
+(nguyên tử). Worker đang map file cũ vẫn đọc được inode cũ cho đến khi tự
+chuyển sang file mới (so sánh inode/mtime của đường dẫn).
+"""
+import mmap
+import os
+import struct
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+from .gallery import EMBEDDING_DIM, GalleryData
+
+MAGIC = b'FGAL'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sIQQQIQ')
+HEADER_SIZE = 64
+ALIGNMENT = 64
+
+# version: số phiên bản tăng dần; signature: (inode, mtime, size) của file đã map;
+# watermark: các thay đổi có txid >= watermark có thể chưa nằm trong file
+SharedGallerySnapshot = namedtuple('SharedGallerySnapshot', ['version', 'data', 'signature', 'watermark'])
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(rows, employees, dim):
+    """Offset của từng khối trong file"""
+    sections = [
+        ('employee_ids', np.int64, (rows,)),
+        ('centroid_employee_ids', np.int64, (employees,)),
+        ('offsets', np.int64, (employees + 1,)),
+        ('matrix', np.float32, (rows, dim)),
+        ('centroids', np.float32, (employees, dim)),
+    ]
+    layout = {}
+    offset = HEADER_SIZE
+    for name, dtype, shape in sections:
+        offset = _align(offset)
+        layout[name] = (offset, dtype, shape)
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, offset
+
+
+def file_signature(path):
+    """(inode, mtime, size) của file, None nếu chưa có — đổi khi file được xuất bản lại"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def read_version(path):
+    try:
+        with open(path, 'rb') as f:
+            magic, fmt, version, *_ = HEADER.unpack(f.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return 0
+    return version if magic == MAGIC and fmt == FORMAT_VERSION else 0
+
+
+def write_shared_gallery(path, data, version, watermark=0):
+    """Ghi GalleryData ra file tạm rồi thay thế nguyên tử file đích"""
+    rows, dim = data.matrix.shape if len(data.matrix) else (0, EMBEDDING_DIM)
+    employees = len(data.centroid_employee_ids)
+    layout, total_size = _layout(rows, employees, dim)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.gallery-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, version, rows, employees, dim, watermark).ljust(HEADER_SIZE, b'\0'))
+            for name, (offset, dtype, shape) in layout.items():
+                f.seek(offset)
+                f.write(np.ascontiguousarray(getattr(data, name), dtype=dtype).reshape(shape).tobytes())
+            f.truncate(total_size)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def map_shared_gallery(path):
+    """Map file gallery read-only, trả về SharedGallerySnapshot với các mảng là view trên mmap"""
+    with open(path, 'rb') as f:
+        signature = file_signature(path)
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, fmt, version, rows, employees, dim, watermark = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or fmt != FORMAT_VERSION:
+        raise ValueError(f'{path} không phải file gallery hợp lệ')
+
+    layout, total_size = _layout(rows, employees, dim)
+    if len(buffer) < total_size:
+        raise ValueError(f'{path} bị cắt cụt ({len(buffer)} < {total_size} byte)')
+    arrays = {
+        name: np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        for name, (offset, dtype, shape) in layout.items()
+    }
+    # Các view giữ tham chiếu tới mmap; mmap được giải phóng khi snapshot cũ không còn được dùng
+    return SharedGallerySnapshot(version, GalleryData(**arrays), signature, watermark)
+
+
+@contextmanager
+def publish_lock(path):
+    """Khóa độc quyền giữa các tiến trình xuất bản (đọc DB + ghi file) để phiên bản cũ không đè phiên bản mới"""
+    import fcntl
+
+    with open(f'{path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def publish_face_gallery(path, load_data, get_watermark=None):
+    """Xuất bản gallery mới: load_data() đọc dữ liệu từ database trong lúc giữ khóa. Trả về version mới.
+
+    get_watermark() (changes.current_watermark) được gọi trước khi đọc để
+    worker biết cần áp dụng lại nhật ký thay đổi từ đâu.
+    """
+    with publish_lock(path):
+        watermark = get_watermark() if get_watermark else 0
+        data = load_data()
+        version = read_version(path) + 1
+        write_shared_gallery(path, data, version, watermark)
+    return version
@@ -0,0 +1,56 @@
+"""
+Định dạng truyền embedding từ kiosk lên server.
+
+Ngoài mảng JSON 512 số thực (6-10 KB text, json.loads thành 512 float
+Python), kiosk có thể gửi embedding là chuỗi base64 của các byte little-endian:
+float32 (2 KB, ~2.7 KB base64) hoặc float16 (1 KB, ~1.4 KB base64). Kiểu dữ
+liệu khai báo trong trường 'embedding_dtype' của request (mặc định float32).
+Server giải mã bằng numpy.frombuffer và kiểm tra số chiều, giá trị hữu hạn
+trước khi truy vấn DB. float16 đủ chính xác cho embedding đã chuẩn hóa L2
+(sai lệch cosine cỡ 1e-3).
+"""
+import base64
+import binascii
+
+import numpy as np
+
+from .gallery import EMBEDDING_DIM
+
+WIRE_DTYPES = {
+    'float32': np.dtype('<f4'),
+    'float16': np.dtype('<f2'),
+}
+
+
+class EmbeddingFormatError(ValueError):
+    """Embedding gửi lên không đúng định dạng"""
+
+
+def decode_embedding(value, dtype=None):
+    """Embedding (mảng JSON hoặc chuỗi base64 kiểu `dtype`) thành mảng float32 (512,)"""
+    if isinstance(value, str):
+        wire_dtype = WIRE_DTYPES.get(dtype or 'float32')
+        if wire_dtype is None:
+            raise EmbeddingFormatError(f"embedding_dtype phải là một trong: {', '.join(WIRE_DTYPES)}")
+        try:
+            raw = base64.b64decode(value, validate=True)
+        except (binascii.Error, ValueError):
+            raise EmbeddingFormatError('Embedding base64 không hợp lệ')
+        if len(raw) != EMBEDDING_DIM * wire_dtype.itemsize:
+            raise EmbeddingFormatError(f'Embedding phải có {EMBEDDING_DIM} chiều')
+        vector = np.frombuffer(raw, dtype=wire_dtype).astype(np.float32)
+    else:
+        try:
+            vector = np.asarray(value, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise EmbeddingFormatError('Embedding phải là mảng số')
+        if vector.shape != (EMBEDDING_DIM,):
+            raise EmbeddingFormatError(f'Embedding phải có {EMBEDDING_DIM} chiều')
+    if not np.isfinite(vector).all():
+        raise EmbeddingFormatError('Embedding chứa giá trị không hữu hạn')
+    return vector
+
+
+def encode_embedding(vector, dtype='float32'):
+    """Mã hóa embedding thành chuỗi base64 (phía client, dùng trong test và benchmark)"""
+    return base64.b64encode(np.asarray(vector, dtype=WIRE_DTYPES[dtype]).tobytes()).decode('ascii')
@@ -0,0 +1,70 @@
+import csv
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.face_recognition.bulk_loader import load_gallery_arrays
+from attendance.face_recognition.duplicates import find_duplicate_pairs
+from attendance.face_recognition.gallery import normalize_rows
+from attendance.models import Employee
+
+
+class Command(BaseCommand):
+    help = ('Tìm các cặp nhân viên có khuôn mặt trùng nhau trên toàn bộ gallery '
+            '(cosine mọi cặp mẫu, nhân ma trận theo khối trong process pool)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.65,
+                            help='Ngưỡng cosine coi là cùng một người (mặc định bằng ngưỡng chấm công)')
+        parser.add_argument('--block-size', type=int, default=2048,
+                            help='Số mẫu mỗi khối; bộ nhớ thêm mỗi tiến trình ~ block_size^2 x 4 byte')
+        parser.add_argument('--workers', type=int, default=0, help='Số tiến trình (0 = số lõi CPU)')
+        parser.add_argument('--limit', type=int, default=50, help='Số cặp hiển thị (0 = tất cả)')
+        parser.add_argument('--csv', default=None, help='Ghi toàn bộ kết quả ra file CSV')
+
+    def handle(self, *args, **options):
+        if not 0 < options['threshold'] <= 1:
+            raise CommandError('--threshold phải nằm trong (0, 1]')
+        if options['block_size'] <= 0:
+            raise CommandError('--block-size phải lớn hơn 0')
+
+        started = time.perf_counter()
+        employee_ids, matrix = load_gallery_arrays()
+        normalize_rows(matrix, copy=False)
+        loaded = time.perf_counter()
+        employees = len(np.unique(employee_ids))
+        self.stdout.write(f'{len(employee_ids)} mẫu / {employees} nhân viên, nạp trong {loaded - started:.1f}s')
+
+        pairs = find_duplicate_pairs(matrix, employee_ids, options['threshold'],
+                                     block_size=options['block_size'], workers=options['workers'] or None)
+        elapsed = time.perf_counter() - loaded
+        comparisons = len(employee_ids) * (len(employee_ids) - 1) / 2
+        self.stdout.write(
+            f'So sánh {comparisons:.0f} cặp mẫu trong {elapsed:.1f}s '
+            f'({comparisons / max(elapsed, 1e-9) / 1e6:.0f} triệu cặp/s): '
+            f'{len(pairs)} cặp nhân viên có cosine >= {options["threshold"]}')
+        if not pairs:
+            return
+
+        shown = pairs[:options['limit']] if options['limit'] else pairs
+        names = self.employee_labels({pk for a, b, _, _ in shown for pk in (a, b)})
+        self.stdout.write(f"{'Nhân viên A':<32}{'Nhân viên B':<32}{'cosine':>8}{'số cặp':>8}")
+        for a, b, score, count in shown:
+            self.stdout.write(f'{names.get(a, a):<32}{names.get(b, b):<32}{score:>8.3f}{count:>8}')
+
+        if options['csv']:
+            names = self.employee_labels({pk for a, b, _, _ in pairs for pk in (a, b)})
+            with open(options['csv'], 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['employee_a', 'employee_b', 'max_cosine', 'sample_pairs'])
+                for a, b, score, count in pairs:
+                    writer.writerow([names.get(a, a), names.get(b, b), f'{score:.4f}', count])
+            self.stdout.write(f'Đã ghi {len(pairs)} cặp vào {options["csv"]}')
+
+    def employee_labels(self, pks):
+        return {
+            pk: f'{employee_id} {last_name} {first_name}'.strip()
+            for pk, employee_id, last_name, first_name in Employee.objects.filter(pk__in=pks).values_list(
+                'pk', 'employee_id', 'last_name', 'first_name')
+        }
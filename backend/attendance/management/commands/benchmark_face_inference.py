@@ -0,0 +1,89 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.face_recognition.onnx_embedder import OnnxFaceEmbedder
+
+
+def _parse_float_list(value):
+    return [float(v) for v in value.split(',') if v.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Đo thông lượng và độ trễ suy luận embedding phía server với các cửa sổ gom lô khác nhau'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help='Đường dẫn model ONNX (mặc định FACE_EMBEDDING_MODEL_PATH)')
+        parser.add_argument('--windows', default='0,1,2,5,10',
+                            help='Danh sách FACE_INFERENCE_BATCH_WINDOW_MS cần đo (0 = không gom lô)')
+        parser.add_argument('--concurrency', type=int, default=16, help='Số request đồng thời')
+        parser.add_argument('--requests', type=int, default=400, help='Tổng số request mỗi cấu hình')
+        parser.add_argument('--max-batch', type=int, default=None)
+        parser.add_argument('--pool-size', type=int, default=None)
+        parser.add_argument('--intra-op-threads', type=int, default=None)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            raise CommandError('Cần cài onnxruntime để chạy benchmark')
+
+        model_path = options['model'] or str(settings.FACE_EMBEDDING_MODEL_PATH)
+        max_batch = options['max_batch'] or settings.FACE_INFERENCE_MAX_BATCH
+        pool_size = options['pool_size'] if options['pool_size'] is not None else settings.FACE_ONNX_POOL_SIZE
+        intra_op_threads = options['intra_op_threads'] or settings.FACE_ONNX_INTRA_OP_THREADS
+        rng = np.random.default_rng(options['seed'])
+
+        self.stdout.write(
+            f"Model: {model_path} | {options['concurrency']} request đồng thời, "
+            f"{options['requests']} request mỗi cấu hình, lô tối đa {max_batch}")
+        self.stdout.write(
+            f"{'window ms':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'batch':>8}{'wait ms':>10}")
+
+        for window in _parse_float_list(options['windows']):
+            embedder = OnnxFaceEmbedder(
+                model_path, pool_size=pool_size, intra_op_threads=intra_op_threads,
+                batch_window_ms=window, max_batch_size=max_batch)
+            try:
+                embedder.warmup()
+                size = embedder.input_size
+                images = rng.integers(0, 256, size=(32, size, size, 3), dtype=np.uint8)
+                elapsed, latencies = self.run_load(embedder, images, options['concurrency'], options['requests'])
+                stats = embedder.stats()['batching']
+            finally:
+                embedder.close()
+
+            batch_mean = stats['batch_size']['mean'] if stats else 1.0
+            wait_mean = stats['wait_ms']['mean'] if stats else 0.0
+            self.stdout.write(
+                f"{window:<12g}{len(latencies) / elapsed:>10.1f}{np.percentile(latencies, 50):>10.2f}"
+                f"{np.percentile(latencies, 95):>10.2f}{batch_mean:>8.1f}{wait_mean:>10.2f}")
+
+    def run_load(self, embedder, images, concurrency, total_requests):
+        latencies = []
+        lock = threading.Lock()
+        counter = iter(range(total_requests))
+
+        def client():
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                started = time.perf_counter()
+                embedder.embed([images[index % len(images)]])
+                latency = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(latency)
+
+        threads = [threading.Thread(target=client) for _ in range(max(1, concurrency))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, latencies
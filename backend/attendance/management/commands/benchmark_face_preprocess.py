@@ -0,0 +1,109 @@
+import io
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from attendance.face_recognition.preprocess import (
+    ARCFACE_TEMPLATE, INPUT_SIZE, decode_image, estimate_similarity_transform, preprocess_batch, warp_into,
+)
+
+
+def synthetic_capture(rng, width=1920, height=1080, face_size=320, quality=90):
+    """Khung hình kiosk giả lập (JPEG): nền mịn + nhiễu cảm biến, kèm landmark của một khuôn mặt ở giữa"""
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 120 + 60 * np.sin(xs / 97.0) * np.cos(ys / 61.0)
+    frame = np.stack([base, base * 0.9 + 20, base * 0.8 + 30], axis=-1)
+    frame += rng.normal(0, 6, size=frame.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(frame, 0, 255).astype(np.uint8)).save(buffer, format='JPEG', quality=quality)
+
+    scale = face_size / INPUT_SIZE
+    offset = np.array([width / 2, height / 2]) - scale * INPUT_SIZE / 2
+    landmarks = ARCFACE_TEMPLATE * scale + offset
+    return buffer.getvalue(), landmarks
+
+
+class Command(BaseCommand):
+    help = 'Đo chi phí tiền xử lý ảnh khuôn mặt (giải mã, căn chỉnh 5 điểm, chuẩn hóa) trên khung hình 1080p'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', default=None,
+                            help='Thư mục ảnh JPEG thật (landmark giả định: khuôn mặt --face-size px ở giữa khung)')
+        parser.add_argument('--count', type=int, default=20, help='Số khung hình giả lập khi không có --images')
+        parser.add_argument('--face-size', type=int, default=320, help='Kích thước khuôn mặt (px) trên khung hình')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--model', default=None, help='Model ONNX để so sánh với thời gian suy luận (tùy chọn)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        captures = self.load_captures(options)
+        if not captures:
+            raise CommandError('Không có ảnh nào để đo')
+        width, height = Image.open(io.BytesIO(captures[0][0])).size
+        self.stdout.write(f'{len(captures)} ảnh {width}x{height}, khuôn mặt ~{options["face_size"]} px, '
+                          f'lặp {options["repeat"]} lần')
+
+        def full_decode(data, landmarks):
+            return np.asarray(Image.open(io.BytesIO(data)).convert('RGB'))
+
+        def draft_decode(data, landmarks):
+            return decode_image(data, landmarks)
+
+        out = np.empty((3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+        decoded = [decode_image(data, landmarks) for data, landmarks in captures]
+
+        def align(index):
+            image, scale = decoded[index]
+            matrix = estimate_similarity_transform(captures[index][1] * scale, ARCFACE_TEMPLATE)
+            warp_into(image, matrix, out)
+
+        batch = np.empty((len(captures), 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+
+        def pipeline():
+            preprocess_batch([c[0] for c in captures], [c[1] for c in captures], out=batch)
+
+        rows = [
+            ('Giải mã đầy đủ', self.measure(lambda: [full_decode(*c) for c in captures], options['repeat'])),
+            ('Giải mã draft', self.measure(lambda: [draft_decode(*c) for c in captures], options['repeat'])),
+            ('Căn chỉnh + chuẩn hóa', self.measure(lambda: [align(i) for i in range(len(captures))],
+                                                   options['repeat'])),
+            ('Toàn bộ tiền xử lý', self.measure(pipeline, options['repeat'])),
+        ]
+        if options['model']:
+            rows.append(('Suy luận (batch 1)', self.measure_inference(options['model'], batch, options['repeat'])))
+
+        self.stdout.write(f"{'Bước':<26}{'ms/ảnh':>10}")
+        for label, total_ms in rows:
+            self.stdout.write(f'{label:<26}{total_ms / len(captures):>10.2f}')
+
+    def load_captures(self, options):
+        rng = np.random.default_rng(options['seed'])
+        if not options['images']:
+            return [synthetic_capture(rng, face_size=options['face_size']) for _ in range(options['count'])]
+
+        captures = []
+        for path in sorted(Path(options['images']).glob('*.jp*g')):
+            data = path.read_bytes()
+            width, height = Image.open(io.BytesIO(data)).size
+            scale = options['face_size'] / INPUT_SIZE
+            offset = np.array([width / 2, height / 2]) - scale * INPUT_SIZE / 2
+            captures.append((data, ARCFACE_TEMPLATE * scale + offset))
+        return captures
+
+    def measure(self, func, repeat):
+        func()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return float(np.median(timings))
+
+    def measure_inference(self, model_path, batch, repeat):
+        from attendance.face_recognition.onnx_embedder import OnnxFaceEmbedder
+
+        embedder = OnnxFaceEmbedder(model_path, pool_size=1)
+        return self.measure(lambda: [embedder._run(batch[i:i + 1]) for i in range(len(batch))], repeat)
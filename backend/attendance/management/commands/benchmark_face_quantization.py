@@ -0,0 +1,74 @@
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.face_recognition.onnx_embedder import OnnxFaceEmbedder
+from attendance.face_recognition.quantization import (
+    cosine_agreement, int8_model_path, list_face_crops, load_face_crops,
+)
+
+
+class Command(BaseCommand):
+    help = 'So sánh model INT8 với FP32: độ trễ mỗi ảnh, thông lượng theo lô và độ tương đồng cosine của embedding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('images_dir', help='Thư mục ảnh khuôn mặt đã căn chỉnh (nên khác tập hiệu chỉnh)')
+        parser.add_argument('--fp32', default=None, help='Model FP32 (mặc định FACE_EMBEDDING_MODEL_PATH)')
+        parser.add_argument('--int8', default=None, help='Model INT8 (mặc định FACE_EMBEDDING_INT8_MODEL_PATH)')
+        parser.add_argument('--max-images', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=16)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--intra-op-threads', type=int, default=None)
+
+    def handle(self, *args, **options):
+        fp32_path = options['fp32'] or str(settings.FACE_EMBEDDING_MODEL_PATH)
+        int8_path = options['int8'] or str(settings.FACE_EMBEDDING_INT8_MODEL_PATH or int8_model_path(fp32_path))
+        for path in (fp32_path, int8_path):
+            if not os.path.exists(path):
+                raise CommandError(f'Không tìm thấy model: {path}')
+        crops = list_face_crops(options['images_dir'], options['max_images'])
+        if not crops:
+            raise CommandError(f"Không có ảnh khuôn mặt nào trong {options['images_dir']}")
+
+        threads = options['intra_op_threads'] or settings.FACE_ONNX_INTRA_OP_THREADS
+        embedders = {
+            'fp32': OnnxFaceEmbedder(fp32_path, pool_size=1, intra_op_threads=threads),
+            'int8': OnnxFaceEmbedder(int8_path, pool_size=1, intra_op_threads=threads),
+        }
+        tensor = load_face_crops(crops, embedders['fp32'].input_size)
+
+        self.stdout.write(f'{len(crops)} ảnh | lô {options["batch_size"]} | {threads} luồng mỗi session')
+        self.stdout.write(f"{'Model':<8}{'MB':>8}{'ms/ảnh':>10}{'ảnh/s (lô)':>14}")
+        embeddings = {}
+        for name, embedder in embedders.items():
+            embedder.warmup()
+            embeddings[name] = self.embed_all(embedder, tensor, 1)
+            single_ms = self.measure(lambda: self.embed_all(embedder, tensor, 1), options['repeat'])
+            batch_ms = self.measure(lambda: self.embed_all(embedder, tensor, options['batch_size']), options['repeat'])
+            size_mb = os.path.getsize(embedder.model_path) / 1024 / 1024
+            self.stdout.write(
+                f"{name:<8}{size_mb:>8.2f}{single_ms / len(crops):>10.3f}{len(crops) / (batch_ms / 1000):>14.1f}")
+
+        agreement = cosine_agreement(embeddings['fp32'], embeddings['int8'])
+        # Nhận diện chéo: truy vấn INT8 so với gallery FP32 có trả về đúng ảnh gốc không
+        fp32 = embeddings['fp32'] / np.linalg.norm(embeddings['fp32'], axis=1, keepdims=True)
+        int8 = embeddings['int8'] / np.linalg.norm(embeddings['int8'], axis=1, keepdims=True)
+        cross_rank1 = float(np.mean(np.argmax(int8 @ fp32.T, axis=1) == np.arange(len(crops))))
+        self.stdout.write(
+            f'Cosine(FP32, INT8): trung bình {agreement.mean():.4f}, p5 {np.percentile(agreement, 5):.4f}, '
+            f'thấp nhất {agreement.min():.4f} | rank-1 chéo INT8 -> gallery FP32: {cross_rank1:.3f}')
+
+    def embed_all(self, embedder, tensor, batch_size):
+        outputs = [embedder._run(tensor[start:start + batch_size]) for start in range(0, len(tensor), batch_size)]
+        return np.concatenate(outputs).reshape(len(tensor), -1)
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return float(np.median(timings))
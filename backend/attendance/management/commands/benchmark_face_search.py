@@ -0,0 +1,137 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from attendance.face_recognition.gallery import build_gallery_data, invalidate_face_gallery
+from attendance.models import Employee, EmployeeFaceEmbedding, EmployeeFaceCentroid
+from attendance.views.face_views import find_matching_candidates
+
+
+def _parse_int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+class Command(BaseCommand):
+    help = ('Đo recall@1 và độ trễ của tìm kiếm khuôn mặt (một bước, hai bước theo centroid, '
+            'lọc nhị phân + rerank) và kích thước lưu trữ')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Tạo N nhân viên giả lập (trong transaction, luôn rollback). 0 = dùng dữ liệu thật')
+        parser.add_argument('--samples', type=int, default=5, help='Số mẫu mỗi nhân viên giả lập')
+        parser.add_argument('--queries', type=int, default=200, help='Số truy vấn mẫu')
+        parser.add_argument('--noise', type=float, default=0.3,
+                            help='Độ lệch của truy vấn so với mẫu gốc (tương đối với chuẩn vector)')
+        parser.add_argument('--shortlist', default='0,5,10,20,50',
+                            help='Danh sách FACE_SHORTLIST_SIZE cần đo (0 = không lọc sơ bộ)')
+        parser.add_argument('--quantized', default='0',
+                            help='Danh sách FACE_QUANTIZED_CANDIDATES cần đo (chỉ backend pgvector, 0 = float)')
+        parser.add_argument('--backends', default='pgvector,memory')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        try:
+            with transaction.atomic():
+                if options['synthetic']:
+                    self.create_synthetic(rng, options['synthetic'], options['samples'])
+                self.run_benchmark(rng, options)
+                # Không bao giờ giữ lại dữ liệu giả lập
+                transaction.set_rollback(True)
+        finally:
+            invalidate_face_gallery()
+
+    def create_synthetic(self, rng, n_employees, n_samples):
+        dim = 512
+        started = time.perf_counter()
+        employees = Employee.objects.bulk_create([
+            Employee(employee_id=f'BENCH_{i:06d}', first_name=f'Bench {i}', last_name='Synthetic')
+            for i in range(n_employees)
+        ], batch_size=1000)
+
+        # Mỗi nhân viên là một tâm ngẫu nhiên, các mẫu dao động quanh tâm
+        centers = rng.normal(size=(n_employees, dim)).astype(np.float32)
+        centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+        embeddings, centroids = [], []
+        for employee, center in zip(employees, centers):
+            samples = center + rng.normal(0, 0.6 / np.sqrt(dim), size=(n_samples, dim)).astype(np.float32)
+            samples /= np.linalg.norm(samples, axis=1, keepdims=True)
+            # bulk_create không gọi save() nên phải tự điền cột nhị phân
+            embeddings.extend(
+                EmployeeFaceEmbedding(employee=employee, embedding=s.tolist(),
+                                      embedding_binary=EmployeeFaceEmbedding.quantize_binary(s))
+                for s in samples
+            )
+            centroids.append(EmployeeFaceCentroid(
+                employee=employee,
+                centroid=EmployeeFaceCentroid.compute_centroid(samples).tolist(),
+                sample_count=n_samples,
+            ))
+        EmployeeFaceEmbedding.objects.bulk_create(embeddings, batch_size=1000)
+        EmployeeFaceCentroid.objects.bulk_create(centroids, batch_size=1000)
+        self.stdout.write(
+            f'Đã tạo {n_employees} nhân viên x {n_samples} mẫu giả lập trong {time.perf_counter() - started:.1f}s')
+
+    def run_benchmark(self, rng, options):
+        rows = list(EmployeeFaceEmbedding.objects.filter(
+            employee__is_active=True
+        ).values_list('employee_id', 'embedding'))
+        if not rows:
+            self.stdout.write(self.style.WARNING('Không có embedding nào để đo'))
+            return
+
+        data = build_gallery_data([r[0] for r in rows], [r[1] for r in rows])
+        picks = rng.choice(len(data.employee_ids), size=min(options['queries'], len(data.employee_ids)), replace=False)
+        queries = data.matrix[picks] + rng.normal(
+            0, options['noise'] / np.sqrt(data.matrix.shape[1]), size=(len(picks), data.matrix.shape[1])
+        ).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        # Ground truth: nhân viên có mẫu gần nhất theo tìm kiếm vét cạn
+        truth = data.employee_ids[np.argmax(queries @ data.matrix.T, axis=1)]
+
+        self.stdout.write(
+            f'Gallery: {len(data.centroid_employee_ids)} nhân viên, {len(data.employee_ids)} mẫu | '
+            f'{len(queries)} truy vấn')
+        self.stdout.write(f"{'Backend':<10}{'Tham số':<16}{'recall@1':>10}{'mean ms':>10}{'p95 ms':>10}")
+
+        for backend in options['backends'].split(','):
+            configs = [{'FACE_SHORTLIST_SIZE': n, 'FACE_QUANTIZED_CANDIDATES': 0}
+                       for n in _parse_int_list(options['shortlist'])]
+            if backend == 'pgvector':
+                configs += [{'FACE_SHORTLIST_SIZE': 0, 'FACE_QUANTIZED_CANDIDATES': n}
+                            for n in _parse_int_list(options['quantized']) if n > 0]
+            for config in configs:
+                if config['FACE_QUANTIZED_CANDIDATES']:
+                    label = f"quantized={config['FACE_QUANTIZED_CANDIDATES']}"
+                else:
+                    label = f"shortlist={config['FACE_SHORTLIST_SIZE']}"
+                with override_settings(FACE_MATCH_BACKEND=backend, **config):
+                    invalidate_face_gallery()
+                    find_matching_candidates(queries[0], top_k=1)  # nạp gallery / đặt tham số ANN
+                    hits, latencies = 0, []
+                    for query, expected in zip(queries, truth):
+                        started = time.perf_counter()
+                        candidates, _ = find_matching_candidates(query, top_k=1)
+                        latencies.append((time.perf_counter() - started) * 1000)
+                        hits += bool(candidates) and candidates[0].employee.pk == expected
+                self.stdout.write(
+                    f"{backend:<10}{label:<16}{hits / len(queries):>10.3f}"
+                    f"{np.mean(latencies):>10.2f}{np.percentile(latencies, 95):>10.2f}")
+
+        self.report_storage()
+
+    def report_storage(self):
+        table = EmployeeFaceEmbedding._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT pg_total_relation_size(%s), pg_indexes_size(%s),
+                       avg(pg_column_size(embedding)), avg(pg_column_size(embedding_binary))
+                FROM {table}
+            """, [table, table])
+            total_size, index_size, float_bytes, binary_bytes = cursor.fetchone()
+        self.stdout.write(
+            f'Lưu trữ {table}: bảng + index {total_size / 1024:.0f} KB, index {index_size / 1024:.0f} KB | '
+            f'trung bình mỗi mẫu: vector {float(float_bytes or 0):.0f} B, bit {float(binary_bytes or 0):.0f} B')
@@ -0,0 +1,103 @@
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from attendance.face_recognition.bulk_loader import load_gallery_arrays
+from attendance.face_recognition.gallery import build_gallery_data, load_gallery_data_orm
+from attendance.models import Employee, EmployeeFaceEmbedding
+
+
+def _parse_int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+class Command(BaseCommand):
+    help = 'So sánh thời gian và bộ nhớ khi nạp gallery khuôn mặt bằng ORM và bằng COPY nhị phân'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='10000,100000',
+                            help='Danh sách số embedding giả lập cần đo, ví dụ 10000,100000,1000000 '
+                                 '(trong transaction, luôn rollback). 0 = dùng dữ liệu thật')
+        parser.add_argument('--samples', type=int, default=5, help='Số mẫu mỗi nhân viên giả lập')
+        parser.add_argument('--methods', default='orm,copy')
+        parser.add_argument('--orm-max-rows', type=int, default=200000,
+                            help='Bỏ qua đường ORM khi số hàng lớn hơn (tốn nhiều bộ nhớ)')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('COPY nhị phân chỉ hỗ trợ PostgreSQL')
+        rng = np.random.default_rng(options['seed'])
+        methods = options['methods'].split(',')
+        self.stdout.write(f"{'Số hàng':>10}  {'Cách nạp':<8}{'ms':>10}{'hàng/s':>12}{'bộ nhớ đỉnh MB':>16}")
+
+        for rows in _parse_int_list(options['rows']):
+            with transaction.atomic():
+                if rows:
+                    self.create_synthetic(rng, rows, options['samples'])
+                for method in methods:
+                    self.run_method(method, rows, options)
+                # Không bao giờ giữ lại dữ liệu giả lập
+                transaction.set_rollback(True)
+
+    def create_synthetic(self, rng, rows, n_samples):
+        """Chèn `rows` embedding ngẫu nhiên; dữ liệu của bảng hiện có bị ẩn (xóa trong transaction)"""
+        dim = 512
+        embedding_table = EmployeeFaceEmbedding._meta.db_table
+        with connection.cursor() as cursor:
+            # Xóa index HNSW trong transaction để chèn nhanh (được khôi phục khi rollback)
+            cursor.execute('DROP INDEX IF EXISTS employee_emb_hnsw_idx')
+            cursor.execute(f'DELETE FROM {embedding_table}')
+
+        n_employees = -(-rows // n_samples)
+        employees = Employee.objects.bulk_create([
+            Employee(employee_id=f'LOAD_{i:07d}', first_name=f'Load {i}', last_name='Synthetic')
+            for i in range(n_employees)
+        ], batch_size=5000)
+
+        # Nội dung vector không ảnh hưởng tốc độ nạp: dùng lại một tập vector ngẫu nhiên
+        pool = rng.normal(size=(256, dim)).astype(np.float32)
+        pool /= np.linalg.norm(pool, axis=1, keepdims=True)
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {embedding_table} (employee_id, embedding, created_at)
+                SELECT e.id, (%s::text[]::vector[])[1 + (e.id + g) %% 256], now()
+                FROM unnest(%s::bigint[]) AS e(id), generate_series(1, %s) AS g
+                LIMIT %s
+            """, [[f"[{','.join(map(str, p.tolist()))}]" for p in pool], [e.pk for e in employees], n_samples, rows])
+            cursor.execute(f'ANALYZE {embedding_table}')
+
+    def run_method(self, method, rows, options):
+        if method == 'orm':
+            load = load_gallery_data_orm
+            if rows > options['orm_max_rows']:
+                self.stdout.write(f'{rows:>10}  {method:<8}{"(bỏ qua, --orm-max-rows)":>38}')
+                return
+        elif method == 'copy':
+            def load():
+                return build_gallery_data(*load_gallery_arrays(), copy=False)
+        else:
+            raise CommandError(f'Cách nạp không hợp lệ: {method}')
+
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            data = load()
+            timings.append(time.perf_counter() - started)
+            del data
+
+        # Đo bộ nhớ đỉnh riêng một lần (tracemalloc làm chậm cấp phát)
+        tracemalloc.start()
+        data = load()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        seconds = float(np.median(timings))
+        loaded = len(data.employee_ids)
+        self.stdout.write(
+            f'{loaded:>10}  {method:<8}{seconds * 1000:>10.1f}{loaded / max(seconds, 1e-9):>12.0f}'
+            f'{peak / 2 ** 20:>16.1f}')
@@ -0,0 +1,225 @@
+import contextlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from attendance.face_recognition.gallery import invalidate_face_gallery
+from attendance.face_recognition.transport import encode_embedding
+from attendance.models import Employee, ExpoPushTicket, PushNotificationOutbox
+from attendance.push.dispatcher import get_notification_dispatcher
+from attendance.push.expo import close_expo_client
+from attendance.push.fake_provider import FakeExpoServer, get_fake_provider, reset_fake_provider
+from attendance.push.outbox import process_batch
+
+EMPLOYEE_PREFIX = 'PUSHBENCH_'
+
+
+def _percentiles(values):
+    if not values:
+        return '-'
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return f'p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}  max {max(values):.1f} ms'
+
+
+class Command(BaseCommand):
+    help = ('Đo độ trễ end-to-end quét khuôn mặt -> push notification với nhà cung cấp giả lập '
+            '(Expo HTTP server + FCM stub): bắn N lượt quét/giây qua /process-attendance/')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=20, help='Số lượt quét mỗi giây')
+        parser.add_argument('--duration', type=float, default=10, help='Số giây bắn tải')
+        parser.add_argument('--employees', type=int, default=100,
+                            help='Số nhân viên giả lập (tạo rồi xóa sau khi đo)')
+        parser.add_argument('--concurrency', type=int, default=16, help='Số kiosk (thread) gửi đồng thời')
+        parser.add_argument('--fcm-ratio', type=float, default=0.5,
+                            help='Tỷ lệ nhân viên dùng token FCM (còn lại dùng Expo)')
+        parser.add_argument('--delivery', choices=['dispatcher', 'outbox'], default=None,
+                            help='Cách gửi thông báo (mặc định PUSH_DELIVERY); outbox chạy kèm một worker')
+        parser.add_argument('--latency-ms', type=float, default=None, help='Mặc định PUSH_FAKE_LATENCY_MS')
+        parser.add_argument('--jitter-ms', type=float, default=None, help='Mặc định PUSH_FAKE_JITTER_MS')
+        parser.add_argument('--error-rate', type=float, default=None, help='Mặc định PUSH_FAKE_ERROR_RATE')
+        parser.add_argument('--rate-limit', type=float, default=None,
+                            help='Message/giây của nhà cung cấp, 0 = không giới hạn (mặc định PUSH_FAKE_RATE_LIMIT)')
+        parser.add_argument('--drain-timeout', type=float, default=30,
+                            help='Số giây tối đa chờ các thông báo còn lại sau khi ngừng bắn tải')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['rate'] <= 0 or options['duration'] <= 0 or options['employees'] <= 0:
+            raise CommandError('--rate, --duration và --employees phải lớn hơn 0')
+
+        def option(name, setting):
+            return getattr(settings, setting) if options[name] is None else options[name]
+
+        overrides = {
+            # Kiosk giả lập gửi request qua django.test.Client (host 'testserver')
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            'PUSH_DELIVERY': options['delivery'] or settings.PUSH_DELIVERY,
+            'PUSH_FCM_TRANSPORT': 'fake',
+            'PUSH_FAKE_LATENCY_MS': option('latency_ms', 'PUSH_FAKE_LATENCY_MS'),
+            'PUSH_FAKE_JITTER_MS': option('jitter_ms', 'PUSH_FAKE_JITTER_MS'),
+            'PUSH_FAKE_ERROR_RATE': option('error_rate', 'PUSH_FAKE_ERROR_RATE'),
+            'PUSH_FAKE_RATE_LIMIT': option('rate_limit', 'PUSH_FAKE_RATE_LIMIT'),
+        }
+        rng = np.random.default_rng(options['seed'])
+        # Dữ liệu phải commit vì các kiosk, dispatcher và worker outbox dùng connection riêng
+        self.cleanup()
+        try:
+            faces = self.create_employees(rng, options['employees'], options['fcm_ratio'])
+            with override_settings(**overrides):
+                reset_fake_provider()
+                provider = get_fake_provider()
+                # Độ trễ end-to-end cần thời điểm nhận từng thông báo
+                provider.keep_deliveries = True
+                server = FakeExpoServer(provider).start()
+                try:
+                    with override_settings(EXPO_PUSH_API_URL=server.url):
+                        close_expo_client()
+                        self.run_benchmark(rng, faces, provider, options, overrides['PUSH_DELIVERY'])
+                finally:
+                    close_expo_client()
+                    server.stop()
+                    reset_fake_provider()
+        finally:
+            self.cleanup()
+
+    def create_employees(self, rng, count, fcm_ratio):
+        started = time.perf_counter()
+        faces = rng.normal(size=(count, 512)).astype(np.float32)
+        faces /= np.linalg.norm(faces, axis=1, keepdims=True)
+        fcm_count = int(round(count * fcm_ratio))
+        employees = Employee.objects.bulk_create([
+            Employee(
+                employee_id=f'{EMPLOYEE_PREFIX}{i:05d}', first_name=f'Push {i}', last_name='Benchmark',
+                expo_push_token=f'pushbench-fcm-{i}' if i < fcm_count else f'ExponentPushToken[pushbench-{i}]',
+            )
+            for i in range(count)
+        ])
+        for employee, face in zip(employees, faces):
+            employee.set_face_embeddings([face])
+        invalidate_face_gallery()
+        self.stdout.write(
+            f'Đã tạo {count} nhân viên giả lập ({fcm_count} FCM, {count - fcm_count} Expo) '
+            f'trong {time.perf_counter() - started:.1f}s')
+        return faces
+
+    def cleanup(self):
+        deleted, _ = Employee.objects.filter(employee_id__startswith=EMPLOYEE_PREFIX).delete()
+        ExpoPushTicket.objects.filter(push_token__startswith='ExponentPushToken[pushbench-').delete()
+        if deleted:
+            invalidate_face_gallery()
+
+    def run_benchmark(self, rng, faces, provider, options, delivery):
+        total = int(options['rate'] * options['duration'])
+        # Lượt quét thứ i là khuôn mặt của nhân viên i % N với nhiễu nhỏ, gửi base64 float32 như kiosk
+        bodies = []
+        for i in range(total):
+            face = faces[i % len(faces)] + rng.normal(0, 0.01, size=512).astype(np.float32)
+            bodies.append(json.dumps({'embedding': encode_embedding(face / np.linalg.norm(face)),
+                                      'embedding_dtype': 'float32'}))
+
+        scans = queue.Queue()
+        lock = threading.Lock()
+        request_ms = []
+        scheduled = defaultdict(deque)  # employee_id -> thời điểm lên lịch các lượt quét thành công
+        failures = defaultdict(int)
+
+        def kiosk():
+            client = Client()
+            try:
+                while True:
+                    item = scans.get()
+                    if item is None:
+                        return
+                    body, due = item
+                    response = client.post('/process-attendance/', data=body, content_type='application/json')
+                    elapsed = (time.perf_counter() - due) * 1000
+                    with lock:
+                        if response.status_code == 200:
+                            request_ms.append(elapsed)
+                            scheduled[response.json()['employee']['id']].append(due)
+                        else:
+                            failures[response.status_code] += 1
+            finally:
+                connection.close()
+
+        stop_worker = threading.Event()
+
+        def outbox_worker():
+            try:
+                while not stop_worker.is_set():
+                    if not process_batch()['claimed']:
+                        time.sleep(0.005)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=kiosk, name=f'kiosk-{i}') for i in range(options['concurrency'])]
+        if delivery == 'outbox':
+            threads.append(threading.Thread(target=outbox_worker, name='outbox-worker'))
+        self.stdout.write(
+            f"Bắn {total} lượt quét ({options['rate']:g}/s trong {options['duration']:g}s, "
+            f"{options['concurrency']} kiosk), gửi thông báo qua {delivery}")
+
+        # Các view in log từng lượt quét; tắt trong lúc đo (self.stdout giữ stream gốc)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for thread in threads:
+                thread.start()
+            started = time.perf_counter()
+            for i, body in enumerate(bodies):
+                # Độ trễ tính từ thời điểm lên lịch, kể cả thời gian chờ kiosk rảnh
+                due = started + i / options['rate']
+                time.sleep(max(0.0, due - time.perf_counter()))
+                scans.put((body, due))
+            for _ in range(options['concurrency']):
+                scans.put(None)
+            for thread in threads[:options['concurrency']]:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            # Chờ các thông báo còn lại
+            deadline = time.monotonic() + options['drain_timeout']
+            while time.monotonic() < deadline:
+                if delivery == 'outbox':
+                    if not self.pending_outbox():
+                        break
+                elif get_notification_dispatcher().wait_idle(0.1):
+                    break
+                time.sleep(0.05)
+            stop_worker.set()
+            for thread in threads[options['concurrency']:]:
+                thread.join()
+
+        end_to_end = []
+        for employee_id, received in sorted(provider.deliveries, key=lambda delivery: delivery[1]):
+            pending = scheduled.get(employee_id)
+            if pending:
+                end_to_end.append((received - pending.popleft()) * 1000)
+
+        succeeded = len(request_ms)
+        stats = provider.stats()
+        self.stdout.write(
+            f'Hoàn thành {succeeded}/{total} lượt quét trong {elapsed:.1f}s ({succeeded / elapsed:.1f}/s)'
+            + (f', lỗi HTTP: {dict(failures)}' if failures else ''))
+        self.stdout.write(f'Quét -> phản hồi:       {_percentiles(request_ms)}')
+        self.stdout.write(f'Quét -> nhận thông báo: {_percentiles(end_to_end)}')
+        self.stdout.write(
+            f"Thông báo: {len(end_to_end)}/{succeeded} đã nhận; nhà cung cấp: {stats['requests']} request, "
+            f"{stats['messages']} message, {stats['errors']} lỗi, {stats['throttled']} bị giới hạn tốc độ")
+
+    def pending_outbox(self):
+        return PushNotificationOutbox.objects.filter(
+            employee__employee_id__startswith=EMPLOYEE_PREFIX, status='PENDING',
+            next_attempt_at__lte=timezone.now() + timedelta(seconds=1),
+        ).exists()
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from attendance.push.expo import check_receipts
+
+
+class Command(BaseCommand):
+    help = ('Lấy receipt của các ticket Expo theo lô, xóa push token DeviceNotRegistered '
+            '(chạy định kỳ, ví dụ mỗi 15 phút bằng cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=None,
+                            help='Chỉ kiểm tra ticket gửi cách đây ít nhất số giây này (mặc định EXPO_RECEIPT_DELAY)')
+
+    def handle(self, *args, **options):
+        min_age = options['min_age']
+        if min_age is None:
+            min_age = settings.EXPO_RECEIPT_DELAY
+        counts = check_receipts(timedelta(seconds=min_age))
+        self.stdout.write(
+            f"Kiểm tra {counts['checked']} ticket: {counts['ok']} thành công, {counts['error']} lỗi, "
+            f"xóa {counts['pruned']} token, {counts['expired']} ticket hết hạn")
@@ -0,0 +1,159 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from pgvector.django import MaxInnerProduct
+
+from attendance.models import EmployeeFaceEmbedding
+from attendance.views.face_views import apply_ann_search_params
+
+HNSW_INDEX_NAME = 'employee_emb_hnsw_idx'
+IVFFLAT_INDEX_NAME = 'employee_emb_ivfflat_idx'
+
+
+def _parse_int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Quản lý index ANN cho face embedding và đo recall@1 so với tìm kiếm chính xác'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--create-ivfflat', action='store_true',
+                            help='Tạo index IVFFlat (nên chạy sau khi đã có dữ liệu)')
+        parser.add_argument('--drop-ivfflat', action='store_true', help='Xóa index IVFFlat')
+        parser.add_argument('--lists', type=int, default=None,
+                            help='Số lists cho IVFFlat (mặc định: sqrt(số embedding))')
+        parser.add_argument('--queries', type=int, default=100, help='Số truy vấn mẫu để đo recall')
+        parser.add_argument('--noise', type=float, default=0.05,
+                            help='Độ lệch chuẩn nhiễu thêm vào truy vấn mẫu (giả lập ảnh quét thật)')
+        parser.add_argument('--ef-search', default='10,20,40,80,160', help='Danh sách hnsw.ef_search cần đo')
+        parser.add_argument('--probes', default='1,5,10,20', help='Danh sách ivfflat.probes cần đo')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['create_ivfflat'] and options['drop_ivfflat']:
+            raise CommandError('Chỉ chọn một trong --create-ivfflat hoặc --drop-ivfflat')
+
+        if options['drop_ivfflat']:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP INDEX IF EXISTS {IVFFLAT_INDEX_NAME}')
+            self.stdout.write(self.style.SUCCESS(f'Đã xóa index {IVFFLAT_INDEX_NAME}'))
+            return
+
+        if options['create_ivfflat']:
+            self.create_ivfflat(options['lists'])
+
+        self.report_recall(options)
+
+    def create_ivfflat(self, lists):
+        total = EmployeeFaceEmbedding.objects.count()
+        if total == 0:
+            raise CommandError('Chưa có embedding nào, IVFFlat cần dữ liệu để huấn luyện lists')
+        lists = lists or max(1, int(total ** 0.5))
+        table = EmployeeFaceEmbedding._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX IF EXISTS {IVFFLAT_INDEX_NAME}')
+            cursor.execute(
+                f'CREATE INDEX {IVFFLAT_INDEX_NAME} ON {table} '
+                f'USING ivfflat (embedding vector_ip_ops) WITH (lists = %s)',
+                [lists],
+            )
+        self.stdout.write(self.style.SUCCESS(f'Đã tạo {IVFFLAT_INDEX_NAME} với lists={lists} ({total} embedding)'))
+
+    def report_recall(self, options):
+        rng = np.random.default_rng(options['seed'])
+        ids = list(EmployeeFaceEmbedding.objects.filter(employee__is_active=True).values_list('id', flat=True))
+        if not ids:
+            self.stdout.write(self.style.WARNING('Không có embedding nào để đo recall'))
+            return
+
+        sample_ids = rng.choice(ids, size=min(options['queries'], len(ids)), replace=False).tolist()
+        queries = []
+        for emb in EmployeeFaceEmbedding.objects.filter(id__in=sample_ids).only('embedding'):
+            query = np.asarray(emb.embedding, dtype=np.float32)
+            query = query + rng.normal(0, options['noise'], query.shape).astype(np.float32)
+            queries.append(query / np.linalg.norm(query))
+
+        # Ground truth: tắt index scan để Postgres quét tuần tự (kết quả chính xác)
+        exact, exact_ms = self.run_queries(queries, exact=True)
+        self.stdout.write(f'Truy vấn: {len(queries)} | Exact search: {np.mean(exact_ms):.2f} ms/truy vấn')
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname FROM pg_indexes WHERE tablename = %s',
+                [EmployeeFaceEmbedding._meta.db_table],
+            )
+            index_names = {row[0] for row in cursor.fetchall()}
+
+        has_ivfflat = IVFFLAT_INDEX_NAME in index_names
+        sweeps = [(HNSW_INDEX_NAME, IVFFLAT_INDEX_NAME, 'ef_search', _parse_int_list(options['ef_search']))]
+        if has_ivfflat:
+            sweeps.append((IVFFLAT_INDEX_NAME, HNSW_INDEX_NAME, 'probes', _parse_int_list(options['probes'])))
+
+        self.stdout.write(f"{'Tham số':<20}{'recall@1':>10}{'mean ms':>10}{'p95 ms':>10}  index")
+        for index_name, other_index, name, values in sweeps:
+            # Planner chỉ dùng một index ANN cho mỗi truy vấn: xóa index còn lại và tắt
+            # seq scan trong transaction (rollback sau khi đo) để mỗi dòng đo đúng index
+            # của tham số. DROP INDEX giữ khóa ACCESS EXCLUSIVE trên bảng embedding trong lúc đo.
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    if other_index in index_names:
+                        cursor.execute(f'DROP INDEX {other_index}')
+                    cursor.execute("SELECT set_config('enable_seqscan', 'off', true)")
+                for value in values:
+                    results, latencies = self.run_queries(queries, **{name: value})
+                    hits = sum(1 for a, b in zip(exact, results) if a == b)
+                    recall = hits / len(queries)
+                    served_by = self.plan_index(queries[0], **{name: value})
+                    self.stdout.write(
+                        f"{f'{name}={value}':<20}{recall:>10.3f}{np.mean(latencies):>10.2f}"
+                        f"{np.percentile(latencies, 95):>10.2f}  {served_by}"
+                    )
+                    if served_by != index_name:
+                        self.stdout.write(self.style.WARNING(
+                            f'  Planner không dùng {index_name}, dòng trên không đo index ANN'))
+                transaction.set_rollback(True)
+        if not has_ivfflat:
+            self.stdout.write('(Chưa có IVFFlat - dùng --create-ivfflat để so sánh probes)')
+
+    def nearest_queryset(self, query):
+        return EmployeeFaceEmbedding.objects.filter(
+            employee__is_active=True
+        ).order_by(MaxInnerProduct('embedding', query.tolist())).values_list('id', flat=True)
+
+    def plan_index(self, query, ef_search=None, probes=None):
+        """Tên index ANN phục vụ truy vấn theo EXPLAIN, 'seq scan' nếu không dùng index"""
+        with transaction.atomic():
+            apply_ann_search_params(ef_search=ef_search, probes=probes)
+            plan = json.loads(self.nearest_queryset(query)[:1].explain(format='json'))
+
+        def index_names(node):
+            if isinstance(node, dict):
+                if 'Index Name' in node:
+                    yield node['Index Name']
+                for child in node.values():
+                    yield from index_names(child)
+            elif isinstance(node, list):
+                for child in node:
+                    yield from index_names(child)
+
+        ann = [name for name in index_names(plan) if name in (HNSW_INDEX_NAME, IVFFLAT_INDEX_NAME)]
+        return ann[0] if ann else 'seq scan'
+
+    def run_queries(self, queries, exact=False, ef_search=None, probes=None):
+        results, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            with transaction.atomic():
+                if exact:
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT set_config('enable_indexscan', 'off', true)")
+                else:
+                    apply_ann_search_params(ef_search=ef_search, probes=probes)
+                nearest = self.nearest_queryset(query).first()
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append(nearest)
+        return results, latencies
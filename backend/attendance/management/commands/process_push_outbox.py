@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from attendance.push.outbox import process_batch, prune_outbox
+
+
+class Command(BaseCommand):
+    help = ('Gửi push notification từ bảng outbox (SELECT ... FOR UPDATE SKIP LOCKED, '
+            'có thể chạy nhiều worker song song)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Số thông báo mỗi lô (mặc định PUSH_OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Số giây chờ khi outbox không còn dòng đến hạn')
+        parser.add_argument('--prune-interval', type=float, default=300,
+                            help='Chu kỳ (giây) xóa các dòng cũ hơn PUSH_OUTBOX_RETENTION')
+        parser.add_argument('--once', action='store_true', help='Gửi đến khi hết dòng đến hạn rồi thoát')
+
+    def handle(self, *args, **options):
+        retention = timedelta(seconds=settings.PUSH_OUTBOX_RETENTION)
+        next_prune = time.monotonic()
+        try:
+            while True:
+                if time.monotonic() >= next_prune:
+                    deleted = prune_outbox(retention)
+                    if deleted:
+                        self.stdout.write(f'Đã xóa {deleted} dòng outbox cũ')
+                    next_prune = time.monotonic() + options['prune_interval']
+
+                counts = process_batch(batch_size=options['batch_size'])
+                if counts['claimed']:
+                    self.stdout.write(
+                        f"Lô {counts['claimed']}: gửi {counts['sent']}, "
+                        f"thử lại {counts['retry']}, thất bại {counts['failed']}")
+                    continue
+                if options['once']:
+                    return
+                # Không giữ connection khi rảnh
+                connection.close()
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Dừng worker outbox')
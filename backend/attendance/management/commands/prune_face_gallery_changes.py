@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from attendance.face_recognition.changes import prune_changes
+
+
+class Command(BaseCommand):
+    help = 'Xóa nhật ký thay đổi gallery khuôn mặt cũ hơn FACE_GALLERY_CHANGE_RETENTION'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None,
+                            help='Số giây (mặc định FACE_GALLERY_CHANGE_RETENTION)')
+
+    def handle(self, *args, **options):
+        seconds = options['older_than'] or settings.FACE_GALLERY_CHANGE_RETENTION
+        deleted = prune_changes(timedelta(seconds=seconds))
+        self.stdout.write(f'Đã xóa {deleted} dòng nhật ký cũ hơn {seconds} giây')
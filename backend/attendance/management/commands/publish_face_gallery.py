@@ -0,0 +1,35 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.face_recognition.changes import current_watermark
+from attendance.face_recognition.gallery import load_gallery_data
+from attendance.face_recognition.shared_gallery import map_shared_gallery, publish_face_gallery
+
+
+class Command(BaseCommand):
+    help = 'Xuất bản gallery khuôn mặt ra file dùng chung (mmap) cho các worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='File gallery (mặc định FACE_GALLERY_SHARED_PATH)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Xuất bản lại mỗi N giây (chạy như tiến trình nền), 0 = một lần')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.FACE_GALLERY_SHARED_PATH
+        if not path:
+            raise CommandError('Chưa cấu hình FACE_GALLERY_SHARED_PATH (hoặc truyền --path)')
+
+        while True:
+            started = time.perf_counter()
+            version = publish_face_gallery(path, load_gallery_data, current_watermark)
+            snapshot = map_shared_gallery(path)
+            self.stdout.write(
+                f'{path}: version {version}, {len(snapshot.data.employee_ids)} mẫu / '
+                f'{len(snapshot.data.centroid_employee_ids)} nhân viên, '
+                f'{os.path.getsize(path) / 1024 / 1024:.1f} MB trong {time.perf_counter() - started:.2f}s')
+            if options['interval'] <= 0:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.face_recognition.quantization import int8_model_path, list_face_crops, quantize_face_model
+
+
+class Command(BaseCommand):
+    help = 'Lượng tử hóa tĩnh INT8 model embedding khuôn mặt, hiệu chỉnh trên thư mục ảnh khuôn mặt đã căn chỉnh'
+
+    def add_arguments(self, parser):
+        parser.add_argument('calibration_dir', help='Thư mục ảnh khuôn mặt (JPEG/PNG) dùng để hiệu chỉnh')
+        parser.add_argument('--model', default=None, help='Model FP32 (mặc định FACE_EMBEDDING_MODEL_PATH)')
+        parser.add_argument('--output', default=None, help='File model INT8 (mặc định <model>_int8.onnx)')
+        parser.add_argument('--max-images', type=int, default=500)
+        parser.add_argument('--per-tensor', action='store_true', help='Lượng tử hóa weight theo tensor thay vì theo kênh')
+
+    def handle(self, *args, **options):
+        try:
+            import onnxruntime  # noqa: F401
+            import onnx  # noqa: F401
+        except ImportError:
+            raise CommandError('Cần cài onnxruntime và onnx để lượng tử hóa model')
+
+        model_path = options['model'] or str(settings.FACE_EMBEDDING_MODEL_PATH)
+        output_path = options['output'] or str(settings.FACE_EMBEDDING_INT8_MODEL_PATH or int8_model_path(model_path))
+        crops = list_face_crops(options['calibration_dir'], options['max_images'])
+        if not crops:
+            raise CommandError(f"Không có ảnh khuôn mặt nào trong {options['calibration_dir']}")
+
+        self.stdout.write(f'Hiệu chỉnh {model_path} trên {len(crops)} ảnh...')
+        quantize_face_model(model_path, output_path, crops, per_channel=not options['per_tensor'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã tạo {output_path}. Kiểm tra bằng: manage.py benchmark_face_quantization {options["calibration_dir"]}'))
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from attendance.push.fake_provider import FakeExpoServer, FakePushProvider
+
+
+class Command(BaseCommand):
+    help = ('Chạy HTTP server giả lập Expo Push API (độ trễ, lỗi, giới hạn tốc độ) để kiểm thử tải; '
+            'trỏ EXPO_PUSH_API_URL của server web tới URL in ra')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=None, help='Mặc định PUSH_FAKE_LATENCY_MS')
+        parser.add_argument('--jitter-ms', type=float, default=None, help='Mặc định PUSH_FAKE_JITTER_MS')
+        parser.add_argument('--error-rate', type=float, default=None, help='Mặc định PUSH_FAKE_ERROR_RATE')
+        parser.add_argument('--rate-limit', type=float, default=None,
+                            help='Message/giây, 0 = không giới hạn (mặc định PUSH_FAKE_RATE_LIMIT)')
+
+    def handle(self, *args, **options):
+        def option(name, setting):
+            return getattr(settings, setting) if options[name] is None else options[name]
+
+        provider = FakePushProvider(
+            latency_ms=option('latency_ms', 'PUSH_FAKE_LATENCY_MS'),
+            jitter_ms=option('jitter_ms', 'PUSH_FAKE_JITTER_MS'),
+            error_rate=option('error_rate', 'PUSH_FAKE_ERROR_RATE'),
+            rate_limit=option('rate_limit', 'PUSH_FAKE_RATE_LIMIT'),
+            keep_deliveries=False,
+        )
+        server = FakeExpoServer(provider, options['host'], options['port'])
+        self.stdout.write(
+            f'Fake Expo Push API: {server.url} (độ trễ {provider.latency_ms:g}±{provider.jitter_ms:g} ms, '
+            f'lỗi {provider.error_rate:.1%}, giới hạn {provider.rate_limit:g} message/s)')
+        self.stdout.write(f'Đặt EXPO_PUSH_API_URL={server.url} (và PUSH_FCM_TRANSPORT=fake) cho server web')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            self.stdout.write(f'Dừng server: {provider.stats()}')
+
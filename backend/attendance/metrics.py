@@ -0,0 +1,17 @@
+"""Tóm tắt các mẫu đo (độ trễ, kích thước lô) cho /api/metrics/"""
+import numpy as np
+
+# Số mẫu gần nhất giữ lại để tính trung bình / p95 trong metrics
+METRICS_WINDOW = 1024
+
+
+def summarize(values):
+    """Trung bình, p95 và lớn nhất của các mẫu gần nhất (0 khi chưa có mẫu)"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return {'mean': 0.0, 'p95': 0.0, 'max': 0.0}
+    return {
+        'mean': round(float(values.mean()), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'max': round(float(values.max()), 3),
+    }
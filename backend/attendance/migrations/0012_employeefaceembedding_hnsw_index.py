@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:46
+
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0011_employeefaceembedding"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="employeefaceembedding",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="employee_emb_hnsw_idx",
+                opclasses=["vector_cosine_ops"],
+            ),
+        ),
+    ]
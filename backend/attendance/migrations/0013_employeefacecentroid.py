@@ -0,0 +1,94 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:53
+
+import django.db.models.deletion
+import pgvector.django.indexes
+import pgvector.django.vector
+import numpy as np
+from django.db import migrations, models
+
+
+def backfill_centroids(apps, schema_editor):
+    EmployeeFaceEmbedding = apps.get_model("attendance", "EmployeeFaceEmbedding")
+    EmployeeFaceCentroid = apps.get_model("attendance", "EmployeeFaceCentroid")
+
+    samples = {}
+    for employee_id, embedding in EmployeeFaceEmbedding.objects.values_list(
+        "employee_id", "embedding"
+    ).iterator():
+        samples.setdefault(employee_id, []).append(np.asarray(embedding, dtype=np.float32))
+
+    centroids = []
+    for employee_id, embeddings in samples.items():
+        matrix = np.stack(embeddings)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroid = (matrix / norms).mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        if norm > 0:
+            centroid = centroid / norm
+        centroids.append(
+            EmployeeFaceCentroid(
+                employee_id=employee_id,
+                centroid=centroid.tolist(),
+                sample_count=len(embeddings),
+            )
+        )
+    EmployeeFaceCentroid.objects.bulk_create(centroids, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0012_employeefaceembedding_hnsw_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmployeeFaceCentroid",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "centroid",
+                    pgvector.django.vector.VectorField(
+                        dimensions=512, verbose_name="Face Centroid Vector"
+                    ),
+                ),
+                (
+                    "sample_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Số mẫu"),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "employee",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="face_centroid",
+                        to="attendance.employee",
+                        verbose_name="Nhân viên",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Face Centroid",
+                "verbose_name_plural": "Face Centroids",
+                "indexes": [
+                    pgvector.django.indexes.HnswIndex(
+                        ef_construction=64,
+                        fields=["centroid"],
+                        m=16,
+                        name="employee_centroid_hnsw_idx",
+                        opclasses=["vector_cosine_ops"],
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_centroids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:59
+
+import pgvector.django.bit
+from django.db import migrations
+
+# Lượng tử hóa nhị phân các embedding hiện có: bit i = 1 nếu thành phần i > 0
+# (giống EmployeeFaceEmbedding.quantize_binary)
+BACKFILL_SQL = """
+UPDATE attendance_employeefaceembedding
+SET embedding_binary = (
+    SELECT string_agg(CASE WHEN x > 0 THEN '1' ELSE '0' END, '' ORDER BY i)
+    FROM unnest(embedding::real[]) WITH ORDINALITY AS t(x, i)
+)::bit(512)
+WHERE embedding_binary IS NULL
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0013_employeefacecentroid"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="employeefaceembedding",
+            name="embedding_binary",
+            field=pgvector.django.bit.BitField(
+                blank=True,
+                length=512,
+                null=True,
+                verbose_name="Face Embedding (binary)",
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0014_employeefaceembedding_binary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FaceGalleryChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("employee_pk", models.BigIntegerField(verbose_name="ID nhân viên")),
+                (
+                    "txid",
+                    models.BigIntegerField(
+                        db_default=models.Func(
+                            function="txid_current",
+                            output_field=models.BigIntegerField(),
+                        )
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                "verbose_name": "Face Gallery Change",
+                "verbose_name_plural": "Face Gallery Changes",
+                "indexes": [
+                    models.Index(fields=["txid"], name="face_gallery_change_txid_idx")
+                ],
+            },
+        ),
+    ]
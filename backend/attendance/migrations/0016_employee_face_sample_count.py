@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:02
+
+from django.db import migrations, models
+
+# Đếm số mẫu khuôn mặt hiện có của mỗi nhân viên trong EmployeeFaceEmbedding
+BACKFILL_SQL = """
+UPDATE attendance_employee e
+SET face_sample_count = c.samples
+FROM (
+    SELECT employee_id, count(*) AS samples
+    FROM attendance_employeefaceembedding
+    GROUP BY employee_id
+) c
+WHERE c.employee_id = e.id AND e.face_sample_count <> c.samples
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0015_facegallerychange"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="employee",
+            name="face_sample_count",
+            field=models.PositiveIntegerField(
+                db_index=True, default=0, verbose_name="Số mẫu khuôn mặt"
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:05
+
+import attendance.models
+import django.db.models.lookups
+import pgvector.django.indexes
+from django.db import migrations, models
+
+# Chuẩn hóa L2 các vector hiện có trước khi thêm CHECK (chạy sau khi bỏ index
+# HNSW cũ để không phải cập nhật index cho từng hàng). Vector bằng 0 không so
+# khớp được với ai nên bị xóa. Với các nhân viên có mẫu bị xóa hoặc chuẩn hóa
+# lại, face_sample_count và centroid (trung bình các mẫu, chuẩn hóa) được tính
+# lại từ các mẫu còn lại; nhân viên không còn mẫu nào thì bị xóa centroid.
+NORMALIZE_SQL = """
+CREATE TEMP TABLE face_touched ON COMMIT DROP AS
+SELECT DISTINCT employee_id FROM attendance_employeefaceembedding
+WHERE abs(vector_norm(embedding) - 1) > 1e-6;
+
+DELETE FROM attendance_employeefaceembedding WHERE vector_norm(embedding) = 0;
+
+UPDATE attendance_employeefaceembedding
+SET embedding = (
+    SELECT array_agg(x / vector_norm(embedding) ORDER BY i)
+    FROM unnest(embedding::real[]) WITH ORDINALITY AS t(x, i)
+)::vector
+WHERE abs(vector_norm(embedding) - 1) > 1e-6;
+
+UPDATE attendance_employee e
+SET face_sample_count = (
+    SELECT count(*) FROM attendance_employeefaceembedding s WHERE s.employee_id = e.id
+)
+WHERE e.id IN (SELECT employee_id FROM face_touched);
+
+DELETE FROM attendance_employeefacecentroid
+WHERE employee_id IN (SELECT employee_id FROM face_touched)
+  AND employee_id NOT IN (SELECT employee_id FROM attendance_employeefaceembedding);
+
+WITH averaged AS (
+    SELECT employee_id, avg(embedding) AS v, count(*) AS samples
+    FROM attendance_employeefaceembedding
+    WHERE employee_id IN (SELECT employee_id FROM face_touched)
+    GROUP BY employee_id
+)
+INSERT INTO attendance_employeefacecentroid (employee_id, centroid, sample_count, updated_at)
+SELECT employee_id, (
+    SELECT array_agg(x / vector_norm(v) ORDER BY i)
+    FROM unnest(v::real[]) WITH ORDINALITY AS t(x, i)
+)::vector, samples, now()
+FROM averaged
+WHERE vector_norm(v) > 0
+ON CONFLICT (employee_id) DO UPDATE SET
+    centroid = EXCLUDED.centroid,
+    sample_count = EXCLUDED.sample_count,
+    updated_at = EXCLUDED.updated_at;
+
+DELETE FROM attendance_employeefacecentroid WHERE vector_norm(centroid) = 0;
+
+UPDATE attendance_employeefacecentroid
+SET centroid = (
+    SELECT array_agg(x / vector_norm(centroid) ORDER BY i)
+    FROM unnest(centroid::real[]) WITH ORDINALITY AS t(x, i)
+)::vector
+WHERE abs(vector_norm(centroid) - 1) > 1e-6;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0016_employee_face_sample_count"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="employeefacecentroid",
+            name="employee_centroid_hnsw_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="employeefaceembedding",
+            name="employee_emb_hnsw_idx",
+        ),
+        migrations.RunSQL(NORMALIZE_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name="employeefacecentroid",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["centroid"],
+                m=16,
+                name="employee_centroid_hnsw_idx",
+                opclasses=["vector_ip_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="employeefaceembedding",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="employee_emb_hnsw_idx",
+                opclasses=["vector_ip_ops"],
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="employeefacecentroid",
+            constraint=models.CheckConstraint(
+                condition=django.db.models.lookups.Range(
+                    attendance.models.VectorNorm("centroid"), (0.9999, 1.0001)
+                ),
+                name="employee_centroid_unit_norm",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="employeefaceembedding",
+            constraint=models.CheckConstraint(
+                condition=django.db.models.lookups.Range(
+                    attendance.models.VectorNorm("embedding"), (0.9999, 1.0001)
+                ),
+                name="employee_emb_unit_norm",
+            ),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0017_unit_norm_inner_product"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PushNotificationOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("is_check_in", models.BooleanField(verbose_name="Check-in")),
+                (
+                    "time_str",
+                    models.CharField(max_length=5, verbose_name="Giờ chấm công"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Chờ gửi"),
+                            ("SENT", "Đã gửi"),
+                            ("FAILED", "Gửi thất bại"),
+                        ],
+                        default="PENDING",
+                        max_length=10,
+                        verbose_name="Trạng thái",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="Số lần gửi"),
+                ),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Lần gửi tiếp theo",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True, default="", verbose_name="Lỗi gần nhất"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "employee",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="attendance.employee",
+                        verbose_name="Nhân viên",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Push Notification Outbox",
+                "verbose_name_plural": "Push Notification Outbox",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "PENDING")),
+                        fields=["next_attempt_at"],
+                        name="push_outbox_pending_idx",
+                    ),
+                    models.Index(
+                        fields=["status", "created_at"], name="push_outbox_status_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0018_pushnotificationoutbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExpoPushTicket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "ticket_id",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="Ticket ID"
+                    ),
+                ),
+                (
+                    "push_token",
+                    models.CharField(max_length=255, verbose_name="Expo Push Token"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                "verbose_name": "Expo Push Ticket",
+                "verbose_name_plural": "Expo Push Tickets",
+            },
+        ),
+    ]
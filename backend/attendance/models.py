@@ -1,9 +1,41 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import numpy as np
 import json
-from pgvector.django import VectorField
+from pgvector.django import VectorField, BitField, HnswIndex
+
+# Sai số cho phép của độ dài embedding đã chuẩn hóa L2 (float32 lệch cỡ 1e-7)
+UNIT_NORM_TOLERANCE = 1e-4
+
+
+class VectorNorm(models.Func):
+    """Độ dài L2 của vector (hàm vector_norm của pgvector)"""
+    function = 'vector_norm'
+    output_field = models.FloatField()
+
+
+def unit_norm_constraint(field, name):
+    """CHECK: vector đã chuẩn hóa L2 (để truy vấn bằng tích vô hướng <#> thay cho cosine)"""
+    return models.CheckConstraint(
+        condition=models.lookups.Range(VectorNorm(field), (1 - UNIT_NORM_TOLERANCE, 1 + UNIT_NORM_TOLERANCE)),
+        name=name,
+    )
+
+
+def normalize_embedding(embedding):
+    """Chuẩn hóa L2 một embedding, trả về mảng float32; raise ValueError nếu vector bằng 0"""
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    if not np.isfinite(norm) or norm == 0:
+        raise ValueError('Embedding khuôn mặt không hợp lệ (độ dài bằng 0)')
+    return vector / norm
+
+def notify_face_gallery_on_commit():
+    """Báo gallery khuôn mặt trong bộ nhớ đọc nhật ký thay đổi sau khi transaction hiện tại commit"""
+    from .face_recognition.gallery import notify_face_gallery_changed
+    transaction.on_commit(notify_face_gallery_changed)
+
 
 class Department(models.Model):
     """Model quản lý phòng ban"""
@@ -68,6 +100,9 @@ class Employee(models.Model):
     position = models.CharField(max_length=100, default='Nhân viên', verbose_name="Chức vụ")
     join_date = models.DateField(default=timezone.now, verbose_name="Ngày vào làm")
     face_embeddings = models.TextField(null=True, blank=True)  # Store multiple face embeddings as JSON
+    # Số mẫu khuôn mặt trong EmployeeFaceEmbedding, cập nhật cùng transaction với các mẫu
+    # để danh sách nhân viên biết ai đã đăng ký khuôn mặt mà không phải truy vấn từng người
+    face_sample_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name="Số mẫu khuôn mặt")
 
     # Trạng thái làm việc tổng thể
     work_status = models.CharField(
@@ -91,6 +126,15 @@ class Employee(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Ghi nhớ trạng thái ban đầu để biết khi nào gallery khuôn mặt cần nạp lại
+        self._gallery_state = self._get_gallery_state()
+
+    def _get_gallery_state(self):
+        # Đọc qua __dict__ để không kích hoạt truy vấn khi field bị defer
+        return (self.__dict__.get('work_status'), self.__dict__.get('is_active'))
+
     def save(self, *args, **kwargs):
         # Tự động cập nhật current_status dựa trên work_status
         if self.work_status == 'TERMINATED':
@@ -103,20 +147,66 @@ class Employee(models.Model):
             if not self.pk:
                 self.current_status = 'NOT_IN'
 
+        is_new = self.pk is None
         super().save(*args, **kwargs)
 
+        state = self._get_gallery_state()
+        if not is_new and state != self._gallery_state:
+            self._record_gallery_change()
+        self._gallery_state = state
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        FaceGalleryChange.record(pk)
+        return result
+
+    @property
+    def has_face(self):
+        return self.face_sample_count > 0
+
+    def _set_face_sample_count(self, count):
+        Employee.objects.filter(pk=self.pk).update(face_sample_count=count)
+        self.face_sample_count = count
+
+    def _record_gallery_change(self):
+        """Ghi nhật ký thay đổi gallery cho nhân viên này (các worker chỉ nạp lại mẫu của nhân viên đã đổi)"""
+        FaceGalleryChange.record(self.pk)
+
     def set_face_embeddings(self, embedding_arrays):
-        """Lưu list của các embedding vào bảng phụ bằng pgvector"""
-        # Xóa các embedding cũ
-        self.face_embeddings_vector.all().delete()
-        
-        # Thêm các embedding mới
-        for emb in embedding_arrays:
-            if hasattr(emb, 'tolist'):
-                emb_list = emb.tolist()
-            else:
-                emb_list = emb
-            EmployeeFaceEmbedding.objects.create(employee=self, embedding=emb_list)
+        """Lưu list của các embedding vào bảng phụ bằng pgvector.
+
+        Thay toàn bộ mẫu cũ trong một transaction bằng một lệnh bulk_create
+        (số truy vấn không phụ thuộc số mẫu). bulk_create không gọi save()
+        nên việc chuẩn hóa L2 và embedding_binary được làm sẵn ở đây.
+        """
+        rows = [normalize_embedding(emb) for emb in embedding_arrays]
+        with transaction.atomic():
+            self.face_embeddings_vector.all().delete()
+            EmployeeFaceEmbedding.objects.bulk_create([
+                EmployeeFaceEmbedding(
+                    employee=self,
+                    embedding=row.tolist(),
+                    embedding_binary=EmployeeFaceEmbedding.quantize_binary(row),
+                )
+                for row in rows
+            ])
+            self._update_face_centroid(rows)
+            self._set_face_sample_count(len(rows))
+            self._record_gallery_change()
+
+    def _update_face_centroid(self, embedding_arrays):
+        """Cập nhật embedding đại diện (centroid) dùng cho bước lọc sơ bộ khi so khớp"""
+        if len(embedding_arrays) == 0:
+            EmployeeFaceCentroid.objects.filter(employee=self).delete()
+            return
+        EmployeeFaceCentroid.objects.update_or_create(
+            employee=self,
+            defaults={
+                'centroid': EmployeeFaceCentroid.compute_centroid(embedding_arrays).tolist(),
+                'sample_count': len(embedding_arrays),
+            },
+        )
 
     def get_face_embeddings(self):
         """Lấy list của các embedding từ bảng phụ"""
@@ -125,8 +215,12 @@ class Employee(models.Model):
 
     def clear_face_embeddings(self):
         """Xóa tất cả face embeddings của nhân viên"""
-        self.face_embeddings_vector.all().delete()
-        self.save()
+        with transaction.atomic():
+            self.face_embeddings_vector.all().delete()
+            EmployeeFaceCentroid.objects.filter(employee=self).delete()
+            self.face_sample_count = 0
+            self.save()
+            self._record_gallery_change()
         return True
 
     def update_current_status(self, is_checking_in):
@@ -158,20 +252,167 @@ class EmployeeFaceEmbedding(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='face_embeddings_vector', verbose_name="Nhân viên")
     # TFLite/ONNX embedding size is normally around 128 or 512, our ONNX model output says 512
     # Adjust dimensions if you know the exact size of your embedding. 
+    # Luôn được chuẩn hóa L2 khi ghi (CHECK employee_emb_unit_norm) nên cosine = tích vô hướng
     embedding = VectorField(dimensions=512, verbose_name="Face Embedding Vector")
+    # Bản lượng tử hóa nhị phân (1 bit/chiều = 64 byte) dùng để lọc ứng viên
+    # bằng khoảng cách Hamming trước khi tính lại cosine chính xác trên `embedding`
+    embedding_binary = BitField(length=512, null=True, blank=True, verbose_name="Face Embedding (binary)")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = "Face Embedding"
         verbose_name_plural = "Face Embeddings"
         indexes = [
-            # Index for faster cosine distance queries
-            # models.Index(fields=['embedding'], name='employee_emb_idx', opclasses=['vector_cosine_ops'])  # HNSW or IVFFlat recommended for large scale, but fine without for now
+            # HNSW index cho truy vấn MaxInnerProduct (<#>, ANN). Độ chính xác/tốc độ
+            # được điều chỉnh theo từng truy vấn qua hnsw.ef_search (FACE_ANN_EF_SEARCH).
+            # IVFFlat là phương án thay thế, tạo bằng: manage.py face_ann_index --create-ivfflat
+            HnswIndex(
+                name='employee_emb_hnsw_idx',
+                fields=['embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_ip_ops'],
+            ),
         ]
+        constraints = [
+            unit_norm_constraint('embedding', 'employee_emb_unit_norm'),
+        ]
+
+    @staticmethod
+    def quantize_binary(embedding):
+        """Lượng tử hóa nhị phân: bit i = 1 nếu thành phần i > 0, trả về chuỗi '0101...' cho BitField"""
+        bits = (np.asarray(embedding, dtype=np.float32) > 0).astype(np.uint8) + ord('0')
+        return bits.tobytes().decode('ascii')
+
+    def save(self, *args, **kwargs):
+        if self.embedding is not None:
+            self.embedding = normalize_embedding(self.embedding).tolist()
+            # Luôn tính lại từ embedding: bit dấu cũ làm bước lọc Hamming bỏ sót mẫu đúng
+            self.embedding_binary = self.quantize_binary(self.embedding)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'embedding' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'embedding_binary'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Embedding for {self.employee.get_full_name()}"
 
+class EmployeeFaceCentroid(models.Model):
+    """Embedding đại diện của mỗi nhân viên: trung bình các mẫu đã chuẩn hóa, chuẩn hóa lại"""
+    employee = models.OneToOneField(Employee, on_delete=models.CASCADE, related_name='face_centroid', verbose_name="Nhân viên")
+    centroid = VectorField(dimensions=512, verbose_name="Face Centroid Vector")
+    sample_count = models.PositiveIntegerField(default=0, verbose_name="Số mẫu")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Face Centroid"
+        verbose_name_plural = "Face Centroids"
+        indexes = [
+            HnswIndex(
+                name='employee_centroid_hnsw_idx',
+                fields=['centroid'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_ip_ops'],
+            ),
+        ]
+        constraints = [
+            unit_norm_constraint('centroid', 'employee_centroid_unit_norm'),
+        ]
+
+    @staticmethod
+    def compute_centroid(embedding_arrays):
+        matrix = np.asarray([np.asarray(e, dtype=np.float32) for e in embedding_arrays], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroid = (matrix / norms).mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        return centroid / norm if norm > 0 else centroid
+
+    def __str__(self):
+        return f"Centroid for {self.employee.get_full_name()}"
+
+class FaceGalleryChange(models.Model):
+    """Nhật ký thay đổi gallery khuôn mặt: nhân viên có mẫu hoặc trạng thái vừa thay đổi.
+
+    Ghi trong cùng transaction với thay đổi. txid là transaction id PostgreSQL
+    của transaction ghi, dùng để worker đọc nhật ký không bỏ sót các dòng
+    commit không theo thứ tự id (xem face_recognition/changes.py).
+    """
+    # Không dùng ForeignKey: dòng nhật ký vẫn còn sau khi nhân viên bị xóa
+    employee_pk = models.BigIntegerField(verbose_name="ID nhân viên")
+    txid = models.BigIntegerField(db_default=models.Func(function='txid_current', output_field=models.BigIntegerField()))
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Face Gallery Change"
+        verbose_name_plural = "Face Gallery Changes"
+        indexes = [models.Index(fields=['txid'], name='face_gallery_change_txid_idx')]
+
+    @classmethod
+    def record(cls, employee_pk):
+        """Ghi một thay đổi và báo gallery trong tiến trình hiện tại kiểm tra nhật ký sau commit"""
+        cls.objects.create(employee_pk=employee_pk)
+        notify_face_gallery_on_commit()
+
+    def __str__(self):
+        return f"Gallery change #{self.pk} (employee {self.employee_pk})"
+
+class PushNotificationOutbox(models.Model):
+    """Hàng đợi bền của push notification chấm công (transactional outbox).
+
+    Dòng được ghi cùng câu lệnh với bản ghi chấm công nên không mất thông báo
+    khi tiến trình web khởi động lại. Worker (manage.py process_push_outbox)
+    nhận từng lô bằng SELECT ... FOR UPDATE SKIP LOCKED, gửi và thử lại với
+    backoff lũy thừa (xem push/outbox.py).
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Chờ gửi'),
+        ('SENT', 'Đã gửi'),
+        ('FAILED', 'Gửi thất bại'),
+    ]
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, verbose_name="Nhân viên")
+    is_check_in = models.BooleanField(verbose_name="Check-in")
+    time_str = models.CharField(max_length=5, verbose_name="Giờ chấm công")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', verbose_name="Trạng thái")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Số lần gửi")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Lần gửi tiếp theo")
+    last_error = models.TextField(blank=True, default='', verbose_name="Lỗi gần nhất")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Push Notification Outbox"
+        verbose_name_plural = "Push Notification Outbox"
+        indexes = [
+            # Worker chỉ quét các dòng chờ gửi, theo thứ tự đến hạn
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='PENDING'),
+                         name='push_outbox_pending_idx'),
+            models.Index(fields=['status', 'created_at'], name='push_outbox_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Push #{self.pk} ({self.employee_id}, {self.status})"
+
+class ExpoPushTicket(models.Model):
+    """Ticket Expo đã nhận cho một thông báo, chờ kiểm tra receipt.
+
+    Expo chỉ xác nhận việc chuyển tới APNs/FCM qua receipt (có sau vài phút,
+    giữ trong 24 giờ). manage.py check_expo_receipts lấy receipt theo lô,
+    xóa token DeviceNotRegistered và xóa ticket đã kiểm tra (xem push/expo.py).
+    """
+    ticket_id = models.CharField(max_length=64, unique=True, verbose_name="Ticket ID")
+    push_token = models.CharField(max_length=255, verbose_name="Expo Push Token")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Expo Push Ticket"
+        verbose_name_plural = "Expo Push Tickets"
+
+    def __str__(self):
+        return f"Expo ticket {self.ticket_id}"
+
 class AttendanceRecord(models.Model):
     STATUS_CHOICES = [
         ('ON_TIME', 'Đúng giờ'),
@@ -0,0 +1,226 @@
+"""
+Gửi push notification bằng một pool worker cố định trong mỗi tiến trình.
+
+Thay vì mỗi lượt quét tạo một thread mới (không giới hạn số thread khi cao
+điểm), các tác vụ gửi được đưa vào một hàng đợi có giới hạn và xử lý bởi
+`workers` thread cố định. Khi hàng đợi đầy:
+  - 'drop': bỏ thông báo (đếm trong dropped_total), request không bị chậm;
+  - 'inline': chạy gửi ngay trong thread gọi (backpressure lên request).
+send có thể trả về một Future (thông báo đã vào một MicroBatcher gom lô, xem
+send_attendance_notification): worker nhận tác vụ tiếp ngay, thông báo được
+tính là xong khi Future hoàn tất. Nhờ vậy một cửa sổ gom lô nhận được thông
+báo từ toàn bộ hàng đợi chứ không chỉ `workers` tác vụ đang chạy. Thông báo
+đang chờ trong batcher vẫn chiếm chỗ: tổng số thông báo chưa xong không vượt
+quá max_queue + workers, nên khi nhà cung cấp chậm chính sách tràn vẫn áp dụng
+thay vì hàng đợi của batcher phình ra không giới hạn.
+Khi tiến trình thoát, hàng đợi được gửi hết trong tối đa PUSH_DISPATCH_SHUTDOWN_TIMEOUT giây.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from ..metrics import METRICS_WINDOW, summarize
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop', 'inline')
+
+_dispatcher_instance = None
+_dispatcher_instance_lock = threading.Lock()
+
+
+class NotificationDispatcher:
+    def __init__(self, workers=4, max_queue=1000, overflow='drop', name='push'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow phải là một trong: {', '.join(OVERFLOW_POLICIES)}")
+        self.overflow = overflow
+        self.name = name
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        # Thông báo chưa xong tối đa: hàng đợi đầy và mỗi worker đang gửi một thông báo
+        self._capacity = self._queue.maxsize + max(1, workers)
+        self._closed = False
+        self._idle = threading.Condition()
+        self._unfinished = 0
+
+        self._metrics_lock = threading.Lock()
+        self._submitted_total = 0
+        self._sent_total = 0
+        self._failed_total = 0
+        self._dropped_total = 0
+        self._inline_total = 0
+        self._wait_ms = deque(maxlen=METRICS_WINDOW)
+        self._send_ms = deque(maxlen=METRICS_WINDOW)
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f'{name}-dispatcher-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, send, *args):
+        """Đưa send(*args) vào hàng đợi. Trả về False nếu thông báo bị bỏ (hàng đợi đầy hoặc đã dừng)"""
+        with self._metrics_lock:
+            self._submitted_total += 1
+        # Kiểm tra _closed và đưa vào hàng đợi dưới cùng một khóa với close(): không
+        # tác vụ nào lọt vào sau tín hiệu dừng (sẽ không được gửi và wait_idle chờ mãi)
+        with self._idle:
+            closed = self._closed
+            if not closed and self._unfinished < self._capacity:
+                try:
+                    self._queue.put_nowait((send, args, time.perf_counter()))
+                    self._unfinished += 1
+                    return True
+                except queue.Full:
+                    pass
+        if closed:
+            self._count_dropped()
+            return False
+        if self.overflow == 'drop':
+            self._count_dropped()
+            logger.warning(f'[{self.name}] Hàng đợi thông báo đầy, bỏ một thông báo')
+            return False
+        with self._metrics_lock:
+            self._inline_total += 1
+        self._run(send, args, time.perf_counter(), wait=True)
+        return True
+
+    def wait_idle(self, timeout=None):
+        """Chờ đến khi mọi thông báo đã nhận được gửi xong; False nếu hết thời gian"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def close(self, timeout=None):
+        """Ngừng nhận thông báo mới và gửi hết hàng đợi (tối đa `timeout` giây)"""
+        with self._idle:
+            if self._closed:
+                return
+            self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in self._workers:
+            # Hàng đợi đầy và worker bị treo: không chờ quá `timeout` để đặt tín hiệu dừng
+            try:
+                self._queue.put(None, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for worker in self._workers:
+            worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        # Các thông báo đã chuyển sang batcher nhưng lô chưa gửi xong
+        self.wait_idle(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        pending = self._queue.qsize()
+        if pending:
+            logger.warning(f'[{self.name}] Dừng khi còn {pending} thông báo chưa gửi')
+
+    def _count_dropped(self):
+        with self._metrics_lock:
+            self._dropped_total += 1
+
+    def _task_done(self):
+        with self._idle:
+            self._unfinished -= 1
+            if self._unfinished == 0:
+                self._idle.notify_all()
+
+    def _run(self, send, args, enqueued_at, wait=False):
+        """Chạy send(*args); trả về Future nếu send gom lô và không chờ (wait=False), ngược lại None"""
+        started = time.perf_counter()
+        try:
+            result = send(*args)
+        except Exception as e:
+            logger.error(f'[{self.name}] Lỗi khi gửi thông báo: {e}', exc_info=True)
+            result = False
+        if isinstance(result, Future):
+            if not wait:
+                result.add_done_callback(lambda future: self._finish(self._future_ok(future), enqueued_at, started))
+                return result
+            result = self._future_ok(result)
+        self._finish(result is not False, enqueued_at, started)
+        return None
+
+    def _future_ok(self, future):
+        try:
+            return future.result() is not False
+        except Exception as e:
+            logger.error(f'[{self.name}] Lỗi khi gửi thông báo: {e}', exc_info=True)
+            return False
+
+    def _finish(self, ok, enqueued_at, started):
+        finished = time.perf_counter()
+        with self._metrics_lock:
+            if ok:
+                self._sent_total += 1
+            else:
+                self._failed_total += 1
+            self._wait_ms.append((started - enqueued_at) * 1000)
+            self._send_ms.append((finished - started) * 1000)
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            pending = None
+            try:
+                pending = self._run(*task)
+            finally:
+                # Worker dùng lâu dài: trả connection database (nếu tác vụ có truy vấn)
+                close_old_connections()
+                if pending is None:
+                    self._task_done()
+                else:
+                    pending.add_done_callback(lambda future: self._task_done())
+
+    def stats(self):
+        """Metrics: độ sâu hàng đợi, số thông báo theo kết quả, thời gian chờ và thời gian gửi"""
+        with self._metrics_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue': self._queue.maxsize,
+                'in_flight': self._unfinished,
+                'workers': len(self._workers),
+                'overflow': self.overflow,
+                'submitted_total': self._submitted_total,
+                'sent_total': self._sent_total,
+                'failed_total': self._failed_total,
+                'dropped_total': self._dropped_total,
+                'inline_total': self._inline_total,
+                'wait_ms': summarize(self._wait_ms),
+                'send_ms': summarize(self._send_ms),
+            }
+
+
+def get_notification_dispatcher():
+    """Dispatcher dùng chung trong tiến trình (tạo khi gửi thông báo đầu tiên)"""
+    global _dispatcher_instance
+    if _dispatcher_instance is None:
+        with _dispatcher_instance_lock:
+            if _dispatcher_instance is None:
+                _dispatcher_instance = NotificationDispatcher(
+                    workers=settings.PUSH_DISPATCH_WORKERS,
+                    max_queue=settings.PUSH_DISPATCH_QUEUE_SIZE,
+                    overflow=settings.PUSH_DISPATCH_OVERFLOW,
+                )
+                atexit.register(shutdown_notification_dispatcher)
+    return _dispatcher_instance
+
+
+def shutdown_notification_dispatcher(timeout=None):
+    """Gửi hết các thông báo còn trong hàng đợi rồi dừng dispatcher của tiến trình"""
+    global _dispatcher_instance
+    with _dispatcher_instance_lock:
+        dispatcher, _dispatcher_instance = _dispatcher_instance, None
+    if dispatcher is not None:
+        dispatcher.close(settings.PUSH_DISPATCH_SHUTDOWN_TIMEOUT if timeout is None else timeout)
+
+
+def notification_dispatcher_stats():
+    """Metrics của dispatcher đã khởi tạo trong tiến trình, None nếu chưa có"""
+    dispatcher = _dispatcher_instance
+    return dispatcher.stats() if dispatcher is not None else None
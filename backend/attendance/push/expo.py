@@ -0,0 +1,270 @@
+"""
+Client Expo Push API dùng chung cho cả tiến trình.
+
+Một requests.Session giữ connection keep-alive tới exp.host (pool
+EXPO_POOL_SIZE connection cho các thread dispatcher) thay vì mở TCP/TLS mới
+cho mỗi thông báo. Thông báo được gửi theo lô tối đa 100 message mỗi POST
+(giới hạn của Expo); mỗi message nhận lại một ticket. Ticket thành công được
+lưu vào ExpoPushTicket để check_receipts lấy receipt theo lô (tối đa 1000 id
+mỗi POST) sau EXPO_RECEIPT_DELAY giây. Token bị Expo báo DeviceNotRegistered
+(ngay trong ticket hoặc trong receipt) được xóa khỏi nhân viên bằng một lệnh
+UPDATE. Như FCM, thông báo từ hàng đợi dispatcher được gom thành một POST qua
+MicroBatcher khi PUSH_EXPO_BATCH_WINDOW_MS > 0.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from ..face_recognition.batching import MicroBatcher
+from .messages import attendance_content, clear_push_tokens, release_db_connections
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn của Expo cho một lần gửi / một lần lấy receipt
+EXPO_BATCH_LIMIT = 100
+EXPO_RECEIPT_BATCH_LIMIT = 1000
+
+# Expo chỉ giữ receipt trong 24 giờ
+RECEIPT_RETENTION = timedelta(hours=24)
+
+# Lỗi cho biết token không thể nhận thông báo nữa
+INVALID_TOKEN_ERRORS = {'DeviceNotRegistered'}
+
+_client_instance = None
+_client_instance_lock = threading.Lock()
+
+_batcher_instance = None
+_batcher_instance_lock = threading.Lock()
+
+
+class ExpoPushClient:
+    """Gửi message và lấy receipt qua Expo Push API trên một Session dùng lại connection"""
+
+    def __init__(self, base_url, access_token='', pool_size=10, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Content-Type': 'application/json',
+        })
+        if access_token:
+            self.session.headers['Authorization'] = f'Bearer {access_token}'
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._messages = 0
+        self._errors = 0
+
+    def _post(self, path, payload):
+        with self._lock:
+            self._requests += 1
+        response = self.session.post(f'{self.base_url}/{path}', json=payload, timeout=self.timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code != 200 or 'data' not in body:
+            errors = body.get('errors') or [{'message': response.text[:200]}]
+            raise requests.HTTPError(
+                f"Expo {path} HTTP {response.status_code}: {errors[0].get('message')}", response=response)
+        return body['data']
+
+    def send(self, messages):
+        """Gửi các message, trả về list ticket theo thứ tự (lô lỗi thì mọi ticket của lô là lỗi)"""
+        tickets = []
+        for start in range(0, len(messages), EXPO_BATCH_LIMIT):
+            chunk = messages[start:start + EXPO_BATCH_LIMIT]
+            try:
+                data = self._post('send', chunk)
+                if len(data) != len(chunk):
+                    raise ValueError(f'Expo trả về {len(data)} ticket cho {len(chunk)} message')
+            except (requests.RequestException, ValueError) as e:
+                logger.error(f'[expo] Gửi lô {len(chunk)} thông báo thất bại: {e}')
+                data = [{'status': 'error', 'message': str(e)}] * len(chunk)
+                with self._lock:
+                    self._errors += 1
+            with self._lock:
+                self._messages += len(chunk)
+            tickets.extend(data)
+        return tickets
+
+    def get_receipts(self, ticket_ids):
+        """Receipt của các ticket: {ticket_id: receipt}. Ticket chưa có receipt không có trong kết quả"""
+        receipts = {}
+        for start in range(0, len(ticket_ids), EXPO_RECEIPT_BATCH_LIMIT):
+            chunk = ticket_ids[start:start + EXPO_RECEIPT_BATCH_LIMIT]
+            try:
+                receipts.update(self._post('getReceipts', {'ids': chunk}))
+            except (requests.RequestException, ValueError) as e:
+                logger.error(f'[expo] Lấy receipt của {len(chunk)} ticket thất bại: {e}')
+                with self._lock:
+                    self._errors += 1
+        return receipts
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self._requests, 'messages': self._messages, 'errors': self._errors}
+
+    def close(self):
+        self.session.close()
+
+
+def get_expo_client():
+    global _client_instance
+    if _client_instance is None:
+        with _client_instance_lock:
+            if _client_instance is None:
+                _client_instance = ExpoPushClient(
+                    settings.EXPO_PUSH_API_URL,
+                    access_token=settings.EXPO_ACCESS_TOKEN,
+                    pool_size=settings.EXPO_POOL_SIZE,
+                    timeout=settings.EXPO_TIMEOUT,
+                )
+    return _client_instance
+
+
+def close_expo_client():
+    """Đóng client hiện tại; lần gọi get_expo_client sau tạo client mới theo settings"""
+    global _client_instance
+    with _client_instance_lock:
+        client, _client_instance = _client_instance, None
+    if client is not None:
+        client.close()
+
+
+def expo_client_stats():
+    """Metrics của Expo client đã khởi tạo trong tiến trình, None nếu chưa có"""
+    client = _client_instance
+    return client.stats() if client is not None else None
+
+
+def build_expo_message(push_token, title, body, data=None):
+    return {
+        'to': push_token,
+        'sound': 'default',
+        'title': title,
+        'body': body,
+        'data': data or {},
+        'priority': 'high',
+        'channelId': 'attendance',
+    }
+
+
+def _ticket_error(ticket):
+    return (ticket.get('details') or {}).get('error')
+
+
+def send_expo_batch(notifications):
+    """Gửi các thông báo (employee, is_check_in, time_str) qua Expo, trả về list bool theo thứ tự"""
+    from ..models import ExpoPushTicket
+
+    if not notifications:
+        return []
+    messages = [
+        build_expo_message(employee.expo_push_token, *attendance_content(employee, is_check_in, time_str))
+        for employee, is_check_in, time_str in notifications
+    ]
+    tickets = get_expo_client().send(messages)
+
+    results = []
+    pending = []
+    invalid_tokens = set()
+    for (employee, _, _), ticket in zip(notifications, tickets):
+        ok = ticket.get('status') == 'ok'
+        results.append(ok)
+        if ok:
+            if ticket.get('id'):
+                pending.append(ExpoPushTicket(ticket_id=ticket['id'], push_token=employee.expo_push_token))
+            continue
+        logger.warning(f"[expo] Không gửi được cho {employee.employee_id}: {ticket.get('message')}")
+        if _ticket_error(ticket) in INVALID_TOKEN_ERRORS:
+            invalid_tokens.add(employee.expo_push_token)
+
+    if pending:
+        ExpoPushTicket.objects.bulk_create(pending, ignore_conflicts=True)
+    cleared = clear_push_tokens(invalid_tokens)
+    if cleared:
+        logger.info(f'[expo] Đã xóa {cleared} push token không hợp lệ')
+    return results
+
+
+def check_receipts(min_age=None):
+    """Lấy receipt của các ticket đủ cũ, xóa token chết và ticket đã xong.
+
+    Trả về số ticket theo kết quả: checked, ok, error, pruned (token đã xóa), expired
+    (quá 24 giờ mà không có receipt).
+    """
+    from ..models import ExpoPushTicket
+
+    if min_age is None:
+        min_age = timedelta(seconds=settings.EXPO_RECEIPT_DELAY)
+    now = timezone.now()
+    counts = {'checked': 0, 'ok': 0, 'error': 0, 'pruned': 0, 'expired': 0}
+    client = get_expo_client()
+
+    last_pk = 0
+    while True:
+        tickets = list(
+            ExpoPushTicket.objects.filter(created_at__lte=now - min_age, pk__gt=last_pk)
+            .order_by('pk').values_list('pk', 'ticket_id', 'push_token')[:EXPO_RECEIPT_BATCH_LIMIT]
+        )
+        if not tickets:
+            break
+        last_pk = tickets[-1][0]
+        receipts = client.get_receipts([ticket_id for _, ticket_id, _ in tickets])
+
+        done = []
+        invalid_tokens = set()
+        for pk, ticket_id, push_token in tickets:
+            receipt = receipts.get(ticket_id)
+            if receipt is None:
+                continue
+            done.append(pk)
+            if receipt.get('status') == 'ok':
+                counts['ok'] += 1
+                continue
+            counts['error'] += 1
+            logger.warning(f"[expo] Receipt {ticket_id} lỗi: {receipt.get('message')}")
+            if _ticket_error(receipt) in INVALID_TOKEN_ERRORS:
+                invalid_tokens.add(push_token)
+
+        counts['checked'] += len(tickets)
+        counts['pruned'] += clear_push_tokens(invalid_tokens)
+        ExpoPushTicket.objects.filter(pk__in=done).delete()
+
+    counts['expired'], _ = ExpoPushTicket.objects.filter(created_at__lt=now - RECEIPT_RETENTION).delete()
+    return counts
+
+
+def get_expo_batcher():
+    """MicroBatcher gom thông báo Expo từ hàng đợi dispatcher (None nếu PUSH_EXPO_BATCH_WINDOW_MS = 0)"""
+    global _batcher_instance
+    if settings.PUSH_EXPO_BATCH_WINDOW_MS <= 0:
+        return None
+    if _batcher_instance is None:
+        with _batcher_instance_lock:
+            if _batcher_instance is None:
+                # Lô có truy vấn database (lưu ticket, xóa token) trong thread của batcher
+                _batcher_instance = MicroBatcher(
+                    release_db_connections(send_expo_batch),
+                    max_batch_size=EXPO_BATCH_LIMIT,
+                    max_wait_ms=settings.PUSH_EXPO_BATCH_WINDOW_MS,
+                    name='expo',
+                )
+    return _batcher_instance
+
+
+def expo_batcher_stats():
+    """Metrics của Expo batcher đã khởi tạo trong tiến trình, None nếu chưa có"""
+    batcher = _batcher_instance
+    return batcher.stats() if batcher is not None else None
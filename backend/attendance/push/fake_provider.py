@@ -0,0 +1,206 @@
+"""
+Nhà cung cấp push giả lập cho kiểm thử tải đường gửi thông báo.
+
+FakePushProvider mô phỏng độ trễ mỗi request (latency ± jitter), tỷ lệ lỗi
+ngẫu nhiên và giới hạn tốc độ (token bucket, message/giây) và ghi lại thời
+điểm từng thông báo được nhận. Có hai mặt:
+
+- FakeExpoServer: HTTP server tương thích Expo Push API (/send, /getReceipts).
+  Trỏ EXPO_PUSH_API_URL tới server.url (manage.py run_fake_push_server chạy
+  server riêng). Hết quota thì trả 429 cho cả request như Expo.
+- send_each: thay messaging.send_each khi PUSH_FCM_TRANSPORT = 'fake'. Mỗi
+  message vượt quota nhận QuotaExceededError, lỗi ngẫu nhiên là UnavailableError.
+
+Cấu hình mặc định lấy từ các setting PUSH_FAKE_*. Nhà cung cấp dùng chung
+trong tiến trình chỉ đếm; test và lệnh benchmark bật keep_deliveries để ghi
+thời điểm nhận từng thông báo.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from firebase_admin import exceptions, messaging
+
+_provider_instance = None
+_provider_instance_lock = threading.Lock()
+
+
+class FakePushProvider:
+    """Độ trễ, lỗi và giới hạn tốc độ của một nhà cung cấp push giả lập"""
+
+    def __init__(self, latency_ms=50, jitter_ms=0, error_rate=0.0, rate_limit=0, seed=None, keep_deliveries=True):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.keep_deliveries = keep_deliveries
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = float(rate_limit)
+        self._refilled_at = time.monotonic()
+        self._stats = {'requests': 0, 'messages': 0, 'delivered': 0, 'errors': 0, 'throttled': 0}
+        self.deliveries = []
+
+    def _take(self, count, all_or_nothing):
+        """Số message được nhận trong quota (token bucket, tối đa rate_limit message tích lũy)"""
+        if self.rate_limit <= 0:
+            return count
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled_at) * self.rate_limit)
+        self._refilled_at = now
+        if all_or_nothing:
+            # Cả request được nhận khi còn quota; phần vượt trừ vào quota của các giây sau
+            if self._tokens < 1:
+                return 0
+            self._tokens -= count
+            return count
+        taken = max(0, min(count, int(self._tokens)))
+        self._tokens -= taken
+        return taken
+
+    def simulate(self, count, all_or_nothing=False):
+        """Chờ độ trễ của một request rồi trả về trạng thái từng message: 'ok', 'error' hoặc 'throttled'"""
+        with self._lock:
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        with self._lock:
+            admitted = self._take(count, all_or_nothing)
+            statuses = [
+                'error' if self._random.random() < self.error_rate else 'ok'
+                for _ in range(admitted)
+            ] + ['throttled'] * (count - admitted)
+            self._stats['requests'] += 1
+            self._stats['messages'] += count
+            self._stats['errors'] += statuses.count('error')
+            self._stats['throttled'] += count - admitted
+        return statuses
+
+    def record(self, data_items, statuses):
+        """Ghi thời điểm nhận (time.perf_counter) của các message thành công theo data['employee_id']
+
+        keep_deliveries = False (server chạy lâu) thì chỉ đếm.
+        """
+        received = time.perf_counter()
+        delivered = [(data.get('employee_id'), received)
+                     for data, status in zip(data_items, statuses) if status == 'ok']
+        with self._lock:
+            if self.keep_deliveries:
+                self.deliveries.extend(delivered)
+            self._stats['delivered'] += len(delivered)
+
+    def send_each(self, messages, dry_run=False, app=None):
+        """Cùng giao diện với firebase_admin.messaging.send_each"""
+        statuses = self.simulate(len(messages))
+        self.record([message.data or {} for message in messages], statuses)
+        responses = []
+        for status in statuses:
+            if status == 'ok':
+                responses.append(messaging.SendResponse({'name': f'projects/fake/messages/{uuid.uuid4().hex}'}, None))
+            elif status == 'throttled':
+                responses.append(messaging.SendResponse(None, messaging.QuotaExceededError('Quota exceeded (fake)')))
+            else:
+                responses.append(messaging.SendResponse(None, exceptions.UnavailableError('Unavailable (fake)')))
+        return messaging.BatchResponse(responses)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class _FakeExpoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        provider = self.server.provider
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        except ValueError:
+            return self.reply(400, {'errors': [{'code': 'VALIDATION_ERROR', 'message': 'Invalid JSON'}]})
+
+        if self.path.endswith('/send'):
+            messages = payload if isinstance(payload, list) else [payload]
+            statuses = provider.simulate(len(messages), all_or_nothing=True)
+            if statuses and statuses[0] == 'throttled':
+                return self.reply(429, {'errors': [{'code': 'TOO_MANY_REQUESTS',
+                                                    'message': 'Rate limit exceeded (fake)'}]})
+            provider.record([message.get('data') or {} for message in messages], statuses)
+            return self.reply(200, {'data': [
+                {'status': 'ok', 'id': str(uuid.uuid4())} if status == 'ok' else
+                {'status': 'error', 'message': 'Provider error (fake)', 'details': {'error': 'MessageRateExceeded'}}
+                for status in statuses
+            ]})
+        if self.path.endswith('/getReceipts'):
+            return self.reply(200, {'data': {ticket_id: {'status': 'ok'} for ticket_id in payload.get('ids', [])}})
+        self.reply(404, {'errors': [{'code': 'NOT_FOUND', 'message': self.path}]})
+
+    def reply(self, status, body):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class FakeExpoServer:
+    """HTTP server tương thích Expo Push API chạy trong một thread nền"""
+
+    def __init__(self, provider, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), _FakeExpoHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.provider = provider
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/--/api/v2/push'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-expo', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+        self.httpd.server_close()
+
+
+def get_fake_provider():
+    """Nhà cung cấp giả lập dùng chung trong tiến trình, cấu hình theo PUSH_FAKE_*
+
+    Không giữ danh sách deliveries (tiến trình web chạy lâu); đặt
+    provider.keep_deliveries = True khi cần đo từng thông báo.
+    """
+    global _provider_instance
+    if _provider_instance is None:
+        with _provider_instance_lock:
+            if _provider_instance is None:
+                _provider_instance = FakePushProvider(
+                    latency_ms=settings.PUSH_FAKE_LATENCY_MS,
+                    jitter_ms=settings.PUSH_FAKE_JITTER_MS,
+                    error_rate=settings.PUSH_FAKE_ERROR_RATE,
+                    rate_limit=settings.PUSH_FAKE_RATE_LIMIT,
+                    keep_deliveries=False,
+                )
+    return _provider_instance
+
+
+def reset_fake_provider():
+    """Bỏ nhà cung cấp hiện tại; lần gọi get_fake_provider sau tạo mới theo settings"""
+    global _provider_instance
+    with _provider_instance_lock:
+        _provider_instance = None
@@ -0,0 +1,164 @@
+"""
+Gửi FCM theo lô bằng messaging.send_each (tối đa 500 message mỗi lần gọi).
+
+Thông báo của nhiều lượt quét được gom lại (từ một lô outbox, hoặc từ hàng
+đợi dispatcher trong cửa sổ PUSH_FCM_BATCH_WINDOW_MS qua MicroBatcher) nên
+số round-trip tới FCM tăng theo số lô thay vì số lượt quét. Kết quả từng
+message được map lại về nhân viên; token không còn hợp lệ (chưa đăng ký, sai
+sender) được xóa khỏi Employee.expo_push_token bằng một lệnh UPDATE.
+"""
+import logging
+import os
+import threading
+
+from django.conf import settings
+from firebase_admin import credentials, exceptions, messaging
+import firebase_admin
+
+from ..face_recognition.batching import MicroBatcher
+from .messages import attendance_content, clear_push_tokens, release_db_connections
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn của FCM cho một lần send_each
+FCM_BATCH_LIMIT = 500
+
+# Lỗi cho biết token không thể nhận thông báo nữa (gửi lại cũng vô ích). InvalidArgumentError
+# không nằm trong đây: FCM trả lỗi này cả khi nội dung message sai, token vẫn dùng được
+INVALID_TOKEN_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+
+_firebase_app = None
+
+_batcher_instance = None
+_batcher_instance_lock = threading.Lock()
+
+
+def get_firebase_app():
+    global _firebase_app
+    if _firebase_app is None:
+        try:
+            service_account_path = os.path.join(
+                settings.BASE_DIR,
+                'config',
+                'datastoragedemo-99ff9-3abc57b4ec78.json'
+            )
+
+            if os.path.exists(service_account_path):
+                cred = credentials.Certificate(service_account_path)
+                _firebase_app = firebase_admin.initialize_app(cred)
+                print("Firebase Admin SDK initialized from file")
+            else:
+                firebase_creds_json = os.environ.get('FIREBASE_CREDENTIALS')
+                if firebase_creds_json:
+                    import json as json_module
+                    cred_dict = json_module.loads(firebase_creds_json)
+                    cred = credentials.Certificate(cred_dict)
+                    _firebase_app = firebase_admin.initialize_app(cred)
+                    print("Firebase Admin SDK initialized from env var")
+                else:
+                    print(f"Firebase: no service account file ({service_account_path}) and no FIREBASE_CREDENTIALS env var")
+                    return None
+        except Exception as e:
+            print(f"Error initializing Firebase: {e}")
+            return None
+    return _firebase_app
+
+
+def get_fcm_transport():
+    """(send_each, app) để gửi FCM, None nếu Firebase chưa được cấu hình.
+
+    PUSH_FCM_TRANSPORT = 'fake' gửi tới nhà cung cấp giả lập trong tiến trình
+    (push/fake_provider.py) để kiểm thử tải.
+    """
+    if settings.PUSH_FCM_TRANSPORT == 'fake':
+        from .fake_provider import get_fake_provider
+        return get_fake_provider().send_each, None
+    app = get_firebase_app()
+    if app is None:
+        return None
+    return messaging.send_each, app
+
+
+def build_fcm_message(fcm_token, title, body, data=None):
+    return messaging.Message(
+        notification=messaging.Notification(
+            title=title,
+            body=body,
+        ),
+        data=data or {},
+        token=fcm_token,
+        android=messaging.AndroidConfig(
+            priority='high',
+            notification=messaging.AndroidNotification(
+                sound='default',
+                priority='high',
+                channel_id='attendance',
+            ),
+        ),
+    )
+
+
+def send_fcm_batch(notifications):
+    """Gửi các thông báo (employee, is_check_in, time_str) bằng send_each, trả về list bool theo thứ tự"""
+    if not notifications:
+        return []
+    transport = get_fcm_transport()
+    if transport is None:
+        print("Firebase not initialized, skipping push notification")
+        return [False] * len(notifications)
+    send_each, app = transport
+
+    results = []
+    invalid_tokens = set()
+    for start in range(0, len(notifications), FCM_BATCH_LIMIT):
+        chunk = notifications[start:start + FCM_BATCH_LIMIT]
+        messages = [
+            build_fcm_message(employee.expo_push_token, *attendance_content(employee, is_check_in, time_str))
+            for employee, is_check_in, time_str in chunk
+        ]
+        try:
+            response = send_each(messages, app=app)
+        except Exception as e:
+            logger.error(f'[fcm] send_each thất bại cho {len(chunk)} thông báo: {e}')
+            results.extend([False] * len(chunk))
+            continue
+
+        for (employee, _, _), item in zip(chunk, response.responses):
+            results.append(item.success)
+            if item.success:
+                continue
+            if isinstance(item.exception, exceptions.InvalidArgumentError):
+                logger.error(f'[fcm] Message không hợp lệ cho {employee.employee_id}: {item.exception}')
+            else:
+                logger.warning(f'[fcm] Không gửi được cho {employee.employee_id}: {item.exception}')
+            if isinstance(item.exception, INVALID_TOKEN_ERRORS):
+                invalid_tokens.add(employee.expo_push_token)
+
+    cleared = clear_push_tokens(invalid_tokens)
+    if cleared:
+        logger.info(f'[fcm] Đã xóa {cleared} push token không hợp lệ')
+    return results
+
+
+def get_fcm_batcher():
+    """MicroBatcher gom thông báo FCM từ hàng đợi dispatcher (None nếu PUSH_FCM_BATCH_WINDOW_MS = 0)"""
+    global _batcher_instance
+    if settings.PUSH_FCM_BATCH_WINDOW_MS <= 0:
+        return None
+    if _batcher_instance is None:
+        with _batcher_instance_lock:
+            if _batcher_instance is None:
+                # Lô có truy vấn database (xóa token không hợp lệ) trong thread của batcher
+                _batcher_instance = MicroBatcher(
+                    release_db_connections(send_fcm_batch),
+                    max_batch_size=FCM_BATCH_LIMIT,
+                    max_wait_ms=settings.PUSH_FCM_BATCH_WINDOW_MS,
+                    name='fcm',
+                )
+    return _batcher_instance
+
+
+def fcm_batcher_stats():
+    """Metrics của FCM batcher đã khởi tạo trong tiến trình, None nếu chưa có"""
+    batcher = _batcher_instance
+    return batcher.stats() if batcher is not None else None
@@ -0,0 +1,45 @@
+"""Nội dung và token push notification chấm công (dùng chung cho FCM và Expo)"""
+from django.db import close_old_connections
+
+
+def attendance_content(employee, is_check_in, time_str):
+    """(title, body, data) của thông báo check-in / check-out"""
+    if is_check_in:
+        title = "✅ Check-in thành công!"
+        body = f"Bạn đã check-in lúc {time_str}. Chúc bạn một ngày làm việc hiệu quả!"
+    else:
+        title = "✅ Check-out thành công!"
+        body = f"Bạn đã check-out lúc {time_str}. Hẹn gặp lại ngày mai!"
+
+    data = {
+        'type': 'attendance',
+        'action': 'check_in' if is_check_in else 'check_out',
+        'time': time_str,
+        'employee_id': employee.employee_id,
+        'realtime_update': 'true',
+    }
+    return title, body, data
+
+
+def is_expo_token(token):
+    return bool(token) and token.startswith('ExponentPushToken')
+
+
+def clear_push_tokens(tokens):
+    """Xóa các token không còn hợp lệ khỏi nhân viên (một câu UPDATE), trả về số nhân viên bị xóa token"""
+    from ..models import Employee
+
+    if not tokens:
+        return 0
+    return Employee.objects.filter(expo_push_token__in=list(tokens)).update(expo_push_token=None)
+
+
+def release_db_connections(send_batch):
+    """Bọc send_batch chạy trong thread MicroBatcher (dùng lâu dài): trả connection database trước và sau mỗi lô"""
+    def run(notifications):
+        close_old_connections()
+        try:
+            return send_batch(notifications)
+        finally:
+            close_old_connections()
+    return run
@@ -0,0 +1,101 @@
+"""
+Gửi push notification từ bảng outbox (PushNotificationOutbox).
+
+Mỗi lô chạy trong một transaction: lấy tối đa `batch_size` dòng PENDING đã
+đến hạn bằng SELECT ... FOR UPDATE SKIP LOCKED (các worker chạy song song bỏ
+qua dòng đang bị worker khác giữ nên không gửi trùng), gửi cả lô (FCM chung
+một lần send_each) rồi ghi kết quả bằng một lệnh bulk_update trước khi commit. Gửi lỗi thì thử lại
+sau backoff_base * 2^(attempts - 1) giây (tối đa backoff_max), sau
+max_attempts lần thì đánh dấu FAILED. Worker chết giữa lô thì transaction
+rollback và lô được gửi lại (at-least-once).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempts, base, maximum):
+    """Số giây chờ trước lần gửi thứ attempts + 1"""
+    return min(maximum, base * 2 ** max(0, attempts - 1))
+
+
+def claim_batch(batch_size):
+    """Khóa và trả về các dòng đến hạn (phải gọi trong transaction)"""
+    from ..models import PushNotificationOutbox
+
+    return list(
+        PushNotificationOutbox.objects.select_for_update(skip_locked=True, of=('self',))
+        .select_related('employee')
+        .filter(status='PENDING', next_attempt_at__lte=timezone.now())
+        .order_by('next_attempt_at', 'id')[:batch_size]
+    )
+
+
+def process_batch(send_batch=None, batch_size=None, max_attempts=None, backoff_base=None, backoff_max=None):
+    """Gửi một lô thông báo, trả về số dòng theo kết quả: claimed, sent, retry, failed.
+
+    send_batch(list (employee, is_check_in, time_str)) -> list bool theo thứ tự.
+    """
+    from ..models import PushNotificationOutbox
+
+    if send_batch is None:
+        from ..views.push_notification import send_attendance_notifications as send_batch
+    batch_size = batch_size or settings.PUSH_OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.PUSH_OUTBOX_MAX_ATTEMPTS
+    backoff_base = settings.PUSH_OUTBOX_BACKOFF_BASE if backoff_base is None else backoff_base
+    backoff_max = settings.PUSH_OUTBOX_BACKOFF_MAX if backoff_max is None else backoff_max
+
+    counts = {'claimed': 0, 'sent': 0, 'retry': 0, 'failed': 0}
+    with transaction.atomic():
+        rows = claim_batch(batch_size)
+        sendable = []
+        for row in rows:
+            if row.employee.expo_push_token:
+                sendable.append(row)
+            else:
+                row.status = 'FAILED'
+                row.last_error = 'Nhân viên không có push token'
+                counts['failed'] += 1
+
+        try:
+            results = send_batch([(row.employee, row.is_check_in, row.time_str) for row in sendable])
+            errors = ['' if ok else 'Nhà cung cấp push từ chối thông báo' for ok in results]
+        except Exception as e:
+            logger.error(f'[push_outbox] Lỗi khi gửi lô {len(sendable)} thông báo: {e}', exc_info=True)
+            results, errors = [False] * len(sendable), [str(e)] * len(sendable)
+
+        for row, ok, error in zip(sendable, results, errors):
+            row.attempts += 1
+            row.last_error = error
+            if ok:
+                row.status = 'SENT'
+                row.sent_at = timezone.now()
+                counts['sent'] += 1
+            elif row.attempts >= max_attempts:
+                row.status = 'FAILED'
+                counts['failed'] += 1
+            else:
+                row.next_attempt_at = timezone.now() + timedelta(
+                    seconds=backoff_delay(row.attempts, backoff_base, backoff_max))
+                counts['retry'] += 1
+
+        if rows:
+            PushNotificationOutbox.objects.bulk_update(
+                rows, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    counts['claimed'] = len(rows)
+    return counts
+
+
+def prune_outbox(older_than):
+    """Xóa các dòng đã gửi hoặc thất bại cũ hơn `older_than` (timedelta), trả về số dòng đã xóa"""
+    from ..models import PushNotificationOutbox
+
+    deleted, _ = PushNotificationOutbox.objects.filter(
+        status__in=['SENT', 'FAILED'], created_at__lt=timezone.now() - older_than
+    ).delete()
+    return deleted
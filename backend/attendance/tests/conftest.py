@@ -32,6 +32,17 @@ def attendance_record(db, employee):
     return AttendanceRecord.objects.create(employee=employee, check_in_time=timezone.now(), status='ON_TIME')
 
 
+@pytest.fixture
+def make_employees(db):
+    """Tạo nhân viên NV_PUSH0, NV_PUSH1, ... với các push token cho trước (bulk_create)"""
+    def make(tokens):
+        return Employee.objects.bulk_create([
+            Employee(employee_id=f'NV_PUSH{i}', first_name=f'Push{i}', expo_push_token=token)
+            for i, token in enumerate(tokens)
+        ])
+    return make
+
+
 @pytest.fixture
 def api_client():
     from django.test import Client
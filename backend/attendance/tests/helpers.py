@@ -0,0 +1,13 @@
+"""Hàm dựng dữ liệu embedding dùng chung cho các test"""
+import numpy as np
+
+
+def random_rows(rng, n, dim=512):
+    """n embedding ngẫu nhiên (phân phối chuẩn, trung bình 0) đã chuẩn hóa L2, shape (n, dim)"""
+    rows = rng.normal(size=(n, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def random_embedding(rng, dim=512):
+    """Một embedding ngẫu nhiên đã chuẩn hóa L2, shape (dim,)"""
+    return random_rows(rng, 1, dim)[0]
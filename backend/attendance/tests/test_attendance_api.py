@@ -0,0 +1,307 @@
+"""Integration tests for attendance scan endpoints"""
+import pytest
+import json
+import numpy as np
+from datetime import timedelta
+from unittest.mock import patch
+from attendance.models import Employee, AttendanceRecord
+from attendance.push.dispatcher import get_notification_dispatcher
+from attendance.views.utils import get_vietnam_now
+from attendance.tests.helpers import random_embedding
+
+
+@pytest.fixture
+def registered_employees(db):
+    rng = np.random.default_rng(7)
+    employees = []
+    for i in range(3):
+        emp = Employee.objects.create(employee_id=f'NV_SCAN{i}', first_name=f'Scan{i}', last_name='Test')
+        emp.set_face_embeddings([random_embedding(rng) for _ in range(2)])
+        employees.append(emp)
+    return employees
+
+
+@pytest.fixture(autouse=True)
+def no_push():
+    with patch('attendance.views.attendance_views.send_attendance_notification') as mock_send:
+        yield mock_send
+        # Thông báo được gửi bất đồng bộ: chờ gửi xong trước khi bỏ patch
+        get_notification_dispatcher().wait_idle(5)
+
+
+def post_json(client, url, payload):
+    return client.post(url, data=json.dumps(payload), content_type='application/json')
+
+
+@pytest.mark.django_db(transaction=True)
+class TestProcessAttendance:
+
+    def test_check_in(self, api_client, registered_employees):
+        embedding = registered_employees[0].get_face_embeddings()[0].tolist()
+        response = post_json(api_client, '/process-attendance/', {'embedding': embedding})
+        assert response.status_code == 200
+        assert response.json()['employee']['id'] == 'NV_SCAN0'
+        record = AttendanceRecord.objects.get(employee=registered_employees[0])
+        assert record.check_in_time is not None
+        assert record.check_out_time is None
+
+    def test_unknown_face(self, api_client, registered_employees):
+        embedding = random_embedding(np.random.default_rng(123)).tolist()
+        response = post_json(api_client, '/process-attendance/', {'embedding': embedding})
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAttendanceUpsert:
+
+    def scan_at(self, employee, hour, minute):
+        from attendance.views.attendance_views import record_attendance
+        now = get_vietnam_now().replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return record_attendance(employee, now)
+
+    def test_check_in_then_check_out(self, registered_employees):
+        employee = registered_employees[0]
+        record, is_first_scan, message = self.scan_at(employee, 8, 30)
+        assert is_first_scan and record.status == 'LATE' and 'Đi muộn' in message
+        assert Employee.objects.get(pk=employee.pk).current_status == 'IN_OFFICE'
+
+        record, is_first_scan, message = self.scan_at(employee, 17, 30)
+        assert not is_first_scan and 'ra ca' in message
+        stored = AttendanceRecord.objects.get(employee=employee)
+        assert stored.check_in_time.astimezone(record.check_in_time.tzinfo).hour == 8
+        assert stored.check_out_time == record.check_out_time
+        # Vào muộn vẫn giữ trạng thái LATE khi ra ca đúng giờ
+        assert stored.status == 'LATE'
+        assert Employee.objects.get(pk=employee.pk).current_status == 'OUT_OFFICE'
+
+        self.scan_at(employee, 16, 0)
+        stored = AttendanceRecord.objects.get(employee=employee)
+        assert stored.check_out_time.astimezone(record.check_in_time.tzinfo).hour == 17
+        assert stored.status == 'LATE'
+
+    def test_check_out_before_work_end_is_early(self, registered_employees):
+        employee = registered_employees[0]
+        self.scan_at(employee, 7, 55)
+        record, is_first_scan, message = self.scan_at(employee, 15, 0)
+        assert not is_first_scan and record.status == 'EARLY' and 'Về sớm' in message
+
+    def test_replayed_scans_out_of_order(self, registered_employees):
+        employee = registered_employees[1]
+        self.scan_at(employee, 7, 55)
+        self.scan_at(employee, 17, 30)
+
+        # Lượt quét cũ gửi lại sau (kiosk mất mạng) không kéo giờ ra sớm hơn
+        record, is_first_scan, _ = self.scan_at(employee, 10, 0)
+        assert not is_first_scan
+        assert (record.check_in_time.hour, record.check_in_time.minute) == (7, 55)
+        assert (record.check_out_time.hour, record.check_out_time.minute) == (17, 30)
+        assert record.status == 'ON_TIME'
+
+        # Lượt sớm hơn check-in hiện tại trở thành check-in nhưng không phải lượt tạo bản ghi
+        record, is_first_scan, _ = self.scan_at(employee, 7, 30)
+        assert not is_first_scan
+        assert (record.check_in_time.hour, record.check_in_time.minute) == (7, 30)
+        assert (record.check_out_time.hour, record.check_out_time.minute) == (17, 30)
+        assert Employee.objects.get(pk=employee.pk).current_status == 'OUT_OFFICE'
+
+    def test_replayed_check_in_before_check_out(self, registered_employees):
+        employee = registered_employees[2]
+        self.scan_at(employee, 8, 30)
+        # Lượt 07:50 đến sau lượt 08:30: 07:50 là check-in, 08:30 thành check-out
+        record, is_first_scan, _ = self.scan_at(employee, 7, 50)
+        assert not is_first_scan
+        assert (record.check_in_time.hour, record.check_in_time.minute) == (7, 50)
+        assert (record.check_out_time.hour, record.check_out_time.minute) == (8, 30)
+        assert record.status == 'EARLY'
+
+    def test_retried_scan_is_idempotent(self, registered_employees):
+        employee = registered_employees[0]
+        self.scan_at(employee, 8, 30)
+        # Kiosk gửi lại đúng lượt quét check-in: không tạo check-out, không là check-in mới
+        record, is_first_scan, message = self.scan_at(employee, 8, 30)
+        assert not is_first_scan
+        assert record.check_out_time is None and record.status == 'LATE'
+        assert Employee.objects.get(pk=employee.pk).current_status == 'IN_OFFICE'
+
+    def test_scan_query_budget(self, api_client, registered_employees, django_assert_num_queries):
+        embeddings = [emp.get_face_embeddings()[0].tolist() for emp in registered_employees]
+        post_json(api_client, '/process-attendance/', {'embedding': embeddings[0]})
+        # So khớp + upsert bản ghi chấm công + cập nhật current_status
+        for embedding in (embeddings[1], embeddings[1]):
+            with django_assert_num_queries(3):
+                response = post_json(api_client, '/process-attendance/', {'embedding': embedding})
+            assert response.status_code == 200
+
+    def test_concurrent_scans_single_check_in(self, registered_employees):
+        import threading
+        from django.db import connection
+        from attendance.views.attendance_views import record_attendance
+        employee = registered_employees[2]
+        barrier = threading.Barrier(4)
+        base = get_vietnam_now().replace(microsecond=0) - timedelta(minutes=1)
+        results, errors = {}, []
+
+        def scan(offset):
+            try:
+                barrier.wait()
+                worker_employee = Employee.objects.get(pk=employee.pk)
+                scan_time = base + timedelta(seconds=offset)
+                results[offset] = record_attendance(worker_employee, scan_time)[1]
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=scan, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        # Đúng một lượt tạo bản ghi; dù thứ tự ghi thế nào, giờ vào/ra là lượt sớm nhất/muộn nhất
+        assert sorted(results.values()) == [False, False, False, True]
+        assert AttendanceRecord.objects.filter(employee=employee).count() == 1
+        record = AttendanceRecord.objects.get(employee=employee)
+        assert record.check_in_time == base
+        assert record.check_out_time == base + timedelta(seconds=3)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBinaryEmbeddingTransport:
+
+    @pytest.mark.parametrize('dtype', ['float32', 'float16'])
+    def test_check_in_with_base64_embedding(self, api_client, registered_employees, dtype):
+        from attendance.face_recognition.transport import encode_embedding
+        embedding = registered_employees[1].get_face_embeddings()[0]
+        payload = {'embedding': encode_embedding(embedding, dtype), 'embedding_dtype': dtype}
+        response = post_json(api_client, '/process-attendance/', payload)
+        assert response.status_code == 200
+        assert response.json()['employee']['id'] == 'NV_SCAN1'
+        # float32 ~ 2.7 KB, float16 ~ 1.4 KB so với 6-10 KB của mảng JSON
+        ratio = {'float32': 3, 'float16': 6}[dtype]
+        assert len(json.dumps(payload)) * ratio < len(json.dumps({'embedding': embedding.tolist()}))
+
+    @pytest.mark.parametrize('payload', [
+        {'embedding': 'not base64!'},
+        {'embedding': 'AAAA'},
+        {'embedding': 'AAAA', 'embedding_dtype': 'int8'},
+        {'embedding': [0.1] * 100},
+        {'embedding': [0.1] * 511 + [float('nan')]},
+    ])
+    def test_invalid_embedding_rejected_before_db(self, api_client, registered_employees, payload,
+                                                  django_assert_num_queries):
+        with django_assert_num_queries(0):
+            response = post_json(api_client, '/process-attendance/', payload)
+        assert response.status_code == 400
+
+    def test_batch_and_register_accept_base64(self, admin_client, registered_employees):
+        from attendance.face_recognition.transport import encode_embedding
+        rng = np.random.default_rng(11)
+        newcomer = Employee.objects.create(employee_id='NV_B64')
+        samples = [random_embedding(rng) for _ in range(3)]
+        response = post_json(admin_client, '/register-face/', {
+            'employee_id': 'NV_B64',
+            'embeddings': [encode_embedding(e, 'float16') for e in samples],
+            'embedding_dtype': 'float16',
+        })
+        assert response.status_code == 200
+        assert Employee.objects.get(pk=newcomer.pk).face_sample_count == 3
+
+        items = [{'embedding': encode_embedding(samples[0])}, {'embedding': 'AAAA'}]
+        response = post_json(admin_client, '/process-attendance/batch/', {'items': items})
+        results = response.json()['results']
+        assert results[0]['employee']['id'] == 'NV_B64'
+        assert not results[1]['success'] and '512' in results[1]['error']
+
+
+@pytest.mark.django_db(transaction=True)
+class TestProcessAttendanceBatch:
+
+    def test_batch_records_each_match(self, api_client, registered_employees, no_push):
+        now = get_vietnam_now()
+        items = [
+            {'embedding': emp.get_face_embeddings()[1].tolist(), 'timestamp': now.isoformat()}
+            for emp in registered_employees
+        ]
+        items.append({'embedding': random_embedding(np.random.default_rng(5)).tolist()})
+        response = post_json(api_client, '/process-attendance/batch/', {'items': items})
+        assert response.status_code == 200
+        data = response.json()
+        assert data['processed'] == 3
+        assert [r['success'] for r in data['results']] == [True, True, True, False]
+        assert [r['employee']['id'] for r in data['results'][:3]] == ['NV_SCAN0', 'NV_SCAN1', 'NV_SCAN2']
+        assert AttendanceRecord.objects.filter(check_in_time__isnull=False).count() == 3
+        get_notification_dispatcher().wait_idle(5)
+        assert no_push.call_count == 3
+
+    def test_batch_dedups_repeated_face(self, api_client, registered_employees):
+        now = get_vietnam_now()
+        embedding = registered_employees[0].get_face_embeddings()[0].tolist()
+        items = [
+            {'embedding': embedding, 'timestamp': (now - timedelta(seconds=5)).isoformat()},
+            {'embedding': embedding, 'timestamp': now.isoformat()},
+        ]
+        response = post_json(api_client, '/process-attendance/batch/', {'items': items})
+        results = response.json()['results']
+        assert results[0]['success'] is True
+        assert results[1].get('duplicate') is True
+        record = AttendanceRecord.objects.get(employee=registered_employees[0])
+        assert record.check_out_time is None
+
+    def test_replayed_batch_keeps_latest_check_out(self, api_client, registered_employees):
+        now = get_vietnam_now().replace(microsecond=0)
+        embedding = registered_employees[0].get_face_embeddings()[0].tolist()
+
+        def send(*timestamps):
+            items = [{'embedding': embedding, 'timestamp': ts.isoformat()} for ts in timestamps]
+            return post_json(api_client, '/process-attendance/batch/', {'items': items}).json()
+
+        send(now - timedelta(minutes=4), now - timedelta(minutes=2))
+        # Kiosk khác gửi lại lượt quét cũ hơn sau đó
+        assert send(now - timedelta(minutes=3))['results'][0]['success'] is True
+        record = AttendanceRecord.objects.get(employee=registered_employees[0])
+        assert record.check_in_time == now - timedelta(minutes=4)
+        assert record.check_out_time == now - timedelta(minutes=2)
+
+    def test_replayed_scans_not_notified_again(self, api_client, registered_employees, no_push):
+        now = get_vietnam_now().replace(microsecond=0)
+        embedding = registered_employees[0].get_face_embeddings()[0].tolist()
+
+        def send(timestamp):
+            items = [{'embedding': embedding, 'timestamp': timestamp.isoformat()}]
+            return post_json(api_client, '/process-attendance/batch/', {'items': items}).json()
+
+        send(now - timedelta(minutes=2))
+        # Thử lại cùng lượt check-in và lượt cũ hơn gửi muộn: không thông báo check-in lần nữa
+        send(now - timedelta(minutes=2))
+        send(now - timedelta(minutes=4))
+        get_notification_dispatcher().wait_idle(5)
+        assert [call.args[1] for call in no_push.call_args_list] == [True]
+
+    def test_batch_rejects_future_timestamp(self, api_client, registered_employees):
+        embedding = registered_employees[0].get_face_embeddings()[0].tolist()
+        future = get_vietnam_now() + timedelta(hours=1)
+        response = post_json(api_client, '/process-attendance/batch/',
+                             {'items': [{'embedding': embedding, 'timestamp': future.isoformat()}]})
+        assert response.json()['results'][0]['success'] is False
+        assert not AttendanceRecord.objects.exists()
+
+    @pytest.mark.parametrize('timestamp', [1700000000, ['2024-01-01T08:00:00'], {'at': '08:00'}, 0, 'hôm qua'])
+    def test_batch_invalid_timestamp_fails_only_its_item(self, api_client, registered_employees, timestamp):
+        embeddings = [emp.get_face_embeddings()[0].tolist() for emp in registered_employees[:2]]
+        items = [{'embedding': embeddings[0], 'timestamp': timestamp}, {'embedding': embeddings[1]}]
+        response = post_json(api_client, '/process-attendance/batch/', {'items': items})
+        assert response.status_code == 200
+        results = response.json()['results']
+        assert results[0] == {'index': 0, 'success': False, 'error': 'Thời gian quét không hợp lệ'}
+        assert results[1]['success'] is True
+
+    def test_batch_limits(self, api_client, settings, db):
+        settings.FACE_BATCH_MAX_ITEMS = 2
+        assert post_json(api_client, '/process-attendance/batch/', {'items': []}).status_code == 400
+        items = [{'embedding': [0.1] * 512}] * 3
+        assert post_json(api_client, '/process-attendance/batch/', {'items': items}).status_code == 400
+
+    def test_batch_method_not_allowed(self, api_client):
+        assert api_client.get('/process-attendance/batch/').status_code == 405
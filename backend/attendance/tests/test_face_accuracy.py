@@ -58,21 +58,21 @@ class TestFaceRecognitionLogic:
         
     def test_find_matching_employee_below_threshold(self):
         """Test input that is too different from stored embedding"""
-        target_emb = np.random.rand(512)
+        # Vector trung bình 0: hai vector ngẫu nhiên gần trực giao (np.random.rand
+        # cho toàn số dương, cosine ~0.75, vượt ngưỡng)
+        rng = np.random.default_rng(0)
+        target_emb = rng.standard_normal(512)
         
         emp = Employee.objects.create(employee_id='TEST_NO_MATCH', first_name='Test', last_name='NoMatch')
         emp.set_face_embeddings([target_emb])
         emp.save()
         
-        # Generate orthogonal/random embedding
-        diff_emb = np.random.rand(512)
-        # Ensure it's different enough (random high dime vectors usually are orthogonal)
+        diff_emb = rng.standard_normal(512)
         
         match, score = find_matching_employee(diff_emb)
         
-        # Unless we are extremely unlucky, score should be low
         assert match is None
-        assert score < 0.75 # Default threshold
+        assert score < 0.65 # Default threshold
 
     def test_performance_compute_similarity(self):
         """Test performance of similarity computation"""
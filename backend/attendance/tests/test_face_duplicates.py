@@ -0,0 +1,76 @@
+"""Gallery-wide duplicate face audit tests"""
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+
+from attendance.face_recognition.duplicates import find_duplicate_pairs
+from attendance.models import Employee
+from attendance.tests.helpers import random_rows
+
+
+def near(rng, row, noise=0.01):
+    row = row + rng.normal(0, noise, size=row.shape).astype(np.float32)
+    return row / np.linalg.norm(row)
+
+
+def brute_force_pairs(matrix, employee_ids, threshold):
+    scores = matrix @ matrix.T
+    pairs = {}
+    for i, j in zip(*np.nonzero(np.triu(scores >= threshold, k=1))):
+        a, b = sorted((int(employee_ids[i]), int(employee_ids[j])))
+        if a != b:
+            score, count = pairs.get((a, b), (-1.0, 0))
+            pairs[(a, b)] = (max(score, float(scores[i, j])), count + 1)
+    return pairs
+
+
+class TestFindDuplicatePairs:
+
+    @pytest.mark.parametrize('block_size', [7, 64, 1000])
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_matches_brute_force(self, block_size, workers):
+        rng = np.random.default_rng(0)
+        matrix = random_rows(rng, 120)
+        employee_ids = np.repeat(np.arange(40), 3)
+        # Nhân viên 5 và 31 có mẫu gần giống nhau, 12 và 13 trùng hai mẫu
+        matrix[16] = near(rng, matrix[94])
+        matrix[36] = near(rng, matrix[39])
+        matrix[37] = near(rng, matrix[40])
+
+        pairs = find_duplicate_pairs(matrix, employee_ids, 0.9, block_size=block_size, workers=workers)
+        expected = brute_force_pairs(matrix, employee_ids, 0.9)
+        assert {(a, b) for a, b, _, _ in pairs} == set(expected) == {(5, 31), (12, 13)}
+        for a, b, score, count in pairs:
+            assert score == pytest.approx(expected[(a, b)][0], abs=1e-5)
+            assert count == expected[(a, b)][1]
+        assert pairs[0][2] >= pairs[1][2]
+
+    def test_same_employee_samples_ignored(self):
+        rng = np.random.default_rng(1)
+        base = random_rows(rng, 1)[0]
+        matrix = np.stack([near(rng, base) for _ in range(4)])
+        assert find_duplicate_pairs(matrix, [7, 7, 7, 7], 0.5, block_size=2, workers=1) == []
+
+
+@pytest.mark.django_db
+class TestAuditCommand:
+
+    def test_reports_cross_registered_faces(self, tmp_path):
+        rng = np.random.default_rng(2)
+        faces = random_rows(rng, 3)
+        employees = [Employee.objects.create(employee_id=f'NV_DUP{i}', first_name=f'Dup {i}') for i in range(3)]
+        employees[0].set_face_embeddings([faces[0], near(rng, faces[0])])
+        employees[1].set_face_embeddings([faces[1], near(rng, faces[0])])
+        employees[2].set_face_embeddings([faces[2]])
+
+        out = StringIO()
+        csv_path = tmp_path / 'duplicates.csv'
+        call_command('audit_face_duplicates', threshold=0.9, block_size=2, workers=1, csv=str(csv_path), stdout=out)
+        output = out.getvalue()
+        assert '1 cặp nhân viên' in output
+        assert 'NV_DUP0' in output and 'NV_DUP1' in output
+        assert 'NV_DUP2' not in output
+        lines = csv_path.read_text(encoding='utf-8').splitlines()
+        assert len(lines) == 2 and lines[1].endswith(',2')
@@ -0,0 +1,447 @@
+"""Face matching (pgvector ANN) tests"""
+import pytest
+import numpy as np
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from attendance.models import Employee, EmployeeFaceEmbedding
+from attendance.views.face_views import find_matching_employee, find_matching_candidates
+from attendance.tests.helpers import random_embedding
+
+
+@pytest.fixture
+def gallery(db):
+    rng = np.random.default_rng(0)
+    employees = []
+    for i in range(5):
+        emp = Employee.objects.create(employee_id=f'NV_G{i}', first_name=f'G{i}', last_name='Test')
+        emp.set_face_embeddings([random_embedding(rng) for _ in range(3)])
+        employees.append(emp)
+    return employees
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAnnIndex:
+
+    def test_hnsw_index_exists(self, db):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexdef FROM pg_indexes WHERE indexname = 'employee_emb_hnsw_idx'")
+            row = cursor.fetchone()
+        assert row is not None
+        assert 'hnsw' in row[0]
+        assert 'vector_ip_ops' in row[0]
+
+    def test_find_matching_employee_with_ef_search(self, gallery):
+        target = gallery[2].get_face_embeddings()[1]
+        match, score = find_matching_employee(target, ef_search=100, probes=5)
+        assert match.employee_id == 'NV_G2'
+        assert score > 0.99
+
+    def test_ann_params_applied_per_call(self, gallery):
+        def current_ef_search():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT current_setting('hnsw.ef_search', true)")
+                return cursor.fetchone()[0]
+
+        find_matching_employee(gallery[0].get_face_embeddings()[0], ef_search=123)
+        assert current_ef_search() == '123'
+        find_matching_employee(gallery[0].get_face_embeddings()[0])
+        assert current_ef_search() == '40'
+
+    def test_recall_command(self, gallery):
+        out = StringIO()
+        call_command('face_ann_index', queries=5, ef_search='10,40', stdout=out)
+        output = out.getvalue()
+        assert 'recall@1' in output
+        assert 'ef_search=40' in output
+
+    def test_create_and_drop_ivfflat(self, gallery):
+        out = StringIO()
+        call_command('face_ann_index', create_ivfflat=True, lists=2, queries=3, probes='1,2',
+                     ef_search='40', stdout=out)
+        rows = {line.split()[0]: line.split()[-1] for line in out.getvalue().splitlines()
+                if line.startswith(('ef_search=', 'probes='))}
+        # Mỗi lượt đo chạy trên đúng index của tham số
+        assert rows == {'ef_search=40': 'employee_emb_hnsw_idx', 'probes=1': 'employee_emb_ivfflat_idx',
+                        'probes=2': 'employee_emb_ivfflat_idx'}
+        # Index bị xóa tạm trong lúc đo được khôi phục
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_indexes WHERE indexname IN "
+                           "('employee_emb_hnsw_idx', 'employee_emb_ivfflat_idx')")
+            assert cursor.fetchone()[0] == 2
+        call_command('face_ann_index', drop_ivfflat=True, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'employee_emb_ivfflat_idx'")
+            assert cursor.fetchone() is None
+
+
+@pytest.fixture
+def memory_backend(settings):
+    from attendance.face_recognition.gallery import invalidate_face_gallery
+    settings.FACE_MATCH_BACKEND = 'memory'
+    invalidate_face_gallery()
+    yield
+    invalidate_face_gallery()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestMemoryGallery:
+
+    def test_match_from_memory(self, gallery, memory_backend):
+        target = gallery[3].get_face_embeddings()[0]
+        match, score = find_matching_employee(target)
+        assert match.employee_id == 'NV_G3'
+        assert score > 0.99
+
+    def test_gallery_matrix_layout(self, gallery, memory_backend):
+        from attendance.face_recognition.gallery import get_face_gallery
+        face_gallery = get_face_gallery()
+        face_gallery.ensure_loaded()
+        data = face_gallery.snapshot.base
+        matrix = data.matrix
+        assert matrix.shape == (15, 512)
+        assert data.centroids.shape == (5, 512)
+        assert list(np.diff(data.offsets)) == [3] * 5
+        assert matrix.dtype == np.float32
+        assert matrix.flags['C_CONTIGUOUS']
+        assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0, atol=1e-5)
+
+    def test_set_face_embeddings_invalidates(self, gallery, memory_backend):
+        rng = np.random.default_rng(99)
+        new_emb = random_embedding(rng)
+        find_matching_employee(new_emb)  # nạp gallery
+        gallery[1].set_face_embeddings([new_emb])
+        match, _ = find_matching_employee(new_emb)
+        assert match.employee_id == 'NV_G1'
+
+    def test_clear_face_embeddings_invalidates(self, gallery, memory_backend):
+        target = gallery[4].get_face_embeddings()[0]
+        assert find_matching_employee(target)[0] is not None
+        gallery[4].clear_face_embeddings()
+        match, _ = find_matching_employee(target)
+        assert match is None
+
+    def test_terminated_employee_removed(self, gallery, memory_backend):
+        target = gallery[0].get_face_embeddings()[0]
+        assert find_matching_employee(target)[0] is not None
+        employee = Employee.objects.get(pk=gallery[0].pk)
+        employee.work_status = 'TERMINATED'
+        employee.save()
+        match, _ = find_matching_employee(target)
+        assert match is None
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTopKMatching:
+
+    def test_single_query_per_scan(self, gallery, django_assert_num_queries):
+        target = gallery[1].get_face_embeddings()[0]
+        find_matching_employee(target)  # lần đầu đặt tham số ANN cho connection
+        with django_assert_num_queries(1):
+            match, _ = find_matching_employee(target)
+            # employee và department đã được join sẵn
+            assert match.employee_id == 'NV_G1'
+            assert match.department is None
+
+    def test_candidates_ranked_with_margin(self, gallery):
+        target = gallery[2].get_face_embeddings()[0]
+        candidates, margin = find_matching_candidates(target, top_k=3)
+        assert len(candidates) == 3
+        assert candidates[0].employee.employee_id == 'NV_G2'
+        assert len({c.employee.pk for c in candidates}) == 3
+        assert candidates[0].score >= candidates[1].score >= candidates[2].score
+        assert margin == pytest.approx(candidates[0].score - candidates[1].score)
+
+    def test_fused_top_k_score(self, gallery):
+        embeddings = gallery[2].get_face_embeddings()
+        target = embeddings[0]
+        best, _ = find_matching_candidates(target, top_k=1, fuse_k=1)
+        fused, _ = find_matching_candidates(target, top_k=1, fuse_k=3)
+        expected = np.mean(sorted((float(np.dot(target, e)) for e in embeddings), reverse=True))
+        assert best[0].score > fused[0].score
+        assert fused[0].score == pytest.approx(expected, abs=1e-4)
+
+    def test_ambiguous_match_rejected(self, db):
+        rng = np.random.default_rng(1)
+        face = random_embedding(rng)
+        for i in range(2):
+            emp = Employee.objects.create(employee_id=f'NV_TWIN{i}')
+            emp.set_face_embeddings([face + rng.normal(0, 0.001, 512)])
+        match, score = find_matching_employee(face, min_margin=0.05)
+        assert match is None
+        assert score > 0.99
+
+    def test_memory_backend_candidates(self, gallery, memory_backend):
+        target = gallery[4].get_face_embeddings()[1]
+        candidates, margin = find_matching_candidates(target, top_k=2)
+        assert candidates[0].employee.employee_id == 'NV_G4'
+        assert len(candidates) == 2
+        assert margin > 0.5
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBatchMatching:
+
+    @pytest.mark.parametrize('backend', ['pgvector', 'memory'])
+    def test_find_matching_employees(self, gallery, settings, backend):
+        from attendance.face_recognition.gallery import invalidate_face_gallery
+        from attendance.views.face_views import find_matching_employees
+        settings.FACE_MATCH_BACKEND = backend
+        invalidate_face_gallery()
+        queries = [gallery[i].get_face_embeddings()[2] for i in (4, 0, 2)]
+        queries.append(random_embedding(np.random.default_rng(77)))
+        results = find_matching_employees(queries)
+        assert [emp.employee_id if emp else None for emp, _ in results] == ['NV_G4', 'NV_G0', 'NV_G2', None]
+        assert all(score > 0.99 for _, score in results[:3])
+
+    def test_batch_matching_query_count(self, gallery, django_assert_max_num_queries):
+        from attendance.views.face_views import find_matching_employees
+        queries = [emp.get_face_embeddings()[0] for emp in gallery]
+        find_matching_employees(queries[:1])
+        with django_assert_max_num_queries(2):
+            find_matching_employees(queries)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTwoStageSearch:
+
+    def test_centroid_maintained(self, gallery):
+        from attendance.models import EmployeeFaceCentroid
+        centroid = EmployeeFaceCentroid.objects.get(employee=gallery[0])
+        embeddings = gallery[0].get_face_embeddings()
+        expected = np.mean(embeddings, axis=0)
+        expected /= np.linalg.norm(expected)
+        assert centroid.sample_count == 3
+        assert np.allclose(centroid.centroid, expected, atol=1e-5)
+
+        gallery[0].clear_face_embeddings()
+        assert not EmployeeFaceCentroid.objects.filter(employee=gallery[0]).exists()
+
+    @pytest.mark.parametrize('backend', ['pgvector', 'memory'])
+    def test_shortlist_keeps_best_sample(self, gallery, settings, backend):
+        from attendance.face_recognition.gallery import invalidate_face_gallery
+        settings.FACE_MATCH_BACKEND = backend
+        settings.FACE_SHORTLIST_SIZE = 2
+        invalidate_face_gallery()
+        for emp in gallery:
+            for sample in emp.get_face_embeddings():
+                candidates, _ = find_matching_candidates(sample, top_k=2)
+                assert candidates[0].employee.pk == emp.pk
+                assert candidates[0].score > 0.99
+                # Chỉ các nhân viên trong shortlist mới được xếp hạng
+                assert len(candidates) <= 2
+
+    def test_benchmark_command(self, db):
+        out = StringIO()
+        call_command('benchmark_face_search', synthetic=20, samples=3, queries=10,
+                     shortlist='0,5', stdout=out)
+        output = out.getvalue()
+        assert 'shortlist=5' in output
+        assert 'recall@1' in output
+
+
+@pytest.mark.django_db(transaction=True)
+class TestQuantizedSearch:
+
+    def test_binary_column_filled_on_save(self, gallery):
+        sample = EmployeeFaceEmbedding.objects.filter(employee=gallery[0]).first()
+        bits = sample.embedding_binary
+        assert len(bits) == 512
+        assert bits == ''.join('1' if x > 0 else '0' for x in sample.embedding)
+
+    @pytest.mark.parametrize('update_fields', [None, ['embedding']])
+    def test_binary_column_recomputed_when_embedding_changes(self, gallery, update_fields):
+        sample = EmployeeFaceEmbedding.objects.filter(employee=gallery[0]).first()
+        flipped = [-x for x in sample.embedding]
+        sample.embedding = flipped
+        sample.save(update_fields=update_fields)
+        stored = EmployeeFaceEmbedding.objects.get(pk=sample.pk).embedding_binary
+        assert stored == ''.join('1' if x > 0 else '0' for x in flipped)
+
+    def test_backfill_sql_matches_python(self, gallery):
+        from importlib import import_module
+        migration = import_module('attendance.migrations.0014_employeefaceembedding_binary')
+        expected = dict(EmployeeFaceEmbedding.objects.values_list('id', 'embedding_binary'))
+        EmployeeFaceEmbedding.objects.update(embedding_binary=None)
+        with connection.cursor() as cursor:
+            cursor.execute(migration.BACKFILL_SQL)
+        assert dict(EmployeeFaceEmbedding.objects.values_list('id', 'embedding_binary')) == expected
+
+    def test_quantized_candidates_rerank(self, gallery, settings):
+        settings.FACE_QUANTIZED_CANDIDATES = 4
+        for emp in gallery:
+            target = emp.get_face_embeddings()[1]
+            candidates, _ = find_matching_candidates(target, top_k=3)
+            assert candidates[0].employee.pk == emp.pk
+            # Điểm sau rerank là cosine chính xác, không phải khoảng cách Hamming
+            assert candidates[0].score == pytest.approx(1.0, abs=1e-4)
+
+    def test_quantized_batch(self, gallery, settings):
+        from attendance.views.face_views import find_matching_employees
+        settings.FACE_QUANTIZED_CANDIDATES = 4
+        settings.FACE_SHORTLIST_SIZE = 2
+        queries = [gallery[i].get_face_embeddings()[0] for i in (3, 1)]
+        results = find_matching_employees(queries)
+        assert [emp.employee_id for emp, _ in results] == ['NV_G3', 'NV_G1']
+
+    def test_benchmark_reports_storage(self, db):
+        out = StringIO()
+        call_command('benchmark_face_search', synthetic=20, samples=3, queries=10,
+                     shortlist='0', quantized='20', backends='pgvector', stdout=out)
+        output = out.getvalue()
+        assert 'quantized=20' in output
+        assert 'vector 2052 B' in output
+
+
+@pytest.mark.django_db(transaction=True)
+class TestRegisterFace:
+
+    def register(self, client, employee_id, embeddings):
+        import json
+        return client.post('/register-face/', json.dumps({
+            'employee_id': employee_id,
+            'embeddings': [list(map(float, e)) for e in embeddings],
+        }), content_type='application/json')
+
+    def test_duplicate_in_later_sample_rejected(self, gallery, admin_client):
+        rng = np.random.default_rng(5)
+        newcomer = Employee.objects.create(employee_id='NV_NEW', first_name='New')
+        samples = [random_embedding(rng) for _ in range(4)]
+        samples[3] = gallery[2].get_face_embeddings()[1]
+        response = self.register(admin_client, 'NV_NEW', samples)
+        assert response.status_code == 400
+        assert 'NV_G2' in response.json()['details']
+        assert not EmployeeFaceEmbedding.objects.filter(employee=newcomer).exists()
+
+    def test_registered_employee_rejected(self, gallery, admin_client):
+        response = self.register(admin_client, 'NV_G1', gallery[1].get_face_embeddings())
+        assert response.status_code == 400
+        assert 'đã đăng ký' in response.json()['error']
+
+    def test_own_samples_not_a_conflict(self, gallery):
+        from attendance.views.face_views import find_registration_conflict
+        samples = gallery[1].get_face_embeddings()
+        assert find_registration_conflict(samples, gallery[1]) == (None, 0.0)
+        conflict, score = find_registration_conflict(samples, gallery[0])
+        assert conflict.pk == gallery[1].pk and score > 0.99
+
+    def test_query_count_independent_of_samples(self, gallery, admin_client):
+        from django.test.utils import CaptureQueriesContext
+        rng = np.random.default_rng(6)
+        counts = []
+        # Lượt đầu còn các truy vấn một lần cho connection (tham số ANN)
+        for i, samples in enumerate((1, 2, 10)):
+            Employee.objects.create(employee_id=f'NV_BULK{i}')
+            embeddings = [random_embedding(rng) for _ in range(samples)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.register(admin_client, f'NV_BULK{i}', embeddings)
+            assert response.status_code == 200
+            counts.append(len(queries))
+        assert counts[1] == counts[2]
+        stored = EmployeeFaceEmbedding.objects.filter(employee__employee_id='NV_BULK2')
+        assert stored.count() == 10
+        # bulk_create không gọi save(): cột bit phải được điền sẵn
+        assert all(len(bits) == 512 for bits in stored.values_list('embedding_binary', flat=True))
+
+
+@pytest.mark.django_db(transaction=True)
+class TestFaceSampleCount:
+
+    def test_count_maintained(self, gallery):
+        assert [Employee.objects.get(pk=emp.pk).face_sample_count for emp in gallery] == [3] * 5
+        gallery[0].set_face_embeddings(gallery[0].get_face_embeddings()[:2])
+        gallery[1].clear_face_embeddings()
+        counts = dict(Employee.objects.values_list('employee_id', 'face_sample_count'))
+        assert counts['NV_G0'] == 2 and counts['NV_G1'] == 0
+
+    def test_backfill_sql_matches_samples(self, gallery):
+        from importlib import import_module
+        migration = import_module('attendance.migrations.0016_employee_face_sample_count')
+        Employee.objects.update(face_sample_count=0)
+        with connection.cursor() as cursor:
+            cursor.execute(migration.BACKFILL_SQL)
+        assert list(Employee.objects.filter(employee_id__startswith='NV_G').values_list(
+            'face_sample_count', flat=True)) == [3] * 5
+
+    @pytest.mark.parametrize('url', ['/api/employees/', '/api/employees/list/'])
+    def test_list_query_count_independent_of_size(self, gallery, admin_client, url):
+        from django.test.utils import CaptureQueriesContext
+        from attendance.models import Department
+        department = Department.objects.create(name='Phòng Test')
+        counts = []
+        for extra in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = admin_client.get(url)
+            assert response.status_code == 200
+            counts.append(len(queries))
+            Employee.objects.create(employee_id=f'NV_EXTRA{extra}', department=department)
+        assert counts[0] == counts[1]
+        has_face = {e['employee_id']: e['has_face'] for e in response.json()['employees']}
+        assert has_face['NV_G3'] and not has_face['NV_EXTRA0']
+
+
+@pytest.mark.django_db(transaction=True)
+class TestUnitNorm:
+
+    def test_embeddings_normalized_on_write(self, db):
+        emp = Employee.objects.create(employee_id='NV_NORM')
+        emp.set_face_embeddings([np.full(512, 3.0), np.arange(1, 513, dtype=np.float64)])
+        single = EmployeeFaceEmbedding.objects.create(employee=emp, embedding=[2.0] * 512)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT vector_norm(embedding) FROM attendance_employeefaceembedding WHERE employee_id = %s",
+                           [emp.pk])
+            norms = [row[0] for row in cursor.fetchall()]
+        assert len(norms) == 3
+        assert np.allclose(norms, 1.0, atol=1e-6)
+        assert single.embedding_binary == '1' * 512
+
+    def test_zero_embedding_rejected(self, db):
+        emp = Employee.objects.create(employee_id='NV_ZERO')
+        with pytest.raises(ValueError):
+            emp.set_face_embeddings([np.zeros(512)])
+
+    def test_check_constraint(self, db):
+        from django.db import IntegrityError, transaction
+        emp = Employee.objects.create(employee_id='NV_RAW')
+        with pytest.raises(IntegrityError), transaction.atomic():
+            EmployeeFaceEmbedding.objects.bulk_create([EmployeeFaceEmbedding(employee=emp, embedding=[0.5] * 512)])
+
+    def test_normalize_migration_sql(self, gallery):
+        from importlib import import_module
+        from django.db import transaction
+        from attendance.models import EmployeeFaceCentroid
+        migration = import_module('attendance.migrations.0017_unit_norm_inner_product')
+        zero = str([0.0] * 512)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("ALTER TABLE attendance_employeefaceembedding DROP CONSTRAINT employee_emb_unit_norm")
+                cursor.execute("UPDATE attendance_employeefaceembedding SET embedding = embedding + embedding "
+                               "WHERE employee_id = %s", [gallery[0].pk])
+                cursor.execute("UPDATE attendance_employeefaceembedding SET embedding = %s::vector "
+                               "WHERE id = (SELECT min(id) FROM attendance_employeefaceembedding WHERE employee_id = %s)",
+                               [zero, gallery[1].pk])
+                cursor.execute("UPDATE attendance_employeefaceembedding SET embedding = %s::vector "
+                               "WHERE employee_id = %s", [zero, gallery[2].pk])
+                cursor.execute(migration.NORMALIZE_SQL)
+                cursor.execute("SELECT min(vector_norm(embedding)), max(vector_norm(embedding)) "
+                               "FROM attendance_employeefaceembedding")
+                low, high = cursor.fetchone()
+            counts = dict(Employee.objects.filter(pk__in=[e.pk for e in gallery[:3]])
+                          .values_list('employee_id', 'face_sample_count'))
+            remaining = gallery[1].get_face_embeddings()
+            centroid = EmployeeFaceCentroid.objects.get(employee=gallery[1])
+            has_zero_centroid = EmployeeFaceCentroid.objects.filter(employee=gallery[2]).exists()
+            transaction.set_rollback(True)
+        assert low == pytest.approx(1.0, abs=1e-6) and high == pytest.approx(1.0, abs=1e-6)
+        assert counts == {'NV_G0': 3, 'NV_G1': 2, 'NV_G2': 0}
+        # Centroid tính lại từ các mẫu còn lại, nhân viên không còn mẫu thì không còn centroid
+        assert centroid.sample_count == 2
+        assert np.allclose(centroid.centroid, EmployeeFaceCentroid.compute_centroid(remaining), atol=1e-5)
+        assert not has_zero_centroid
+
+    def test_unnormalized_query_scores_cosine(self, gallery):
+        target = gallery[3].get_face_embeddings()[0] * 7.5
+        match, score = find_matching_employee(target)
+        assert match.employee_id == 'NV_G3'
+        assert score == pytest.approx(1.0, abs=1e-4)
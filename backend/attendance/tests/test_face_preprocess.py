@@ -0,0 +1,134 @@
+"""Face crop preprocessing tests"""
+import io
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from PIL import Image
+
+from attendance.face_recognition.preprocess import (
+    ARCFACE_TEMPLATE, FaceImageError, decode_image, estimate_similarity_transform,
+    parse_landmarks, preprocess_batch, preprocess_face,
+)
+
+
+def smooth_face(size=112):
+    """Ảnh 'khuôn mặt' tần số thấp để so sánh sau khi warp/thu nhỏ"""
+    ys, xs = np.mgrid[0:size, 0:size].astype(np.float32)
+    r = 128 + 100 * np.sin(xs / 9.0) * np.cos(ys / 13.0)
+    g = 128 + 100 * np.cos(xs / 11.0)
+    b = 128 + 100 * np.sin(ys / 7.0)
+    return np.stack([r, g, b], axis=-1).astype(np.uint8)
+
+
+def normalized(image):
+    return ((image.astype(np.float32) - 127.5) / 128.0).transpose(2, 0, 1)
+
+
+def encode(image, fmt='JPEG'):
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format=fmt, quality=95)
+    return buffer.getvalue()
+
+
+def place_face(face, frame_size=(1080, 1920), scale=3.0, angle=10.0):
+    """Đặt khuôn mặt (đã căn chỉnh) vào khung hình lớn với phép biến đổi tương tự, trả về (frame, landmarks)"""
+    theta = np.deg2rad(angle)
+    rotation = scale * np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+    offset = np.array([frame_size[1] / 2, frame_size[0] / 2]) - rotation @ np.array([56.0, 56.0])
+    # Ánh xạ ngược: mỗi pixel khung hình lấy màu từ vị trí tương ứng trên khuôn mặt
+    ys, xs = np.mgrid[0:frame_size[0], 0:frame_size[1]].astype(np.float64)
+    inverse = np.linalg.inv(rotation)
+    coords = np.tensordot(inverse, np.stack([xs - offset[0], ys - offset[1]]), axes=1)
+    fx = np.clip(np.round(coords[0]).astype(int), 0, 111)
+    fy = np.clip(np.round(coords[1]).astype(int), 0, 111)
+    inside = (coords[0] >= 0) & (coords[0] <= 111) & (coords[1] >= 0) & (coords[1] <= 111)
+    frame = np.where(inside[..., None], face[fy, fx], 0).astype(np.uint8)
+    landmarks = ARCFACE_TEMPLATE @ rotation.T + offset
+    return frame, landmarks
+
+
+class TestSimilarityTransform:
+
+    def test_recovers_known_transform(self):
+        theta = np.deg2rad(25)
+        rotation = 2.5 * np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+        src = ARCFACE_TEMPLATE
+        dst = src @ rotation.T + np.array([300.0, -40.0])
+        matrix = estimate_similarity_transform(src, dst)
+        assert np.allclose(matrix[:, :2], rotation, atol=1e-9)
+        assert np.allclose(matrix[:, 2], [300.0, -40.0], atol=1e-9)
+
+    def test_parse_landmarks(self):
+        assert parse_landmarks(ARCFACE_TEMPLATE.tolist()).shape == (5, 2)
+        assert parse_landmarks(None) is None
+        with pytest.raises(FaceImageError):
+            parse_landmarks([[1, 2], [3, 4]])
+        with pytest.raises(FaceImageError):
+            parse_landmarks([[float('nan'), 0]] * 5)
+
+
+class TestPreprocess:
+
+    def test_aligned_crop_is_identity(self):
+        face = smooth_face()
+        out = np.empty((3, 112, 112), dtype=np.float32)
+        preprocess_face(face, out)
+        assert np.allclose(out, normalized(face), atol=1e-5)
+
+    def test_writes_into_preallocated_buffer(self):
+        buffer = np.zeros((2, 3, 112, 112), dtype=np.float32)
+        result = preprocess_batch([encode(smooth_face(), 'PNG')] * 2, out=buffer)
+        assert result is buffer
+        assert np.allclose(buffer[0], normalized(smooth_face()), atol=1e-5)
+        assert np.array_equal(buffer[0], buffer[1])
+
+    def test_five_point_alignment_from_1080p_frame(self):
+        face = smooth_face()
+        frame, landmarks = place_face(face)
+        out = np.empty((3, 112, 112), dtype=np.float32)
+        preprocess_face(encode(frame), out, landmarks)
+        expected = normalized(face)
+        # Bỏ viền (nội suy ở mép khác nhau), so sánh tương quan phần trong
+        inner = (slice(None), slice(8, -8), slice(8, -8))
+        correlation = np.corrcoef(out[inner].ravel(), expected[inner].ravel())[0, 1]
+        assert correlation > 0.97
+
+    def test_jpeg_draft_decode_scale(self):
+        frame, landmarks = place_face(smooth_face(), scale=3.0)
+        image, scale = decode_image(encode(frame), landmarks)
+        # Mắt cách ~106 px, template cần ~35 px -> giải mã ở 1/2 (draft không xuống dưới mức cần)
+        assert scale == pytest.approx(0.5)
+        assert image.shape == (540, 960, 3)
+
+    def test_large_png_reduced(self):
+        image, scale = decode_image(encode(np.zeros((896, 896, 3), dtype=np.uint8), 'PNG'))
+        assert scale == pytest.approx(1 / 8)
+        assert image.shape == (112, 112, 3)
+
+    @pytest.mark.parametrize('mode', ['P', '1', 'I;16', 'RGBA', 'L'])
+    def test_png_modes_decoded_as_rgb(self, mode):
+        rng = np.random.default_rng(0)
+        if mode == 'I;16':
+            source = Image.fromarray(rng.integers(0, 65536, size=(448, 448), dtype=np.uint16))
+        else:
+            source = Image.fromarray(rng.integers(0, 256, size=(448, 448, 3), dtype=np.uint8)).convert(mode)
+        buffer = io.BytesIO()
+        source.save(buffer, format='PNG')
+        assert Image.open(io.BytesIO(buffer.getvalue())).mode == mode
+        image, scale = decode_image(buffer.getvalue())
+        assert scale == pytest.approx(1 / 4)
+        assert image.shape == (112, 112, 3) and image.dtype == np.uint8
+
+    def test_invalid_image(self):
+        with pytest.raises(FaceImageError):
+            preprocess_face(b'garbage', np.empty((3, 112, 112), dtype=np.float32))
+
+
+def test_benchmark_command():
+    out = StringIO()
+    call_command('benchmark_face_preprocess', count=2, repeat=1, stdout=out)
+    output = out.getvalue()
+    assert 'Giải mã draft' in output
+    assert 'Toàn bộ tiền xử lý' in output
@@ -0,0 +1,91 @@
+"""Binary COPY gallery loader tests"""
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+
+from attendance.face_recognition import bulk_loader
+from attendance.face_recognition.bulk_loader import ROW_DTYPE, _RowSink, load_gallery_arrays
+from attendance.face_recognition.gallery import load_gallery_data, load_gallery_data_orm
+from attendance.models import Employee
+from attendance.tests.helpers import random_rows
+
+
+def copy_stream(employee_ids, vectors):
+    """Dữ liệu COPY nhị phân giống PostgreSQL gửi về cho (bigint, vector)"""
+    records = np.zeros(len(employee_ids), dtype=ROW_DTYPE)
+    records['field_count'] = 2
+    records['id_length'] = 8
+    records['employee_id'] = employee_ids
+    records['vector_length'] = 4 + 4 * 512
+    records['dim'] = 512
+    records['vector'] = vectors
+    header = bulk_loader.COPY_SIGNATURE + b'\0' * 8
+    return header + records.tobytes() + bulk_loader.TRAILER
+
+
+class TestRowSink:
+
+    @pytest.mark.parametrize('flush_bytes', [1, 2070, 5000, 1 << 20])
+    def test_decodes_rows_split_across_chunks(self, flush_bytes):
+        rng = np.random.default_rng(0)
+        vectors = random_rows(rng, 9)
+        stream = copy_stream(np.arange(9) + 100, vectors)
+
+        # Dung lượng ban đầu nhỏ hơn số hàng: mảng đích phải tự mở rộng
+        sink = _RowSink(capacity=4, flush_bytes=flush_bytes)
+        for start in range(0, len(stream), 1000):
+            sink.write(stream[start:start + 1000])
+        employee_ids, matrix = sink.result()
+
+        assert np.array_equal(employee_ids, np.arange(9) + 100)
+        assert np.array_equal(matrix, vectors)
+        assert matrix.dtype == np.float32 and matrix.dtype.isnative
+
+    def test_truncated_stream(self):
+        stream = copy_stream([1, 2], random_rows(np.random.default_rng(0), 2))
+        sink = _RowSink(capacity=2)
+        sink.write(stream[:-100])
+        with pytest.raises(ValueError):
+            sink.result()
+
+    def test_rejects_non_binary_stream(self):
+        with pytest.raises(ValueError):
+            _RowSink(capacity=1, flush_bytes=1).write(b'1\t[0.1,0.2]\n' * 4)
+
+
+@pytest.mark.django_db
+class TestBulkGalleryLoad:
+
+    def test_matches_orm_path(self):
+        rng = np.random.default_rng(1)
+        for index, count in enumerate([3, 1, 2]):
+            employee = Employee.objects.create(employee_id=f'NV_COPY{index}')
+            employee.set_face_embeddings(list(random_rows(rng, count)))
+        inactive = Employee.objects.create(employee_id='NV_COPY_OFF', is_active=False)
+        inactive.set_face_embeddings(list(random_rows(rng, 2)))
+
+        employee_ids, matrix = load_gallery_arrays(flush_bytes=4096)
+        assert len(employee_ids) == 6
+        assert inactive.pk not in employee_ids
+
+        bulk = load_gallery_data()
+        orm = load_gallery_data_orm()
+        for name in orm._fields:
+            assert np.allclose(getattr(bulk, name), getattr(orm, name), atol=1e-6)
+
+    def test_empty_table(self):
+        employee_ids, matrix = load_gallery_arrays()
+        assert employee_ids.shape == (0,)
+        assert matrix.shape == (0, 512)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_command_rolls_back():
+    out = StringIO()
+    call_command('benchmark_gallery_load', rows='50', repeat=1, stdout=out)
+    lines = out.getvalue().splitlines()
+    assert any('orm' in line and line.split()[0] == '50' for line in lines)
+    assert any('copy' in line and line.split()[0] == '50' for line in lines)
+    assert not Employee.objects.filter(employee_id__startswith='LOAD_').exists()
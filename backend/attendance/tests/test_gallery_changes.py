@@ -0,0 +1,145 @@
+"""Incremental face gallery updates (change log) tests"""
+from io import StringIO
+
+import numpy as np
+import psycopg2
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from attendance.face_recognition.gallery import FaceGallery, GallerySnapshot, build_gallery_data
+from attendance.models import Employee, FaceGalleryChange
+from attendance.tests.helpers import random_rows
+
+
+def search(snapshot, query, k=3, shortlist=0):
+    return snapshot.search_top_many(query[None, :], k, shortlist)[0]
+
+
+class TestGallerySnapshot:
+
+    def setup_method(self):
+        rng = np.random.default_rng(0)
+        self.rows = random_rows(rng, 6)
+        self.new_rows = random_rows(rng, 2)
+        # Nhân viên 1, 2, 3 mỗi người 2 mẫu
+        self.snapshot = GallerySnapshot(build_gallery_data([1, 1, 2, 2, 3, 3], self.rows))
+
+    @pytest.mark.parametrize('shortlist', [0, 1])
+    def test_apply_replaces_and_removes_employees(self, shortlist):
+        # Nhân viên 2 đăng ký lại, nhân viên 3 bị xóa (không còn mẫu)
+        updated = self.snapshot.apply({2, 3}, [2, 2], self.new_rows)
+        assert len(updated) == 4
+        assert updated.pending_rows == 6
+        assert updated.base is self.snapshot.base
+
+        pks, scores = search(updated, self.new_rows[0], shortlist=shortlist)
+        assert pks[0] == 2 and scores[0] == pytest.approx(1.0, abs=1e-5)
+        for old in self.rows[2:]:
+            pks, _ = search(updated, old, k=6, shortlist=shortlist)
+            # Mẫu cũ của nhân viên 2, 3 không còn được trả về
+            assert not np.any(np.isin(pks[:1], [3])) and len(pks) <= 4
+
+        # Snapshot cũ không bị thay đổi (người đọc đang giữ vẫn thấy dữ liệu cũ)
+        assert len(self.snapshot) == 6
+        pks, _ = search(self.snapshot, self.rows[4])
+        assert pks[0] == 3
+
+    def test_repeated_changes_replace_delta(self):
+        first = self.snapshot.apply({4}, [4], self.new_rows[:1])
+        second = first.apply({4}, [4], self.new_rows[1:])
+        assert list(second.delta.employee_ids) == [4]
+        pks, _ = search(second, self.new_rows[0], k=7)
+        assert np.allclose(second.delta.matrix, self.new_rows[1:])
+        assert len(second) == 7
+
+    def test_compact_matches_fresh_build(self):
+        updated = self.snapshot.apply({2, 3}, [2, 2], self.new_rows).compact()
+        expected = build_gallery_data([1, 1, 2, 2], np.concatenate([self.rows[:2], self.new_rows]))
+        assert updated.pending_rows == 0
+        for name in expected._fields:
+            assert np.allclose(getattr(updated.base, name), getattr(expected, name), atol=1e-6)
+
+
+def other_connection():
+    """Kết nối thứ hai tới cùng database (mô phỏng một worker/transaction khác)"""
+    params = connection.get_connection_params()
+    return psycopg2.connect(**params)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestChangeLogPolling:
+
+    def make_worker(self):
+        return FaceGallery(poll_interval=1e-3, compact_ratio=0.1)
+
+    def test_worker_applies_changes_without_full_reload(self):
+        rng = np.random.default_rng(1)
+        employees = [Employee.objects.create(employee_id=f'NV_CL{i}') for i in range(3)]
+        for employee in employees:
+            employee.set_face_embeddings(list(random_rows(rng, 2)))
+        worker = self.make_worker()
+        worker.ensure_loaded()
+        base = worker.snapshot.base
+
+        query = random_rows(rng, 1)[0]
+        employees[0].set_face_embeddings([query])
+        employees[1].clear_face_embeddings()
+        employees[2].work_status = 'TERMINATED'
+        employees[2].save()
+
+        pk, score = worker.search(query)
+        assert pk == employees[0].pk and score == pytest.approx(1.0, abs=1e-5)
+        assert worker.version == 1
+        assert worker.snapshot.base is base
+        assert len(worker) == 1
+
+    def test_out_of_order_commit_is_not_missed(self):
+        rng = np.random.default_rng(2)
+        early, late = (Employee.objects.create(employee_id=f'NV_ORD{i}') for i in range(2))
+        worker = self.make_worker()
+        worker.ensure_loaded()
+
+        # Transaction A bắt đầu ghi trước (txid nhỏ hơn) nhưng commit sau transaction B
+        early_rows = random_rows(rng, 1)
+        other = other_connection()
+        try:
+            with other.cursor() as cursor:
+                cursor.execute("SELECT txid_current()")
+                cursor.execute(
+                    "INSERT INTO attendance_employeefaceembedding (employee_id, embedding, created_at) "
+                    "VALUES (%s, %s::vector, now())", [early.pk, str(early_rows[0].tolist())])
+                cursor.execute(
+                    "INSERT INTO attendance_facegallerychange (employee_pk, created_at) VALUES (%s, now())",
+                    [early.pk])
+
+            late_rows = random_rows(rng, 1)
+            late.set_face_embeddings(list(late_rows))
+            assert worker.search(late_rows[0])[0] == late.pk
+            assert worker.search(early_rows[0])[0] != early.pk
+
+            other.commit()
+        finally:
+            other.close()
+        assert worker.search(early_rows[0])[0] == early.pk
+
+    def test_compaction_after_many_changes(self):
+        rng = np.random.default_rng(3)
+        worker = self.make_worker()
+        worker.ensure_loaded()
+        employee = Employee.objects.create(employee_id='NV_COMPACT')
+        employee.set_face_embeddings(list(random_rows(rng, 300)))
+        worker.ensure_loaded()
+        # Vượt ngưỡng tối thiểu 256 mẫu: delta được gộp vào base ở luồng nền
+        worker.wait_idle()
+        assert worker.snapshot.pending_rows == 0
+        assert len(worker.snapshot.base.employee_ids) == 300
+
+    def test_prune_command(self):
+        Employee.objects.create(employee_id='NV_PRUNE').set_face_embeddings(
+            list(random_rows(np.random.default_rng(4), 1)))
+        FaceGalleryChange.objects.update(created_at='2000-01-01T00:00:00Z')
+        out = StringIO()
+        call_command('prune_face_gallery_changes', stdout=out)
+        assert 'Đã xóa 1 dòng' in out.getvalue()
+        assert not FaceGalleryChange.objects.exists()
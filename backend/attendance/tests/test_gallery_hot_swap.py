@@ -0,0 +1,135 @@
+"""Read-copy-update face gallery hot swap tests"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from attendance.face_recognition.gallery import FaceGallery, build_gallery_data
+
+EMPLOYEES = 40
+SAMPLES = 2
+
+
+def rows_for(version):
+    """Mẫu của phiên bản gallery `version` (tất định để luồng đọc tự tạo lại truy vấn)"""
+    rng = np.random.default_rng(version)
+    rows = rng.normal(size=(EMPLOYEES * SAMPLES, 512)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def ids_for(version):
+    # employee pk mã hóa phiên bản: pk // 1000 == version
+    return np.repeat(version * 1000 + np.arange(EMPLOYEES), SAMPLES)
+
+
+class SlowLoader:
+    """Nạp gallery mất `delay` giây, chia đôi trước và sau khi dựng dữ liệu"""
+
+    def __init__(self, delay, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        version = self.calls
+        time.sleep(self.delay / 2)
+        if self.fail and version > 1:
+            raise RuntimeError('database unavailable')
+        data = build_gallery_data(ids_for(version), rows_for(version))
+        time.sleep(self.delay / 2)
+        return data
+
+
+def make_gallery(loader):
+    # Không dùng nhật ký thay đổi: mọi cập nhật là dựng lại toàn bộ snapshot
+    return FaceGallery(poll_interval=0, load_data=loader)
+
+
+class TestHotSwap:
+
+    def test_concurrent_scans_during_reloads(self):
+        loader = SlowLoader(delay=0.2)
+        gallery = make_gallery(loader)
+        gallery.ensure_loaded()
+
+        stop = threading.Event()
+        errors, latencies = [], []
+        reloads = 6
+
+        def scanner(seed):
+            rng = np.random.default_rng(seed)
+            last_version = 0
+            while not stop.is_set():
+                expected_version = gallery.version
+                row = int(rng.integers(EMPLOYEES * SAMPLES))
+                query = rows_for(expected_version)[row]
+                started = time.perf_counter()
+                pks, scores = gallery.search_top(query, 3)
+                latencies.append(time.perf_counter() - started)
+
+                versions = set((pks // 1000).tolist())
+                if len(versions) != 1:
+                    errors.append(f'kết quả trộn nhiều phiên bản: {versions}')
+                    continue
+                version = versions.pop()
+                if version < max(last_version, expected_version):
+                    errors.append(f'phiên bản lùi lại: {version} < {max(last_version, expected_version)}')
+                if version == expected_version and (pks[0] != ids_for(version)[row] or scores[0] < 0.999):
+                    # Ma trận và id không cùng một snapshot
+                    errors.append(f'đọc rách ở phiên bản {version}: {pks[0]}, {scores[0]}')
+                last_version = version
+
+        def reloader():
+            for _ in range(reloads):
+                gallery.refresh()
+                time.sleep(0.01)
+                gallery.wait_idle()
+            stop.set()
+
+        threads = [threading.Thread(target=scanner, args=(seed,)) for seed in range(4)]
+        threads.append(threading.Thread(target=reloader))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+
+        assert not errors, errors[:5]
+        assert loader.calls == reloads + 1
+        assert gallery.version == reloads + 1
+        assert len(latencies) > 100
+        # Không lượt quét nào phải chờ một lần nạp (loader mất 200 ms)
+        assert max(latencies) < loader.delay / 2
+        assert np.percentile(latencies, 99) < 0.02
+
+    def test_failed_reload_keeps_current_snapshot(self):
+        loader = SlowLoader(delay=0.02, fail=True)
+        gallery = make_gallery(loader)
+        gallery.ensure_loaded()
+        snapshot = gallery.snapshot
+
+        gallery.refresh()
+        gallery.wait_idle()
+        assert loader.calls == 2
+        assert gallery.snapshot is snapshot
+        pks, scores = gallery.search_top(rows_for(1)[0], 1)
+        assert pks[0] == ids_for(1)[0] and scores[0] == pytest.approx(1.0, abs=1e-5)
+
+    def test_single_background_builder(self):
+        loader = SlowLoader(delay=0.1)
+        gallery = make_gallery(loader)
+        gallery.ensure_loaded()
+        for _ in range(5):
+            gallery.refresh()
+        gallery.wait_idle()
+        # Các yêu cầu đến khi đang dựng bị gộp vào lần dựng đang chạy
+        assert loader.calls == 2
+
+    def test_explicit_reload_waits_for_new_snapshot(self):
+        loader = SlowLoader(delay=0.02)
+        gallery = make_gallery(loader)
+        gallery.ensure_loaded()
+        gallery.reload()
+        pks, _ = gallery.search_top(rows_for(2)[0], 1)
+        assert pks[0] // 1000 == 2
@@ -0,0 +1,87 @@
+"""Micro-batching scheduler tests"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from attendance.face_recognition.batching import MicroBatcher
+
+
+def run_concurrently(target, count):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(i):
+        barrier.wait()
+        results[i] = target(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestMicroBatcher:
+
+    def test_concurrent_requests_are_batched(self):
+        batch_sizes = []
+
+        def run_batch(items):
+            batch_sizes.append(len(items))
+            return np.asarray(items) * 10
+
+        batcher = MicroBatcher(run_batch, max_batch_size=64, max_wait_ms=100)
+        try:
+            results = run_concurrently(lambda i: batcher.infer([i, i + 100]), 8)
+        finally:
+            batcher.close()
+
+        # Mỗi request nhận đúng kết quả của mình dù chạy chung lô
+        for i, result in enumerate(results):
+            assert list(result) == [i * 10, (i + 100) * 10]
+        assert sum(batch_sizes) == 16
+        assert len(batch_sizes) < 8
+
+        stats = batcher.stats()
+        assert stats['requests_total'] == 8
+        assert stats['items_total'] == 16
+        assert stats['batch_size']['max'] == max(batch_sizes)
+
+    def test_max_batch_size_flushes_early(self):
+        batch_sizes = []
+
+        def run_batch(items):
+            batch_sizes.append(len(items))
+            return np.asarray(items)
+
+        batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=10_000)
+        try:
+            started = time.perf_counter()
+            run_concurrently(lambda i: batcher.infer([i]), 8)
+            elapsed = time.perf_counter() - started
+        finally:
+            batcher.close()
+        assert max(batch_sizes) <= 4
+        # Không phải chờ hết cửa sổ 10 giây khi lô đã đầy
+        assert elapsed < 5
+
+    def test_errors_reach_every_waiting_request(self):
+        def run_batch(items):
+            raise RuntimeError('inference failed')
+
+        batcher = MicroBatcher(run_batch, max_wait_ms=50)
+        try:
+            results = run_concurrently(lambda i: batcher.submit([i]).exception(timeout=5), 4)
+        finally:
+            batcher.close()
+        assert all(isinstance(e, RuntimeError) for e in results)
+        assert batcher.stats()['errors_total'] >= 1
+
+    def test_closed_batcher_rejects_requests(self):
+        batcher = MicroBatcher(lambda items: np.asarray(items))
+        batcher.close()
+        with pytest.raises(RuntimeError):
+            batcher.submit([1])
@@ -99,7 +99,8 @@ class TestEmployee:
         embeddings = [np.random.rand(512) for _ in range(3)]
         employee.set_face_embeddings(embeddings)
         employee.save()
-        assert employee.face_embeddings is not None
+        assert employee.face_sample_count == 3
+        assert Employee.objects.get(pk=employee.pk).has_face
     
     def test_get_face_embeddings(self, employee):
         embeddings = [np.random.rand(512) for _ in range(3)]
@@ -118,7 +119,8 @@ class TestEmployee:
         employee.save()
         result = employee.clear_face_embeddings()
         assert result == True
-        assert employee.face_embeddings is None
+        assert employee.face_sample_count == 0
+        assert not Employee.objects.get(pk=employee.pk).has_face
     
     def test_auto_status_terminated(self, db, user):
         emp = Employee.objects.create(user=user, employee_id='NV100', work_status='TERMINATED')
@@ -0,0 +1,268 @@
+"""Server-side ONNX embedding extraction tests"""
+import base64
+import io
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+from django.conf import settings as django_settings
+
+ort = pytest.importorskip('onnxruntime')
+onnx = pytest.importorskip('onnx')
+
+from attendance.face_recognition import onnx_embedder  # noqa: E402
+from attendance.face_recognition.onnx_embedder import OnnxFaceEmbedder  # noqa: E402
+from attendance.face_recognition.preprocess import FaceImageError  # noqa: E402
+from attendance.models import Employee  # noqa: E402
+
+
+def build_test_model(path, output_dim=512, fixed_batch=False):
+    """Model nhỏ thay cho MobileFaceNet: AveragePool 8x8 -> Flatten -> MatMul (588 x output_dim)"""
+    from onnx import TensorProto, helper, numpy_helper
+
+    batch = 1 if fixed_batch else 'N'
+    weights = np.random.default_rng(0).normal(size=(3 * 14 * 14, output_dim)).astype(np.float32)
+    graph = helper.make_graph(
+        [
+            helper.make_node('AveragePool', ['input.1'], ['pooled'], kernel_shape=[8, 8], strides=[8, 8]),
+            helper.make_node('Flatten', ['pooled'], ['flat']),
+            helper.make_node('MatMul', ['flat', 'W'], ['516']),
+        ],
+        'test_embedder',
+        [helper.make_tensor_value_info('input.1', TensorProto.FLOAT, [batch, 3, 112, 112])],
+        [helper.make_tensor_value_info('516', TensorProto.FLOAT, [batch, output_dim])],
+        initializer=[numpy_helper.from_array(weights, 'W')],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return path
+
+
+def face_png(seed):
+    from PIL import Image
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(112, 112, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def server_inference(settings, tmp_path):
+    settings.FACE_SERVER_INFERENCE = True
+    settings.FACE_EMBEDDING_MODEL_PATH = str(build_test_model(tmp_path / 'embedder.onnx'))
+    settings.FACE_ONNX_POOL_SIZE = 2
+    onnx_embedder._embedder_instance = None
+    yield onnx_embedder.get_face_embedder()
+    onnx_embedder._embedder_instance = None
+
+
+class TestOnnxFaceEmbedder:
+
+    def test_embeddings_are_normalized(self, server_inference):
+        embeddings = server_inference.embed([face_png(1), face_png(2)])
+        assert embeddings.shape == (2, 512)
+        assert embeddings.dtype == np.float32
+        assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0, atol=1e-5)
+        # Cùng một ảnh cho cùng một embedding, ảnh khác cho embedding khác
+        assert np.allclose(server_inference.embed([face_png(1)])[0], embeddings[0], atol=1e-5)
+        assert float(embeddings[0] @ embeddings[1]) < 0.99
+
+    def test_forked_worker_builds_its_own_embedder(self, server_inference, settings):
+        settings.FACE_INFERENCE_BATCH_WINDOW_MS = 1
+        onnx_embedder._embedder_instance = None
+        parent = onnx_embedder.get_face_embedder()
+        expected = parent.embed([face_png(4)])[0]
+        pid = os.fork()
+        if pid == 0:
+            # Worker gunicorn --preload: batcher của master không có thread trong tiến trình con
+            try:
+                child = onnx_embedder.get_face_embedder()
+                ok = child is not parent and np.allclose(child.embed([face_png(4)])[0], expected, atol=1e-5)
+            except BaseException:
+                ok = False
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        assert onnx_embedder.get_face_embedder() is parent
+        parent.close()
+
+    def test_fixed_batch_model(self, tmp_path):
+        embedder = OnnxFaceEmbedder(str(build_test_model(tmp_path / 'fixed.onnx', fixed_batch=True)), pool_size=1)
+        assert embedder.fixed_batch
+        assert embedder.embed([face_png(1), face_png(2), face_png(3)]).shape == (3, 512)
+
+    def test_concurrent_requests_share_pool(self, server_inference):
+        expected = server_inference.embed([face_png(5)])[0]
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(server_inference.embed([face_png(5)])[0])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert all(np.allclose(r, expected, atol=1e-5) for r in results)
+        assert server_inference._sessions.qsize() == server_inference.pool_size
+
+    def test_warmup(self, server_inference):
+        server_inference.warmup()
+        assert server_inference._sessions.qsize() == 2
+
+    def test_rejects_non_embedding_model(self, tmp_path):
+        with pytest.raises(ValueError):
+            OnnxFaceEmbedder(str(build_test_model(tmp_path / 'det.onnx', output_dim=4)), pool_size=1)
+
+    def test_detector_model_in_repo_rejected(self):
+        model = Path(django_settings.BASE_DIR).parent / 'model' / 'mobilefacenet_insightface_det.onnx'
+        if not model.exists():
+            pytest.skip('model directory not available')
+        with pytest.raises(ValueError):
+            OnnxFaceEmbedder(str(model), pool_size=1)
+
+    def test_invalid_image(self, server_inference):
+        with pytest.raises(FaceImageError):
+            server_inference.embed([b'not an image'])
+
+
+@pytest.mark.django_db(transaction=True)
+class TestImageEndpoints:
+
+    @pytest.fixture(autouse=True)
+    def no_push(self, monkeypatch):
+        monkeypatch.setattr('attendance.views.attendance_views.send_attendance_notification',
+                            lambda *args, **kwargs: None)
+
+    def test_process_attendance_with_image_upload(self, client, server_inference):
+        emp = Employee.objects.create(employee_id='NV_IMG', first_name='Img', last_name='Test')
+        emp.set_face_embeddings(server_inference.embed([face_png(10), face_png(11)]))
+        Employee.objects.create(employee_id='NV_OTHER').set_face_embeddings(
+            server_inference.embed([face_png(20)]))
+
+        upload = io.BytesIO(face_png(10))
+        upload.name = 'face.png'
+        response = client.post('/process-attendance/', {'image': upload})
+        assert response.status_code == 200, response.content
+        assert response.json()['employee']['id'] == 'NV_IMG'
+
+    def test_register_face_with_base64_images(self, admin_client, server_inference):
+        emp = Employee.objects.create(employee_id='NV_REG_IMG')
+        images = [base64.b64encode(face_png(i)).decode() for i in (30, 31)]
+        images[0] = 'data:image/png;base64,' + images[0]
+        response = admin_client.post('/register-face/', json.dumps({
+            'employee_id': 'NV_REG_IMG', 'images': images,
+        }), content_type='application/json')
+        assert response.status_code == 200, response.content
+        assert len(emp.get_face_embeddings()) == 2
+
+    @pytest.mark.parametrize('image', ['không phải base64!', 123])
+    def test_invalid_base64_image_rejected(self, client, admin_client, server_inference, image):
+        response = client.post('/process-attendance/', json.dumps({'image': image}),
+                               content_type='application/json')
+        assert response.status_code == 400, response.content
+        Employee.objects.create(employee_id='NV_BAD_IMG')
+        response = admin_client.post('/register-face/', json.dumps({
+            'employee_id': 'NV_BAD_IMG', 'images': [image],
+        }), content_type='application/json')
+        assert response.status_code == 400, response.content
+
+    def test_images_rejected_when_disabled(self, client, settings):
+        settings.FACE_SERVER_INFERENCE = False
+        response = client.post('/process-attendance/', json.dumps({
+            'image': base64.b64encode(face_png(1)).decode(),
+        }), content_type='application/json')
+        assert response.status_code == 400
+
+
+class TestBatchedInference:
+
+    def test_batched_results_match_direct(self, tmp_path):
+        model_path = str(build_test_model(tmp_path / 'embedder.onnx'))
+        direct = OnnxFaceEmbedder(model_path, pool_size=1)
+        batched = OnnxFaceEmbedder(model_path, pool_size=1, batch_window_ms=20, max_batch_size=8)
+        try:
+            images = [face_png(i) for i in range(6)]
+            expected = direct.embed(images)
+            results = [None] * len(images)
+
+            def worker(i):
+                results[i] = batched.embed([images[i]])[0]
+
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(images))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert np.allclose(np.stack(results), expected, atol=1e-5)
+            assert batched.stats()['batching']['items_total'] == 6
+        finally:
+            batched.close()
+
+    def test_metrics_endpoint(self, client, settings, server_inference):
+        server_inference.embed([face_png(1)])
+        data = client.get('/api/metrics/').json()
+        assert data['face_inference']['pool_size'] == 2
+        assert data['face_inference']['batching'] is None
+
+    def test_benchmark_command(self, tmp_path):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('benchmark_face_inference', model=str(build_test_model(tmp_path / 'bench.onnx')),
+                     windows='0,2', concurrency=4, requests=20, pool_size=1, stdout=out)
+        output = out.getvalue()
+        assert 'req/s' in output
+        assert len(output.strip().splitlines()) == 4
+
+
+@pytest.fixture
+def face_crops_dir(tmp_path):
+    crops = tmp_path / 'crops'
+    crops.mkdir()
+    for i in range(12):
+        (crops / f'face_{i:02d}.png').write_bytes(face_png(100 + i))
+    return crops
+
+
+class TestInt8Variant:
+
+    def test_quantize_and_benchmark(self, tmp_path, face_crops_dir):
+        from io import StringIO
+        from django.core.management import call_command
+        model_path = build_test_model(tmp_path / 'embedder.onnx')
+        call_command('quantize_face_model', str(face_crops_dir), model=str(model_path), stdout=StringIO())
+        int8_path = tmp_path / 'embedder_int8.onnx'
+        assert int8_path.exists()
+
+        fp32 = OnnxFaceEmbedder(str(model_path), pool_size=1)
+        int8 = OnnxFaceEmbedder(str(int8_path), pool_size=1)
+        images = [face_png(200 + i) for i in range(4)]
+        agreement = np.sum(fp32.embed(images) * int8.embed(images), axis=1)
+        assert agreement.min() > 0.95
+
+        out = StringIO()
+        call_command('benchmark_face_quantization', str(face_crops_dir), fp32=str(model_path),
+                     repeat=1, batch_size=4, stdout=out)
+        output = out.getvalue()
+        assert 'Cosine(FP32, INT8)' in output
+        assert 'rank-1' in output
+
+    def test_runtime_variant_selects_model(self, settings, tmp_path):
+        from attendance.face_recognition.quantization import resolve_model_path
+        settings.FACE_EMBEDDING_MODEL_PATH = str(tmp_path / 'embedder.onnx')
+        settings.FACE_EMBEDDING_INT8_MODEL_PATH = ''
+        settings.FACE_MODEL_VARIANT = 'int8'
+        assert resolve_model_path() == str(tmp_path / 'embedder_int8.onnx')
+        settings.FACE_MODEL_VARIANT = 'fp32'
+        assert resolve_model_path() == str(tmp_path / 'embedder.onnx')
+        with pytest.raises(ValueError):
+            resolve_model_path('fp16')
@@ -0,0 +1,186 @@
+"""Bounded push notification dispatcher tests"""
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from attendance.push.dispatcher import NotificationDispatcher, get_notification_dispatcher
+
+
+class Recorder:
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.started = threading.Event()
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, value):
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        with self.lock:
+            self.calls.append((value, threading.current_thread().name))
+        return True
+
+
+def blocked_dispatcher(overflow, max_queue=2):
+    """Dispatcher 1 worker đang bận với tác vụ đầu tiên (gate chưa mở)"""
+    gate = threading.Event()
+    recorder = Recorder(gate)
+    dispatcher = NotificationDispatcher(workers=1, max_queue=max_queue, overflow=overflow, name='test')
+    dispatcher.submit(recorder, 0)
+    assert recorder.started.wait(5)
+    return dispatcher, recorder, gate
+
+
+class TestNotificationDispatcher:
+
+    def test_fixed_worker_pool(self):
+        recorder = Recorder()
+        dispatcher = NotificationDispatcher(workers=3, max_queue=100, name='pool')
+        threads_before = threading.active_count()
+        for i in range(50):
+            assert dispatcher.submit(recorder, i)
+        assert threading.active_count() == threads_before
+        assert dispatcher.wait_idle(5)
+        assert sorted(value for value, _ in recorder.calls) == list(range(50))
+        assert {name for _, name in recorder.calls} <= {f'pool-dispatcher-{i}' for i in range(3)}
+        stats = dispatcher.stats()
+        assert stats['sent_total'] == 50 and stats['queue_depth'] == 0
+        assert stats['wait_ms']['max'] >= stats['wait_ms']['mean'] >= 0
+        dispatcher.close(5)
+
+    def test_overflow_drop(self):
+        dispatcher, recorder, gate = blocked_dispatcher('drop')
+        accepted = [dispatcher.submit(recorder, i) for i in range(1, 5)]
+        assert accepted == [True, True, False, False]
+        assert dispatcher.stats()['queue_depth'] == 2
+        gate.set()
+        dispatcher.wait_idle(5)
+        stats = dispatcher.stats()
+        assert (stats['sent_total'], stats['dropped_total']) == (3, 2)
+        dispatcher.close(5)
+
+    def test_overflow_inline_applies_backpressure(self):
+        dispatcher, recorder, gate = blocked_dispatcher('inline', max_queue=1)
+        dispatcher.submit(recorder, 1)
+        gate.set()
+        # Hàng đợi đầy: gửi ngay trong thread gọi
+        assert dispatcher.submit(recorder, 2)
+        dispatcher.wait_idle(5)
+        names = dict(recorder.calls)
+        assert names[2] == threading.current_thread().name
+        assert dispatcher.stats()['inline_total'] == 1
+        dispatcher.close(5)
+
+    def test_close_drains_queue(self):
+        dispatcher, recorder, gate = blocked_dispatcher('drop', max_queue=20)
+        for i in range(1, 21):
+            dispatcher.submit(recorder, i)
+        gate.set()
+        dispatcher.close(5)
+        assert len(recorder.calls) == 21
+        assert not dispatcher.submit(recorder, 99)
+
+    def test_close_with_full_queue_respects_timeout(self):
+        dispatcher, recorder, gate = blocked_dispatcher('drop', max_queue=1)
+        dispatcher.submit(recorder, 1)
+        started = time.monotonic()
+        # Worker đang treo và hàng đợi đầy: không còn chỗ cho tín hiệu dừng
+        dispatcher.close(0.2)
+        assert time.monotonic() - started < 2
+        gate.set()
+
+    def test_submit_rejected_once_closing(self):
+        dispatcher, recorder, gate = blocked_dispatcher('inline', max_queue=1)
+        closer = threading.Thread(target=dispatcher.close, args=(5,))
+        closer.start()
+        while not dispatcher._closed:
+            time.sleep(0.001)
+        # Kể cả overflow 'inline': không nhận thêm tác vụ sau khi bắt đầu dừng
+        assert not dispatcher.submit(recorder, 1)
+        gate.set()
+        closer.join(5)
+        assert dispatcher.wait_idle(1)
+        assert [value for value, _ in recorder.calls] == [0]
+        assert dispatcher.stats()['dropped_total'] == 1
+
+    def test_failures_counted(self):
+        def failing(value):
+            if value:
+                raise RuntimeError('provider down')
+            return False
+
+        dispatcher = NotificationDispatcher(workers=1, name='fail')
+        dispatcher.submit(failing, 0)
+        dispatcher.submit(failing, 1)
+        dispatcher.wait_idle(5)
+        stats = dispatcher.stats()
+        assert (stats['sent_total'], stats['failed_total']) == (0, 2)
+        dispatcher.close(5)
+
+    def test_future_results_complete_after_worker_moves_on(self):
+        futures = []
+
+        def queue_send(value):
+            futures.append(Future())
+            return futures[-1]
+
+        dispatcher = NotificationDispatcher(workers=1, name='future')
+        for i in range(3):
+            dispatcher.submit(queue_send, i)
+        # Worker duy nhất không bị giữ bởi Future chưa xong
+        deadline = time.monotonic() + 5
+        while len(futures) < 3 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert len(futures) == 3
+        assert not dispatcher.wait_idle(0.05)
+
+        futures[0].set_result(True)
+        futures[1].set_result(False)
+        futures[2].set_exception(RuntimeError('batch failed'))
+        assert dispatcher.wait_idle(5)
+        stats = dispatcher.stats()
+        assert (stats['sent_total'], stats['failed_total']) == (1, 2)
+        dispatcher.close(5)
+
+    def test_pending_futures_count_against_queue_limit(self):
+        futures = []
+
+        def stalled_send(value):
+            futures.append(Future())
+            return futures[-1]
+
+        dispatcher = NotificationDispatcher(workers=1, max_queue=2, name='stalled')
+        for i in range(3):
+            assert dispatcher.submit(stalled_send, i)
+            deadline = time.monotonic() + 5
+            while len(futures) <= i and time.monotonic() < deadline:
+                time.sleep(0.001)
+        # Nhà cung cấp không trả lời: hàng đợi dispatcher trống nhưng thông báo dồn ở
+        # batcher vẫn chiếm chỗ (max_queue + workers), thông báo mới bị bỏ
+        stats = dispatcher.stats()
+        assert (stats['queue_depth'], stats['in_flight']) == (0, 3)
+        assert not dispatcher.submit(stalled_send, 3)
+        assert dispatcher.stats()['dropped_total'] == 1
+
+        for future in futures:
+            future.set_result(True)
+        assert dispatcher.wait_idle(5)
+        assert dispatcher.stats()['sent_total'] == 3
+        dispatcher.close(5)
+
+    def test_invalid_overflow_policy(self):
+        with pytest.raises(ValueError):
+            NotificationDispatcher(overflow='spill')
+
+
+def test_metrics_endpoint_reports_dispatcher(client):
+    dispatcher = get_notification_dispatcher()
+    dispatcher.submit(lambda: True)
+    dispatcher.wait_idle(5)
+    response = client.get('/api/metrics/')
+    stats = response.json()['push_notifications']
+    assert stats['submitted_total'] >= 1
+    assert {'queue_depth', 'dropped_total', 'wait_ms', 'send_ms'} <= set(stats)
@@ -0,0 +1,196 @@
+"""Pooled, batched Expo push client tests (against a local stub of exp.host)"""
+import itertools
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from attendance.models import Employee, ExpoPushTicket
+from attendance.push import expo
+from attendance.views.push_notification import send_attendance_notifications
+
+
+class StubExpoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server.calls.append((self.path, payload, self.client_address[1], self.headers.get('Authorization')))
+
+        if server.fail_next:
+            server.fail_next -= 1
+            return self.reply(429, {'errors': [{'code': 'TOO_MANY_REQUESTS', 'message': 'rate limited'}]})
+        if self.path.endswith('/send'):
+            data = []
+            for message in payload:
+                if 'dead' in message['to']:
+                    data.append({'status': 'error', 'message': f"{message['to']} is not registered",
+                                 'details': {'error': 'DeviceNotRegistered'}})
+                else:
+                    ticket_id = f'ticket-{next(server.ids)}'
+                    server.issued[ticket_id] = message['to']
+                    data.append({'status': 'ok', 'id': ticket_id})
+        else:
+            data = {}
+            for ticket_id in payload['ids']:
+                token = server.issued.get(ticket_id)
+                if token is None:
+                    continue
+                if token in server.uninstalled:
+                    data[ticket_id] = {'status': 'error', 'message': 'uninstalled',
+                                       'details': {'error': 'DeviceNotRegistered'}}
+                else:
+                    data[ticket_id] = {'status': 'ok'}
+        self.reply(200, {'data': data})
+
+    def reply(self, status, body):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+@pytest.fixture
+def expo_server(settings):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubExpoHandler)
+    server.calls, server.issued, server.uninstalled = [], {}, set()
+    server.ids, server.fail_next = itertools.count(), 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.EXPO_PUSH_API_URL = f'http://127.0.0.1:{server.server_port}/--/api/v2/push'
+    settings.EXPO_ACCESS_TOKEN = 'secret'
+    expo.close_expo_client()
+    yield server
+    expo.close_expo_client()
+    server.shutdown()
+    server.server_close()
+
+
+def sends(server):
+    return [payload for path, payload, _, _ in server.calls if path.endswith('/send')]
+
+
+@pytest.mark.django_db
+class TestSendExpoBatch:
+
+    def test_100_per_post_over_one_connection(self, make_employees, expo_server):
+        employees = make_employees([f'ExponentPushToken[emp{i}]' for i in range(250)])
+        results = expo.send_expo_batch([(emp, True, '08:00') for emp in employees])
+        assert results == [True] * 250
+        assert [len(payload) for payload in sends(expo_server)] == [100, 100, 50]
+        # Keep-alive: mọi POST đi trên cùng một connection
+        assert len({port for _, _, port, _ in expo_server.calls}) == 1
+        assert {auth for _, _, _, auth in expo_server.calls} == {'Bearer secret'}
+        assert ExpoPushTicket.objects.count() == 250
+
+        message = sends(expo_server)[0][0]
+        assert message['to'] == 'ExponentPushToken[emp0]'
+        assert message['title'] == '✅ Check-in thành công!'
+        assert message['data']['employee_id'] == 'NV_PUSH0'
+
+    def test_dead_tokens_in_tickets_are_cleared(self, make_employees, expo_server, django_assert_num_queries):
+        employees = make_employees(['ExponentPushToken[ok]', 'ExponentPushToken[dead1]', 'ExponentPushToken[dead2]'])
+        # Một INSERT ticket và một UPDATE xóa token
+        with django_assert_num_queries(2):
+            results = expo.send_expo_batch([(emp, False, '17:30') for emp in employees])
+        assert results == [True, False, False]
+        assert list(Employee.objects.filter(expo_push_token__isnull=False).values_list('employee_id', flat=True)) \
+            == ['NV_PUSH0']
+        assert list(ExpoPushTicket.objects.values_list('push_token', flat=True)) == ['ExponentPushToken[ok]']
+
+    def test_rejected_request_fails_only_its_chunk(self, make_employees, expo_server):
+        employees = make_employees([f'ExponentPushToken[emp{i}]' for i in range(150)])
+        expo_server.fail_next = 1
+        results = expo.send_expo_batch([(emp, True, '08:00') for emp in employees])
+        assert results == [False] * 100 + [True] * 50
+        # Lỗi tạm thời không xóa token
+        assert Employee.objects.filter(expo_push_token__isnull=True).count() == 0
+        assert expo.expo_client_stats() == {'requests': 2, 'messages': 150, 'errors': 1}
+
+    def test_mixed_providers_split_by_token(self, make_employees, expo_server, monkeypatch):
+        fcm_batches = []
+        monkeypatch.setattr('attendance.views.push_notification.send_fcm_batch',
+                            lambda items: fcm_batches.append(len(items)) or [True] * len(items))
+        employees = make_employees(['fcm-token-1', 'ExponentPushToken[a]', None, 'ExponentPushToken[dead]'])
+        results = send_attendance_notifications([(emp, True, '08:00') for emp in employees])
+        assert results == [True, True, False, False]
+        assert fcm_batches == [1]
+        assert [len(payload) for payload in sends(expo_server)] == [2]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_dispatcher_sends_coalesce_into_one_post(make_employees, expo_server, settings):
+    from attendance.push.dispatcher import NotificationDispatcher
+    from attendance.views.push_notification import send_attendance_notification
+    settings.PUSH_EXPO_BATCH_WINDOW_MS = 200
+    previous, expo._batcher_instance = expo._batcher_instance, None
+    dispatcher = NotificationDispatcher(workers=2, max_queue=100, name='expo-test')
+    try:
+        employees = make_employees([f'ExponentPushToken[emp{i}]' for i in range(30)])
+        for employee in employees:
+            assert dispatcher.submit(send_attendance_notification, employee, True, '08:00')
+        assert dispatcher.wait_idle(10)
+        # Cùng cách gom lô như FCM: mỗi POST nhiều hơn số worker dispatcher
+        assert max(len(payload) for payload in sends(expo_server)) > 2
+        assert sum(len(payload) for payload in sends(expo_server)) == 30
+        assert dispatcher.stats()['sent_total'] == 30
+        assert ExpoPushTicket.objects.count() == 30
+        assert expo.expo_batcher_stats()['items_total'] == 30
+    finally:
+        dispatcher.close(5)
+        expo._batcher_instance.close(5)
+        expo._batcher_instance = previous
+
+
+@pytest.mark.django_db
+class TestReceipts:
+
+    def test_receipts_polled_in_bulk_and_dead_tokens_pruned(self, make_employees, expo_server):
+        tokens = [f'ExponentPushToken[emp{i}]' for i in range(1200)]
+        employees = make_employees(tokens)
+        expo.send_expo_batch([(emp, True, '08:00') for emp in employees])
+        expo_server.uninstalled = {tokens[3], tokens[1100]}
+        # Ticket gửi từ trước 24 giờ, Expo không còn giữ receipt
+        ExpoPushTicket.objects.create(ticket_id='ticket-old', push_token=tokens[5])
+        ExpoPushTicket.objects.filter(ticket_id='ticket-old').update(
+            created_at=timezone.now() - timedelta(hours=25))
+        expo_server.calls.clear()
+
+        counts = expo.check_receipts(min_age=timedelta(0))
+        assert counts == {'checked': 1201, 'ok': 1198, 'error': 2, 'pruned': 2, 'expired': 1}
+        assert [len(payload['ids']) for _, payload, _, _ in expo_server.calls] == [1000, 201]
+        assert set(Employee.objects.filter(expo_push_token__isnull=True).values_list('pk', flat=True)) \
+            == {employees[3].pk, employees[1100].pk}
+        assert ExpoPushTicket.objects.count() == 0
+
+    def test_recent_tickets_wait_for_receipt_delay(self, make_employees, expo_server, settings):
+        settings.EXPO_RECEIPT_DELAY = 900
+        employees = make_employees(['ExponentPushToken[a]'])
+        expo.send_expo_batch([(employees[0], True, '08:00')])
+        out = StringIO()
+        call_command('check_expo_receipts', stdout=out)
+        assert 'Kiểm tra 0 ticket' in out.getvalue()
+        assert ExpoPushTicket.objects.count() == 1
+
+        call_command('check_expo_receipts', min_age=0, stdout=out)
+        assert 'Kiểm tra 1 ticket: 1 thành công' in out.getvalue()
+        assert ExpoPushTicket.objects.count() == 0
+
+    def test_failed_receipt_request_keeps_tickets(self, make_employees, expo_server):
+        employees = make_employees(['ExponentPushToken[a]', 'ExponentPushToken[b]'])
+        expo.send_expo_batch([(emp, True, '08:00') for emp in employees])
+        expo_server.fail_next = 1
+        counts = expo.check_receipts(min_age=timedelta(0))
+        assert counts['checked'] == 2 and counts['ok'] == 0
+        assert ExpoPushTicket.objects.count() == 2
@@ -0,0 +1,112 @@
+"""Fake push provider (Expo HTTP server + FCM stub) and notification benchmark tests"""
+import time
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from firebase_admin import messaging
+
+from attendance.models import Employee
+from attendance.push import expo, fake_provider, fcm
+from attendance.push.fake_provider import FakeExpoServer, FakePushProvider
+from attendance.views.push_notification import send_attendance_notification, send_attendance_notifications
+
+
+@pytest.fixture
+def provider(settings):
+    settings.PUSH_FCM_TRANSPORT = 'fake'
+    settings.PUSH_FAKE_LATENCY_MS = 0
+    settings.PUSH_FAKE_JITTER_MS = 0
+    settings.PUSH_FAKE_ERROR_RATE = 0
+    settings.PUSH_FAKE_RATE_LIMIT = 0
+    fake_provider.reset_fake_provider()
+    provider = fake_provider.get_fake_provider()
+    provider.keep_deliveries = True
+    server = FakeExpoServer(provider).start()
+    settings.EXPO_PUSH_API_URL = server.url
+    expo.close_expo_client()
+    yield provider
+    expo.close_expo_client()
+    server.stop()
+    fake_provider.reset_fake_provider()
+
+
+class TestFakePushProvider:
+
+    def test_latency_and_error_rate(self):
+        provider = FakePushProvider(latency_ms=30, error_rate=1.0, seed=1)
+        started = time.perf_counter()
+        assert provider.simulate(3) == ['error'] * 3
+        assert time.perf_counter() - started >= 0.03
+        assert provider.stats() == {'requests': 1, 'messages': 3, 'delivered': 0, 'errors': 3, 'throttled': 0}
+
+    def test_rate_limit_per_message_and_per_request(self):
+        provider = FakePushProvider(latency_ms=0, rate_limit=10)
+        assert provider.simulate(15).count('throttled') == 5
+        # Expo: hết quota thì cả request bị từ chối
+        assert provider.simulate(3, all_or_nothing=True) == ['throttled'] * 3
+        time.sleep(0.2)
+        assert provider.simulate(5, all_or_nothing=True) == ['ok'] * 5
+
+    def test_send_each_matches_firebase_interface(self):
+        provider = FakePushProvider(latency_ms=0, rate_limit=2)
+        messages = [messaging.Message(token=f't{i}', data={'employee_id': f'NV{i}'}) for i in range(3)]
+        response = provider.send_each(messages)
+        assert [item.success for item in response.responses] == [True, True, False]
+        assert isinstance(response.responses[2].exception, messaging.QuotaExceededError)
+        assert [employee_id for employee_id, _ in provider.deliveries] == ['NV0', 'NV1']
+
+
+@pytest.mark.django_db
+class TestNotificationsThroughFakeProvider:
+
+    def test_expo_and_fcm_paths(self, make_employees, provider):
+        employees = make_employees(['fcm-1', 'ExponentPushToken[a]', 'fcm-2', 'ExponentPushToken[b]'])
+        results = send_attendance_notifications([(emp, True, '08:00') for emp in employees])
+        assert results == [True] * 4
+        assert sorted(employee_id for employee_id, _ in provider.deliveries) == [
+            'NV_PUSH0', 'NV_PUSH1', 'NV_PUSH2', 'NV_PUSH3']
+        # Một send_each cho FCM và một POST cho Expo
+        assert provider.stats()['requests'] == 2
+
+        assert send_attendance_notification(employees[0], False, '17:30') is True
+        assert send_attendance_notification(employees[1], False, '17:30') is True
+
+    def test_throttled_expo_request_and_fcm_messages_fail(self, make_employees, provider):
+        provider.rate_limit = 1
+        provider._tokens = 0
+        employees = make_employees(['fcm-1', 'ExponentPushToken[a]'])
+        assert send_attendance_notifications([(emp, True, '08:00') for emp in employees]) == [False, False]
+        assert provider.stats()['throttled'] == 2
+        # Lỗi quota không phải lỗi token: token được giữ
+        assert Employee.objects.filter(expo_push_token__isnull=True).count() == 0
+
+    def test_shared_provider_does_not_keep_deliveries(self):
+        fake_provider.reset_fake_provider()
+        provider = fake_provider.get_fake_provider()
+        provider.latency_ms = 0
+        provider.send_each([messaging.Message(token='t', data={'employee_id': 'NV0'})])
+        assert provider.deliveries == [] and provider.stats()['delivered'] == 1
+        fake_provider.reset_fake_provider()
+
+    def test_fcm_transport_setting(self, provider, settings):
+        assert fcm.get_fcm_transport() == (provider.send_each, None)
+        settings.PUSH_FCM_TRANSPORT = 'firebase'
+        assert fcm.get_fcm_transport() != (provider.send_each, None)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBenchmarkCommand:
+
+    @pytest.mark.parametrize('delivery', ['dispatcher', 'outbox'])
+    def test_reports_end_to_end_percentiles(self, delivery):
+        out = StringIO()
+        call_command('benchmark_push_notifications', rate=50, duration=0.4, employees=6, concurrency=2,
+                     delivery=delivery, latency_ms=5, jitter_ms=0, error_rate=0, rate_limit=0,
+                     drain_timeout=10, stdout=out)
+        output = out.getvalue()
+        assert 'Hoàn thành 20/20 lượt quét' in output
+        assert 'Thông báo: 20/20 đã nhận' in output
+        assert 'Quét -> nhận thông báo: p50' in output
+        # Dữ liệu giả lập được dọn sau khi đo
+        assert not Employee.objects.filter(employee_id__startswith='PUSHBENCH_').exists()
@@ -0,0 +1,173 @@
+"""Batched FCM delivery tests"""
+from types import SimpleNamespace
+
+import pytest
+from firebase_admin import exceptions, messaging
+
+from attendance.models import Employee, PushNotificationOutbox
+from attendance.push import fcm
+from attendance.push.outbox import process_batch
+
+
+class FakeSendEach:
+    """Thay messaging.send_each: token 'bad-*' chưa đăng ký, 'down-*' lỗi tạm thời, 'invalid-*' message bị từ chối"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, messages, dry_run=False, app=None):
+        self.calls.append([m.token for m in messages])
+        responses = []
+        for message in messages:
+            if message.token.startswith('bad-'):
+                error = messaging.UnregisteredError('Requested entity was not found.')
+            elif message.token.startswith('down-'):
+                error = exceptions.UnavailableError('FCM unavailable')
+            elif message.token.startswith('invalid-'):
+                error = exceptions.InvalidArgumentError('Request contains an invalid argument.')
+            else:
+                error = None
+            responses.append(SimpleNamespace(success=error is None, exception=error))
+        return SimpleNamespace(responses=responses)
+
+
+@pytest.fixture
+def send_each(monkeypatch):
+    fake = FakeSendEach()
+    monkeypatch.setattr(fcm, 'get_firebase_app', lambda: object())
+    monkeypatch.setattr(fcm.messaging, 'send_each', fake)
+    return fake
+
+
+@pytest.mark.django_db
+class TestSendFcmBatch:
+
+    def test_chunks_of_500_and_maps_results(self, make_employees, send_each):
+        tokens = [f'tok-{i}' for i in range(1203)]
+        tokens[7] = 'bad-7'
+        tokens[900] = 'down-900'
+        employees = make_employees(tokens)
+        results = fcm.send_fcm_batch([(emp, i % 2 == 0, '08:00') for i, emp in enumerate(employees)])
+
+        assert [len(call) for call in send_each.calls] == [500, 500, 203]
+        assert results.count(False) == 2 and not results[7] and not results[900]
+        # Token chưa đăng ký bị xóa, lỗi tạm thời thì giữ token
+        assert not Employee.objects.filter(expo_push_token='bad-7').exists()
+        assert Employee.objects.get(pk=employees[7].pk).expo_push_token is None
+        assert Employee.objects.filter(expo_push_token='down-900').exists()
+
+    def test_invalid_tokens_cleared_in_one_query(self, make_employees, send_each, django_assert_num_queries):
+        employees = make_employees([f'bad-{i}' for i in range(20)] + ['tok-ok'])
+        with django_assert_num_queries(1):
+            results = fcm.send_fcm_batch([(emp, True, '17:30') for emp in employees])
+        assert results == [False] * 20 + [True]
+        assert Employee.objects.filter(expo_push_token__isnull=True).count() == 20
+
+    def test_invalid_argument_keeps_token(self, make_employees, send_each, caplog):
+        employees = make_employees(['invalid-1', 'tok-ok'])
+        with caplog.at_level('ERROR', logger='attendance.push.fcm'):
+            results = fcm.send_fcm_batch([(emp, True, '08:00') for emp in employees])
+        assert results == [False, True]
+        # Lỗi tham số có thể do nội dung message: ghi lỗi gửi, không xóa token
+        assert Employee.objects.get(pk=employees[0].pk).expo_push_token == 'invalid-1'
+        assert 'NV_PUSH0' in caplog.text
+
+    def test_message_content(self, make_employees, send_each, monkeypatch):
+        [employee] = make_employees(['tok-1'])
+        captured = []
+        monkeypatch.setattr(fcm.messaging, 'send_each',
+                            lambda messages, app=None: captured.extend(messages) or send_each(messages))
+        fcm.send_fcm_batch([(employee, False, '17:30')])
+        message = captured[0]
+        assert message.notification.title == '✅ Check-out thành công!'
+        assert message.data['action'] == 'check_out' and message.data['employee_id'] == 'NV_PUSH0'
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBatchedDelivery:
+
+    def test_outbox_batch_uses_single_send_each(self, make_employees, send_each, monkeypatch):
+        sent_expo = []
+        monkeypatch.setattr('attendance.views.push_notification.send_expo_batch',
+                            lambda items: [sent_expo.append(emp.employee_id) or True for emp, _, _ in items])
+        employees = make_employees([f'tok-{i}' for i in range(40)] + ['bad-x', 'ExponentPushToken[abc]'])
+        PushNotificationOutbox.objects.bulk_create([
+            PushNotificationOutbox(employee=emp, is_check_in=True, time_str='08:00') for emp in employees
+        ])
+        counts = process_batch(batch_size=100)
+        assert len(send_each.calls) == 1 and len(send_each.calls[0]) == 41
+        assert sent_expo == ['NV_PUSH41']
+        assert counts == {'claimed': 42, 'sent': 41, 'retry': 1, 'failed': 0}
+        assert Employee.objects.get(employee_id='NV_PUSH40').expo_push_token is None
+
+        # Lần thử lại: token đã bị xóa nên dòng được đánh dấu thất bại, không gọi FCM nữa
+        PushNotificationOutbox.objects.filter(status='PENDING').update(next_attempt_at='2000-01-01T00:00:00Z')
+        assert process_batch()['failed'] == 1
+        assert len(send_each.calls) == 1
+
+    def test_stalled_provider_triggers_dispatcher_overflow(self, make_employees, send_each, settings, monkeypatch):
+        import threading
+        import time
+        from attendance.push.dispatcher import NotificationDispatcher
+        from attendance.views.push_notification import send_attendance_notification
+        gate = threading.Event()
+        monkeypatch.setattr(fcm.messaging, 'send_each', lambda messages, app=None: gate.wait(10) and send_each(messages))
+        settings.PUSH_FCM_BATCH_WINDOW_MS = 1
+        previous, fcm._batcher_instance = fcm._batcher_instance, None
+        dispatcher = NotificationDispatcher(workers=2, max_queue=5, name='fcm-stalled')
+        try:
+            employees = make_employees([f'tok-{i}' for i in range(20)])
+            accepted = []
+            for employee in employees:
+                accepted.append(dispatcher.submit(send_attendance_notification, employee, True, '08:00'))
+                # Chờ worker chuyển thông báo sang batcher: hàng đợi dispatcher luôn trống
+                deadline = time.monotonic() + 5
+                while dispatcher.stats()['queue_depth'] and time.monotonic() < deadline:
+                    time.sleep(0.001)
+            # FCM treo: thông báo không dồn vô hạn vào batcher mà bị bỏ theo chính sách tràn
+            assert accepted.count(True) == 7
+            assert dispatcher.stats()['dropped_total'] == 13
+            gate.set()
+            assert dispatcher.wait_idle(10)
+            assert dispatcher.stats()['sent_total'] == 7
+        finally:
+            gate.set()
+            dispatcher.close(5)
+            fcm._batcher_instance.close(5)
+            fcm._batcher_instance = previous
+
+    def test_batcher_releases_db_connections(self, make_employees, send_each, settings, monkeypatch):
+        settings.PUSH_FCM_BATCH_WINDOW_MS = 1
+        calls = []
+        monkeypatch.setattr('attendance.push.messages.close_old_connections', lambda: calls.append(1))
+        previous, fcm._batcher_instance = fcm._batcher_instance, None
+        try:
+            employees = make_employees(['bad-1', 'tok-2'])
+            assert fcm.get_fcm_batcher().infer([(emp, True, '08:00') for emp in employees]) == [False, True]
+            # Thread của batcher ghi database (xóa token) giữa hai lần trả connection
+            assert calls == [1, 1]
+            assert Employee.objects.get(pk=employees[0].pk).expo_push_token is None
+        finally:
+            fcm._batcher_instance.close(5)
+            fcm._batcher_instance = previous
+
+    def test_dispatcher_feeds_batches_beyond_worker_count(self, make_employees, send_each, settings):
+        from attendance.push.dispatcher import NotificationDispatcher
+        from attendance.views.push_notification import send_attendance_notification
+        settings.PUSH_FCM_BATCH_WINDOW_MS = 200
+        previous, fcm._batcher_instance = fcm._batcher_instance, None
+        dispatcher = NotificationDispatcher(workers=2, max_queue=100, name='fcm-test')
+        try:
+            employees = make_employees([f'tok-{i}' for i in range(40)])
+            for employee in employees:
+                assert dispatcher.submit(send_attendance_notification, employee, True, '08:00')
+            assert dispatcher.wait_idle(10)
+            # Worker không chờ lô: một lô gom được nhiều hơn số worker
+            assert max(len(call) for call in send_each.calls) > 2
+            assert sum(len(call) for call in send_each.calls) == 40
+            stats = dispatcher.stats()
+            assert (stats['sent_total'], stats['failed_total']) == (40, 0)
+        finally:
+            dispatcher.close(5)
+            fcm._batcher_instance.close(5)
+            fcm._batcher_instance = previous
@@ -0,0 +1,145 @@
+"""Push notification outbox tests"""
+import json
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+
+from attendance.models import Employee, PushNotificationOutbox
+from attendance.push.outbox import backoff_delay, process_batch, prune_outbox
+
+
+@pytest.fixture
+def outbox_employees(db):
+    rng = np.random.default_rng(3)
+    employees = []
+    for i in range(3):
+        emp = Employee.objects.create(employee_id=f'NV_PUSH{i}', first_name=f'Push{i}',
+                                      expo_push_token=f'ExponentPushToken[{i}]' if i < 2 else None)
+        sample = rng.normal(size=512)
+        emp.set_face_embeddings([sample])
+        employees.append(emp)
+    return employees
+
+
+def enqueue(employee, count=1):
+    return PushNotificationOutbox.objects.bulk_create([
+        PushNotificationOutbox(employee=employee, is_check_in=True, time_str='08:00') for _ in range(count)
+    ])
+
+
+@pytest.mark.django_db(transaction=True)
+class TestOutboxWrite:
+
+    def test_scan_writes_outbox_row(self, api_client, outbox_employees, settings, django_assert_num_queries):
+        settings.PUSH_DELIVERY = 'outbox'
+        embeddings = [emp.get_face_embeddings()[0].tolist() for emp in outbox_employees]
+        api_client.post('/process-attendance/', json.dumps({'embedding': embeddings[2]}),
+                        content_type='application/json')
+        # Dòng outbox đi cùng câu lệnh upsert: ngân sách truy vấn không đổi
+        for _ in range(2):
+            with django_assert_num_queries(3):
+                response = api_client.post('/process-attendance/', json.dumps({'embedding': embeddings[0]}),
+                                           content_type='application/json')
+            assert response.status_code == 200
+        rows = list(PushNotificationOutbox.objects.order_by('id').values_list('employee_id', 'is_check_in', 'status'))
+        # Nhân viên không có push token không tạo dòng outbox
+        assert rows == [(outbox_employees[0].pk, True, 'PENDING'), (outbox_employees[0].pk, False, 'PENDING')]
+
+    def test_replayed_scan_writes_no_outbox_row(self, outbox_employees, settings):
+        from attendance.views.attendance_views import record_attendance
+        from attendance.views.utils import get_vietnam_now
+        settings.PUSH_DELIVERY = 'outbox'
+        now = get_vietnam_now().replace(microsecond=0)
+        for minutes in (2, 2, 4):
+            record_attendance(outbox_employees[0], now - timedelta(minutes=minutes))
+        assert list(PushNotificationOutbox.objects.values_list('is_check_in', flat=True)) == [True]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestOutboxWorker:
+
+    def test_sends_and_marks_sent(self, outbox_employees):
+        enqueue(outbox_employees[0], 2)
+        enqueue(outbox_employees[2])
+        sent = []
+        counts = process_batch(send_batch=lambda items: [sent.append(emp.pk) or True for emp, _, _ in items])
+        assert counts == {'claimed': 3, 'sent': 2, 'retry': 0, 'failed': 1}
+        assert sent == [outbox_employees[0].pk] * 2
+        statuses = dict(PushNotificationOutbox.objects.values_list('employee_id', 'status'))
+        assert statuses == {outbox_employees[0].pk: 'SENT', outbox_employees[2].pk: 'FAILED'}
+        assert process_batch(send_batch=lambda items: [True] * len(items))['claimed'] == 0
+
+    def test_retry_with_exponential_backoff(self, outbox_employees):
+        [row] = enqueue(outbox_employees[1])
+
+        def failing(items):
+            raise ConnectionError('exp.host unreachable')
+
+        for attempt in range(1, 4):
+            PushNotificationOutbox.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now())
+            before = timezone.now()
+            counts = process_batch(send_batch=failing, max_attempts=3, backoff_base=10, backoff_max=15)
+            row.refresh_from_db()
+            assert row.attempts == attempt
+            assert 'unreachable' in row.last_error
+            if attempt < 3:
+                assert counts['retry'] == 1 and row.status == 'PENDING'
+                delay = (row.next_attempt_at - before).total_seconds()
+                assert delay == pytest.approx(backoff_delay(attempt, 10, 15), abs=1)
+                # Chưa đến hạn: lô tiếp theo không lấy dòng này
+                assert process_batch(send_batch=failing)['claimed'] == 0
+        assert row.status == 'FAILED'
+        assert [backoff_delay(n, 5, 60) for n in range(1, 6)] == [5, 10, 20, 40, 60]
+
+    def test_parallel_workers_send_each_row_once(self, outbox_employees):
+        enqueue(outbox_employees[0], 120)
+        sent, errors = [], []
+        lock = threading.Lock()
+
+        def send_batch(items):
+            time.sleep(0.001 * len(items))
+            return [True] * len(items)
+
+        def worker():
+            try:
+                while True:
+                    counts = process_batch(send_batch=send_batch, batch_size=7)
+                    if not counts['claimed']:
+                        return
+                    with lock:
+                        sent.append(counts['sent'])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+
+        assert not errors
+        assert sum(sent) == 120
+        assert len(sent) >= 120 // 7
+        assert PushNotificationOutbox.objects.filter(status='SENT', attempts=1).count() == 120
+
+    def test_prune_and_command(self, outbox_employees, monkeypatch):
+        old = enqueue(outbox_employees[0], 2)
+        PushNotificationOutbox.objects.filter(pk=old[0].pk).update(
+            status='SENT', created_at=timezone.now() - timedelta(days=30))
+        assert prune_outbox(timedelta(days=7)) == 1
+
+        monkeypatch.setattr('attendance.views.push_notification.send_attendance_notifications',
+                            lambda items: [True] * len(items))
+        out = StringIO()
+        call_command('process_push_outbox', once=True, stdout=out)
+        assert 'gửi 1' in out.getvalue()
+        assert PushNotificationOutbox.objects.get().status == 'SENT'
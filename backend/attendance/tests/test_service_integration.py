@@ -73,7 +73,7 @@ class TestFaceRecognitionServiceIntegration:
         emp.save()
         emp.clear_face_embeddings()
         emp.save()
-        assert emp.face_embeddings is None
+        assert not emp.has_face
         assert emp.get_face_embeddings() == []
     
 
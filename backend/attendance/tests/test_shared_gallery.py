@@ -0,0 +1,113 @@
+"""Shared (memory-mapped) face gallery tests"""
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+
+from attendance.face_recognition import gallery as gallery_module
+from attendance.face_recognition.gallery import FaceGallery, build_gallery_data
+from attendance.face_recognition.shared_gallery import (
+    map_shared_gallery, publish_face_gallery, read_version, write_shared_gallery,
+)
+from attendance.models import Employee
+from attendance.tests.helpers import random_rows
+
+
+@pytest.fixture
+def shared_path(tmp_path, settings):
+    path = str(tmp_path / 'gallery.bin')
+    settings.FACE_MATCH_BACKEND = 'memory'
+    settings.FACE_GALLERY_SHARED_PATH = path
+    gallery_module._gallery_instance = None
+    yield path
+    gallery_module._gallery_instance = None
+
+
+class TestSharedGalleryFile:
+
+    def test_roundtrip_is_zero_copy_and_read_only(self, tmp_path):
+        rng = np.random.default_rng(0)
+        data = build_gallery_data([3, 1, 3, 2, 1], random_rows(rng, 5))
+        path = str(tmp_path / 'gallery.bin')
+        write_shared_gallery(path, data, version=7)
+
+        snapshot = map_shared_gallery(path)
+        assert snapshot.version == 7
+        for name in data._fields:
+            assert np.array_equal(getattr(snapshot.data, name), getattr(data, name))
+        matrix = snapshot.data.matrix
+        assert matrix.dtype == np.float32 and matrix.flags['C_CONTIGUOUS']
+        assert not matrix.flags['WRITEABLE']
+        assert not matrix.flags['OWNDATA']
+
+    def test_empty_gallery(self, tmp_path):
+        path = str(tmp_path / 'gallery.bin')
+        write_shared_gallery(path, build_gallery_data([], []), version=1)
+        snapshot = map_shared_gallery(path)
+        assert snapshot.data.matrix.shape == (0, 512)
+
+    def test_republish_keeps_old_mapping_valid(self, tmp_path):
+        rng = np.random.default_rng(1)
+        path = str(tmp_path / 'gallery.bin')
+        first = build_gallery_data([1, 2], random_rows(rng, 2))
+        write_shared_gallery(path, first, version=1)
+        old = map_shared_gallery(path)
+
+        version = publish_face_gallery(path, lambda: build_gallery_data([5], random_rows(rng, 1)))
+        assert version == 2 == read_version(path)
+        # Worker chưa chuyển phiên bản vẫn đọc được dữ liệu cũ (inode cũ)
+        assert np.array_equal(old.data.matrix, first.matrix)
+        assert list(map_shared_gallery(path).data.employee_ids) == [5]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestSharedGalleryWorkers:
+
+    def test_workers_follow_published_versions(self, shared_path):
+        rng = np.random.default_rng(2)
+        first = Employee.objects.create(employee_id='NV_SHM1')
+        first.set_face_embeddings(list(random_rows(rng, 2)))
+
+        # Hai "worker" map cùng một file
+        worker_a = FaceGallery(shared_path=shared_path, check_interval=0, poll_interval=1e-3)
+        worker_b = FaceGallery(shared_path=shared_path, check_interval=0, poll_interval=1e-3)
+        worker_a.ensure_loaded()
+        worker_b.ensure_loaded()
+        assert worker_a.version == worker_b.version >= 1
+        assert len(worker_b) == 2
+
+        # Thay đổi từ một tiến trình khác: worker áp dụng qua nhật ký thay đổi,
+        # không nạp lại/xuất bản lại toàn bộ file
+        second = Employee.objects.create(employee_id='NV_SHM2')
+        query = random_rows(rng, 1)[0]
+        second.set_face_embeddings([query])
+        pk, score = worker_b.search(query)
+        assert pk == second.pk
+        assert score == pytest.approx(1.0, abs=1e-5)
+        assert worker_b.version == read_version(shared_path) == worker_a.version
+
+        # Xuất bản lại (lệnh publish_face_gallery): worker map file mới ở luồng nền, delta trở về rỗng
+        call_command('publish_face_gallery', stdout=StringIO())
+        worker_b.search(query)
+        worker_b.wait_idle()
+        assert worker_b.version == read_version(shared_path) > worker_a.version
+        assert worker_b.snapshot.pending_rows == 0
+        assert len(worker_b) == 3
+
+    def test_publish_command(self, shared_path):
+        Employee.objects.create(employee_id='NV_SHM3').set_face_embeddings(
+            list(random_rows(np.random.default_rng(3), 3)))
+        out = StringIO()
+        call_command('publish_face_gallery', stdout=out)
+        assert '3 mẫu / 1 nhân viên' in out.getvalue()
+        assert map_shared_gallery(shared_path).data.matrix.shape == (3, 512)
+
+    def test_preload_closes_db_connection(self, shared_path):
+        from django.db import connection
+        Employee.objects.create(employee_id='NV_SHM4').set_face_embeddings(
+            list(random_rows(np.random.default_rng(4), 2)))
+        gallery_module.preload_face_gallery()
+        # gunicorn --preload: worker fork từ master không được kế thừa socket database
+        assert connection.connection is None
+        assert len(gallery_module.get_face_gallery()) == 2
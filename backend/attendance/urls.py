@@ -6,6 +6,7 @@ app_name = 'attendance'
 urlpatterns = [
     # API Endpoints (for React & Mobile)
     path('process-attendance/', views.process_attendance, name='process_attendance'),
+    path('process-attendance/batch/', views.process_attendance_batch, name='process_attendance_batch'),
     path('check-pose/', views.check_pose, name='check_pose'),
     path('check-duplicate/', views.check_duplicate, name='check_duplicate'),
     path('register-face/', views.register_face, name='register_face'),
@@ -19,6 +20,7 @@ urlpatterns = [
     path('api/history/<str:employee_id>/', api.attendance_history_api, name='api_history'),
     path('api/employees/', api.employees_without_face_api, name='api_employees'),
     path('api/push-token/', views.register_push_token, name='api_push_token'),
+    path('api/metrics/', views.metrics_api, name='api_metrics'),
     
     # React Frontend APIs
     path('api/dashboard/', views.dashboard_api, name='api_dashboard'),
@@ -1,8 +1,9 @@
 from .utils import get_vietnam_now, is_leaving_early, WORK_START_TIME, WORK_END_TIME
 from .face_views import check_pose, check_duplicate, register_face, delete_face
 
-from .attendance_views import process_attendance
+from .attendance_views import process_attendance, process_attendance_batch
 from .push_notification import register_push_token, send_attendance_notification
+from .metrics_views import metrics_api
 from .frontend_api import (
     dashboard_api, employees_api, employee_detail_api,
     departments_api, department_detail_api,
@@ -14,8 +15,9 @@ from .frontend_api import (
 __all__ = [
     'get_vietnam_now', 'is_leaving_early', 'WORK_START_TIME', 'WORK_END_TIME',
     'check_pose', 'check_duplicate', 'register_face', 'delete_face',
-    'process_attendance',
+    'process_attendance', 'process_attendance_batch',
     'register_push_token', 'send_attendance_notification',
+    'metrics_api',
     'dashboard_api', 'employees_api', 'employee_detail_api',
     'departments_api', 'department_detail_api',
     'accounts_api', 'account_detail_api',
@@ -1,11 +1,140 @@
+from django.conf import settings
+from django.db import connection, transaction
 from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.csrf import csrf_exempt
+from datetime import datetime, timedelta
+from functools import partial
 import json
-import threading
-from ..models import Employee, AttendanceRecord
-from .utils import get_vietnam_now, is_leaving_early, WORK_START_TIME
-from .face_views import find_matching_employee
+from ..models import Employee, AttendanceRecord, PushNotificationOutbox
+from .utils import (
+    get_vietnam_now, WORK_START_TIME, WORK_END_TIME, LUNCH_START, LUNCH_END, EARLY_THRESHOLD,
+)
+from .face_views import find_matching_employee, find_matching_employees, request_data, embed_request_images
+from ..face_recognition.preprocess import FaceImageError
+from ..face_recognition.transport import EmbeddingFormatError, decode_embedding
 from .push_notification import send_attendance_notification
+from ..push.dispatcher import get_notification_dispatcher
+
+
+# Một lượt quét = một câu lệnh: lần đầu trong ngày INSERT (check-in), các lần sau
+# ON CONFLICT cập nhật. Lô từ kiosk có thể gửi lại lượt quét cũ, nên check-in là
+# lượt sớm nhất và check-out là lượt muộn nhất trong ngày (không ghi đè bằng thời
+# điểm cũ hơn). Trạng thái tính trong SQL từ check-in/check-out mới, nên hai kiosk
+# quét cùng lúc vẫn cho đúng một check-in và một check-out. Lượt quét không làm
+# thay đổi giờ vào/ra thì giữ nguyên trạng thái; lượt quét gửi lại trùng đúng
+# check-in (kiosk thử lại) không thay đổi gì. inserted (xmax = 0) cho biết câu
+# lệnh đã tạo bản ghi, tức lượt quét này là check-in.
+# Với PUSH_DELIVERY = 'outbox', thông báo được ghi vào outbox trong cùng câu lệnh.
+UPSERT_ATTENDANCE_SQL = """
+WITH upsert AS (
+INSERT INTO {table} AS r (employee_id, date, check_in_time, status, created_at, updated_at)
+VALUES (%(employee)s, %(date)s, %(now)s, %(check_in_status)s, %(written)s, %(written)s)
+ON CONFLICT (employee_id, date) DO UPDATE SET
+    check_in_time = LEAST(r.check_in_time, EXCLUDED.check_in_time),
+    check_out_time = CASE
+        WHEN r.check_in_time IS NULL OR EXCLUDED.check_in_time = r.check_in_time THEN r.check_out_time
+        ELSE GREATEST(r.check_out_time, r.check_in_time, EXCLUDED.check_in_time)
+    END,
+    status = CASE
+        WHEN r.check_in_time IS NULL THEN EXCLUDED.status
+        WHEN EXCLUDED.check_in_time = r.check_in_time THEN r.status
+        WHEN EXCLUDED.check_in_time >= r.check_in_time
+             AND EXCLUDED.check_in_time <= r.check_out_time THEN r.status
+        -- Về sớm (như is_leaving_early): giờ ra mới trước giờ nghỉ trưa, hoặc sau nghỉ trưa
+        -- nhưng sớm hơn WORK_END_TIME - EARLY_THRESHOLD
+        WHEN (GREATEST(r.check_out_time, r.check_in_time, EXCLUDED.check_in_time) AT TIME ZONE %(tz)s)::time
+                < %(lunch_start)s
+             OR (GREATEST(r.check_out_time, r.check_in_time, EXCLUDED.check_in_time) AT TIME ZONE %(tz)s)::time
+                > %(lunch_end)s
+             AND (GREATEST(r.check_out_time, r.check_in_time, EXCLUDED.check_in_time) AT TIME ZONE %(tz)s)::time
+                < %(early_before)s
+             THEN 'EARLY'
+        WHEN (LEAST(r.check_in_time, EXCLUDED.check_in_time) AT TIME ZONE %(tz)s)::time > %(work_start)s THEN 'LATE'
+        ELSE 'ON_TIME'
+    END,
+    updated_at = EXCLUDED.updated_at
+RETURNING id, employee_id, date, check_in_time, check_out_time, status, xmax = 0 AS inserted
+), outbox AS (
+INSERT INTO {outbox} (employee_id, is_check_in, time_str, status, attempts, next_attempt_at, last_error, created_at)
+SELECT employee_id, inserted, %(time_str)s, 'PENDING', 0, %(written)s, '', %(written)s
+FROM upsert
+WHERE %(notify)s AND (inserted OR check_out_time = %(now)s)
+)
+SELECT id, employee_id, date, check_in_time, check_out_time, status, inserted FROM upsert
+"""
+
+STATUS_MESSAGES = {
+    (True, 'ON_TIME'): "Chấm công vào ca thành công (Đúng giờ)",
+    (True, 'LATE'): "Chấm công vào ca thành công (Đi muộn)",
+    (False, 'EARLY'): "Chấm công ra ca thành công (Về sớm)",
+}
+
+
+def record_attendance(employee, now):
+    """Ghi nhận một lượt quét (check-in nếu chưa có, ngược lại check-out) cho nhân viên.
+
+    Dùng một câu INSERT ... ON CONFLICT DO UPDATE (không đọc trước bản ghi,
+    kèm dòng outbox nếu gửi thông báo qua outbox) và chỉ cập nhật
+    current_status của nhân viên.
+    Trả về (record, is_first_scan, status_message); is_first_scan đúng khi lượt
+    quét này tạo bản ghi (check-in).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_ATTENDANCE_SQL.format(
+            table=AttendanceRecord._meta.db_table, outbox=PushNotificationOutbox._meta.db_table), {
+            'employee': employee.pk,
+            'date': now.date(),
+            'now': now,
+            'check_in_status': 'ON_TIME' if now.time() <= WORK_START_TIME else 'LATE',
+            'written': timezone.now(),
+            'lunch_start': LUNCH_START,
+            'lunch_end': LUNCH_END,
+            'early_before': (datetime.combine(now.date(), WORK_END_TIME) - EARLY_THRESHOLD).time(),
+            'tz': str(now.tzinfo),
+            'work_start': WORK_START_TIME,
+            'time_str': now.strftime('%H:%M'),
+            'notify': settings.PUSH_DELIVERY == 'outbox' and bool(employee.expo_push_token),
+        })
+        *row, is_first_scan = cursor.fetchone()
+
+    record = AttendanceRecord.from_db(
+        connection.alias, ['id', 'employee_id', 'date', 'check_in_time', 'check_out_time', 'status'], row)
+    record.employee = employee
+    for field in ('check_in_time', 'check_out_time'):
+        if getattr(record, field) is not None:
+            setattr(record, field, getattr(record, field).astimezone(now.tzinfo))
+
+    # Nhân viên còn trong văn phòng khi chưa có check-out
+    status_message = STATUS_MESSAGES.get(
+        (is_first_scan, record.status),
+        "Chấm công ra ca thành công (Đúng giờ)",
+    )
+
+    employee.current_status = 'IN_OFFICE' if record.check_out_time is None else 'OUT_OFFICE'
+    employee.save(update_fields=['current_status', 'updated_at'])
+    return record, is_first_scan, status_message
+
+
+def _employee_payload(employee, score):
+    return {
+        'id': employee.employee_id,
+        'name': employee.get_full_name(),
+        'department': str(employee.department) if employee.department else '',
+        'position': str(employee.position) if employee.position else '',
+        'similarity': f"{score:.2%}",
+        'current_status': employee.get_current_status_display(),
+    }
+
+
+def _attendance_payload(record, now):
+    return {
+        'date': now.strftime('%d/%m/%Y'),
+        'check_in': record.check_in_time.isoformat() if record.check_in_time else None,
+        'check_out': record.check_out_time.isoformat() if record.check_out_time else None,
+        'status': record.get_status_display()
+    }
 
 
 @csrf_exempt
@@ -14,12 +143,18 @@ def process_attendance(request):
         return JsonResponse({'error': 'Method not allowed'}, status=405)
 
     try:
-        data = json.loads(request.body)
+        data = request_data(request)
         embedding = data.get('embedding')
+
+        # Kiosk cấu hình yếu gửi ảnh khuôn mặt đã căn chỉnh, server tự tính embedding
+        if not embedding:
+            embeddings = embed_request_images(request, data, 'image')
+            embedding = embeddings[0] if embeddings else None
         
         if not embedding:
             return JsonResponse({'error': 'No embedding data provided'}, status=400)
 
+        embedding = decode_embedding(embedding, data.get('embedding_dtype'))
         employee, score = find_matching_employee(embedding)
         
         if employee:
@@ -38,71 +173,174 @@ def process_attendance(request):
             }, status=400)
 
         now = get_vietnam_now()
-
-        record, created = AttendanceRecord.objects.get_or_create(
-            employee=employee,
-            date=now.date()
-        )
-
-        current_time = now.time()
-        status_message = ""
-
-        is_first_scan = record.check_in_time is None
-
-        if is_first_scan:
-            record.check_in_time = now
-            if current_time <= WORK_START_TIME:
-                record.status = 'ON_TIME'
-                status_message = "Chấm công vào ca thành công (Đúng giờ)"
-            else:
-                record.status = 'LATE'
-                status_message = "Chấm công vào ca thành công (Đi muộn)"
-            employee.current_status = 'IN_OFFICE'
-        else:
-            record.check_out_time = now
-            if is_leaving_early(now):
-                record.status = 'EARLY'
-                status_message = "Chấm công ra ca thành công (Về sớm)"
-            else:
-                check_in_local = record.check_in_time.astimezone(now.tzinfo)
-                if check_in_local.time() > WORK_START_TIME:
-                    record.status = 'LATE'
-                else:
-                    record.status = 'ON_TIME'
-                status_message = "Chấm công ra ca thành công (Đúng giờ)"
-            employee.current_status = 'OUT_OFFICE'
-
-        record.save()
-        employee.save()
+        record, is_first_scan, status_message = record_attendance(employee, now)
 
         time_str = now.strftime('%H:%M')
-        threading.Thread(
-            target=send_attendance_notification,
-            args=(employee, is_first_scan, time_str),
-            daemon=True
-        ).start()
+        if _is_notified_scan(record, is_first_scan, now):
+            _dispatch_notification(employee, is_first_scan, time_str)
 
         return JsonResponse({
             'success': True,
             'message': status_message,
-            'employee': {
-                'id': employee.employee_id,
-                'name': employee.get_full_name(),
-                'department': str(employee.department) if employee.department else '',
-                'position': str(employee.position) if employee.position else '',
-                'similarity': f"{score:.2%}",
-                'current_status': employee.get_current_status_display(),
-            },
-            'attendance': {
-                'date': now.strftime('%d/%m/%Y'),
-                'check_in': record.check_in_time.isoformat() if record.check_in_time else None,
-                'check_out': record.check_out_time.isoformat() if record.check_out_time else None,
-                'status': record.get_status_display()
-            },
+            'employee': _employee_payload(employee, score),
+            'attendance': _attendance_payload(record, now),
             'time': now.strftime('%H:%M')
         })
 
+    except (FaceImageError, EmbeddingFormatError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Employee.DoesNotExist:
         return JsonResponse({'error': 'Không tìm thấy nhân viên trong hệ thống'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+
+
+def _parse_scan_time(value, now):
+    """Thời điểm quét do kiosk gửi (ISO 8601). Thiếu -> giờ server; None nếu không hợp lệ.
+
+    Chỉ chấp nhận lượt quét trong ngày hiện tại và không vượt quá giờ server
+    (cho phép lệch đồng hồ FACE_BATCH_MAX_CLOCK_SKEW giây).
+    """
+    if value is None or value == '':
+        return now
+    if not isinstance(value, str):
+        return None
+    try:
+        scan_time = parse_datetime(value)
+    except ValueError:
+        return None
+    if scan_time is None:
+        return None
+    if timezone.is_naive(scan_time):
+        scan_time = timezone.make_aware(scan_time, timezone=now.tzinfo)
+    scan_time = scan_time.astimezone(now.tzinfo)
+
+    if scan_time > now + timedelta(seconds=settings.FACE_BATCH_MAX_CLOCK_SKEW):
+        return None
+    if scan_time.date() != now.date():
+        return None
+    return min(scan_time, now)
+
+
+@csrf_exempt
+def process_attendance_batch(request):
+    """Chấm công theo lô: kiosk gửi nhiều khuôn mặt đã xếp hàng (mất mạng, nhóm người vào cùng lúc).
+
+    Body: {"items": [{"embedding": [...], "timestamp": "ISO 8601"}, ...]}
+    (embedding có thể là chuỗi base64 kiểu "embedding_dtype", xem transport.py)
+    Toàn bộ embedding được so khớp trong một lượt, các bản ghi chấm công được
+    ghi trong một transaction; kết quả trả về theo từng item.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        items = data.get('items')
+
+        if not items or not isinstance(items, list):
+            return JsonResponse({'error': 'No items provided'}, status=400)
+        if len(items) > settings.FACE_BATCH_MAX_ITEMS:
+            return JsonResponse({
+                'error': f'Tối đa {settings.FACE_BATCH_MAX_ITEMS} khuôn mặt mỗi lần gửi'
+            }, status=400)
+
+        now = get_vietnam_now()
+        dtype = data.get('embedding_dtype')
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            embedding = item.get('embedding') if isinstance(item, dict) else None
+            if not embedding:
+                results[index] = {'index': index, 'success': False, 'error': 'No embedding data provided'}
+                continue
+            try:
+                embedding = decode_embedding(embedding, dtype)
+            except EmbeddingFormatError as e:
+                results[index] = {'index': index, 'success': False, 'error': str(e)}
+                continue
+            scan_time = _parse_scan_time(item.get('timestamp'), now)
+            if scan_time is None:
+                results[index] = {'index': index, 'success': False, 'error': 'Thời gian quét không hợp lệ'}
+                continue
+            valid.append((index, embedding, scan_time))
+
+        matches = find_matching_employees([embedding for _, embedding, _ in valid])
+
+        # Xử lý theo thứ tự thời gian quét để check-in/check-out đúng trình tự
+        scans = sorted(
+            ((scan_time, index, employee, score) for (index, _, scan_time), (employee, score) in zip(valid, matches)),
+            key=lambda scan: (scan[0], scan[1])
+        )
+        last_scan_by_employee = {}
+        dedup_window = timedelta(seconds=settings.FACE_BATCH_DEDUP_SECONDS)
+
+        with transaction.atomic():
+            for scan_time, index, employee, score in scans:
+                if not employee:
+                    results[index] = {
+                        'index': index,
+                        'success': False,
+                        'error': 'Không nhận diện được nhân viên hoặc nhân viên không trong trạng thái làm việc',
+                        'score': float(score),
+                    }
+                    continue
+
+                if employee.work_status != 'WORKING':
+                    results[index] = {
+                        'index': index,
+                        'success': False,
+                        'error': f"Nhân viên {employee.get_full_name()} ({employee.work_status}) không trong trạng thái làm việc",
+                    }
+                    continue
+
+                # Cùng một người bị quét nhiều lần liên tiếp trong lô: chỉ tính lượt đầu
+                last_scan = last_scan_by_employee.get(employee.pk)
+                if last_scan is not None and scan_time - last_scan < dedup_window:
+                    results[index] = {
+                        'index': index,
+                        'success': False,
+                        'duplicate': True,
+                        'error': f"Nhân viên {employee.get_full_name()} đã được chấm công trong lô này",
+                    }
+                    continue
+                last_scan_by_employee[employee.pk] = scan_time
+
+                record, is_first_scan, status_message = record_attendance(employee, scan_time)
+                time_str = scan_time.strftime('%H:%M')
+                if _is_notified_scan(record, is_first_scan, scan_time):
+                    transaction.on_commit(partial(
+                        _dispatch_notification, employee, is_first_scan, time_str))
+
+                results[index] = {
+                    'index': index,
+                    'success': True,
+                    'message': status_message,
+                    'employee': _employee_payload(employee, score),
+                    'attendance': _attendance_payload(record, scan_time),
+                    'time': time_str,
+                }
+
+        return JsonResponse({
+            'success': True,
+            'processed': sum(1 for result in results if result['success']),
+            'results': results,
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _is_notified_scan(record, is_first_scan, scan_time):
+    """Chỉ thông báo khi lượt quét là check-in hoặc check-out mới (như điều kiện outbox
+    trong UPSERT_ATTENDANCE_SQL); lượt quét gửi lại không đổi giờ ra thì không thông báo lại"""
+    return is_first_scan or record.check_out_time == scan_time
+
+
+def _dispatch_notification(employee, is_check_in, time_str):
+    if settings.PUSH_DELIVERY == 'outbox':
+        # Đã ghi vào outbox cùng bản ghi chấm công, worker process_push_outbox sẽ gửi
+        return
+    get_notification_dispatcher().submit(send_attendance_notification, employee, is_check_in, time_str)
@@ -1,56 +1,332 @@
+from django.conf import settings
+from django.db import connection
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from ..models import Employee, EmployeeFaceEmbedding
+from ..models import Employee, EmployeeFaceEmbedding, EmployeeFaceCentroid
+from ..face_recognition.gallery import get_face_gallery, normalize_rows
+from ..face_recognition.onnx_embedder import decode_base64_image, get_face_embedder
+from ..face_recognition.preprocess import FaceImageError, parse_landmarks
+from ..face_recognition.transport import EmbeddingFormatError, decode_embedding
 from .utils import get_vietnam_now
 import json
 import logging
-from pgvector.django import CosineDistance
-import logging
+import numpy as np
+from collections import namedtuple
+from django.db.models import Func, IntegerField, Value
+from django.db.models.functions import Cast
+from pgvector.django import BitField, MaxInnerProduct
 
 logger = logging.getLogger(__name__)
 
 # Helper to compute similarity from distance
 def distance_to_similarity(distance):
-    # pgvector CosineDistance returns 1 - cosine_similarity
-    # so cosine_similarity = 1 - distance
-    return 1.0 - distance
-
-def find_matching_employee(input_embedding, threshold=0.65):
-    # L2 normalize input embedding just in case, though our frontend already does
-    norm = sum(x**2 for x in input_embedding) ** 0.5
-    if norm > 0:
-        input_embedding = [x / norm for x in input_embedding]
-
-    # Find the closest embedding using CosineDistance
-    # We only search among active employees
-    closest_emb = EmployeeFaceEmbedding.objects.filter(
-        employee__is_active=True
-    ).order_by(
-        CosineDistance('embedding', input_embedding)
-    ).first()
-    
-    if not closest_emb:
-        return None, 0.0
+    # pgvector MaxInnerProduct (<#>) returns the negative inner product; every
+    # stored embedding and query is L2-normalized, so cosine_similarity = -distance
+    return -distance
 
-    # Calculate similarity score
-    # pgvector's CosineDistance = 1 - cosine_similarity
-    # Note: we need to annotated the distance or we can calculate it manually 
-    # But order_by uses it, so let's annotate to get the value
-    
-    closest_emb = EmployeeFaceEmbedding.objects.filter(
-        employee__is_active=True
+def normalize_query(input_embedding):
+    """Chuẩn hóa L2 embedding truy vấn bằng NumPy, trả về list cho tham số pgvector"""
+    return normalize_rows(np.asarray(input_embedding, dtype=np.float32).reshape(1, -1))[0].tolist()
+
+class HammingDistance(Func):
+    """Khoảng cách Hamming giữa hai giá trị bit: bit_count(a # b).
+
+    Dùng hàm có sẵn của PostgreSQL thay vì toán tử <~> (chỉ có từ pgvector 0.7).
+    """
+    function = 'bit_count'
+    template = '%(function)s(%(expressions)s)'
+    arg_joiner = ' # '
+    output_field = IntegerField()
+
+def compute_similarity(emb1, emb2):
+    """Cosine similarity giữa hai embedding (NumPy)"""
+    emb1 = np.asarray(emb1, dtype=np.float32).ravel()
+    emb2 = np.asarray(emb2, dtype=np.float32).ravel()
+    norm = np.linalg.norm(emb1) * np.linalg.norm(emb2)
+    if norm == 0:
+        return 0.0
+    return float(np.clip(np.dot(emb1, emb2) / norm, -1.0, 1.0))
+
+def apply_ann_search_params(ef_search=None, probes=None):
+    """Đặt tham số ANN (hnsw.ef_search, ivfflat.probes) cho connection hiện tại.
+
+    Ngoài transaction, giá trị được đặt ở mức session và ghi nhớ trên
+    connection nên các lần quét sau với cùng tham số không tốn thêm truy vấn.
+    Trong transaction.atomic() dùng SET LOCAL (rollback sẽ hoàn tác giá trị
+    session nên không thể ghi nhớ).
+    """
+    if ef_search is None:
+        ef_search = settings.FACE_ANN_EF_SEARCH
+    if probes is None:
+        probes = settings.FACE_ANN_PROBES
+    params = (str(int(ef_search)), str(int(probes)))
+
+    is_local = connection.in_atomic_block
+    if not is_local:
+        connection.ensure_connection()
+        cache_key = (id(connection.connection), params)
+        if getattr(connection, '_face_ann_params', None) == cache_key:
+            return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('hnsw.ef_search', %s, %s), set_config('ivfflat.probes', %s, %s)",
+                       [params[0], is_local, params[1], is_local])
+    if not is_local:
+        connection._face_ann_params = cache_key
+
+# Ứng viên so khớp: nhân viên và điểm similarity (tốt nhất hoặc trung bình top-k mẫu)
+MatchCandidate = namedtuple('MatchCandidate', ['employee', 'score'])
+
+def _rank_employees(rows, top_k, fuse_k):
+    """Gom các mẫu (employee_pk, similarity) đã sắp xếp giảm dần thành điểm theo nhân viên.
+
+    Điểm mỗi nhân viên là trung bình của tối đa fuse_k mẫu tốt nhất của họ
+    (fuse_k=1 tương đương lấy mẫu tốt nhất).
+    """
+    samples = {}
+    for employee_pk, score in rows:
+        scores = samples.setdefault(employee_pk, [])
+        if len(scores) < fuse_k:
+            scores.append(score)
+    ranked = sorted(((sum(scores) / len(scores), pk) for pk, scores in samples.items()), reverse=True)
+    return [(pk, score) for score, pk in ranked[:top_k]]
+
+def _margin(candidates):
+    if not candidates:
+        return 0.0
+    second = candidates[1].score if len(candidates) > 1 else 0.0
+    return candidates[0].score - second
+
+def find_matching_candidates(input_embedding, top_k=3, fuse_k=None, ef_search=None, probes=None):
+    """Tìm top-k nhân viên gần nhất trong một truy vấn.
+
+    Trả về (candidates, margin): danh sách MatchCandidate giảm dần theo điểm
+    và khoảng cách điểm giữa hạng nhất và hạng nhì (để loại kết quả mơ hồ).
+    """
+    if fuse_k is None:
+        fuse_k = settings.FACE_TOP_K_FUSION
+    pool = max(settings.FACE_CANDIDATE_POOL, top_k * fuse_k)
+
+    if settings.FACE_MATCH_BACKEND == 'memory':
+        employee_pks, scores = get_face_gallery().search_top(input_embedding, pool)
+        ranked = _rank_employees(zip(employee_pks.tolist(), scores.tolist()), top_k, fuse_k)
+        # Nhân viên có thể vừa bị xóa/ngừng hoạt động sau lần nạp gallery gần nhất
+        employees = Employee.objects.select_related('department').filter(is_active=True).in_bulk(
+            [pk for pk, _ in ranked])
+        candidates = [MatchCandidate(employees[pk], score) for pk, score in ranked if pk in employees]
+        return candidates, _margin(candidates)
+
+    # Mẫu trong DB đã chuẩn hóa khi ghi: chỉ cần chuẩn hóa truy vấn rồi dùng tích vô hướng
+    input_embedding = normalize_query(input_embedding)
+
+    apply_ann_search_params(ef_search, probes)
+    # Một truy vấn duy nhất: lấy `pool` mẫu gần nhất (dùng được HNSW index),
+    # join sẵn employee/department để không phải lazy-load sau đó.
+    # MaxInnerProduct = -cosine_similarity (mọi vector đều đã chuẩn hóa)
+    samples = EmployeeFaceEmbedding.objects.filter(employee__is_active=True)
+    shortlist = settings.FACE_SHORTLIST_SIZE
+    if shortlist > 0:
+        # Tìm kiếm hai bước (vẫn trong cùng câu lệnh SQL): lọc top-M nhân viên
+        # theo centroid, rồi chỉ xếp hạng chính xác các mẫu của họ
+        samples = samples.filter(employee_id__in=EmployeeFaceCentroid.objects.filter(
+            employee__is_active=True
+        ).order_by(
+            MaxInnerProduct('centroid', input_embedding)
+        ).values('employee_id')[:shortlist])
+    quantized = settings.FACE_QUANTIZED_CANDIDATES
+    if quantized > 0:
+        # Lọc ứng viên bằng khoảng cách Hamming trên cột bit (64 byte/mẫu),
+        # sau đó mới tính cosine chính xác trên `quantized` mẫu đó
+        query_bits = EmployeeFaceEmbedding.quantize_binary(input_embedding)
+        samples = samples.filter(id__in=samples.annotate(
+            hamming=HammingDistance('embedding_binary', Cast(Value(query_bits), BitField(length=512)))
+        ).order_by('hamming').values('id')[:quantized])
+    nearest = list(samples.select_related(
+        'employee', 'employee__department'
     ).annotate(
-        distance=CosineDistance('embedding', input_embedding)
-    ).order_by('distance').first()
-    
-    score = distance_to_similarity(closest_emb.distance)
-    
-    print(f"[DEBUG] Best match: {closest_emb.employee.get_full_name()} with distance {closest_emb.distance:.4f} (score: {score:.4f})")
-    
-    if score >= threshold:
-        return closest_emb.employee, score
-        
-    return None, score
+        distance=MaxInnerProduct('embedding', input_embedding)
+    ).order_by('distance')[:pool])
+
+    employees = {emb.employee_id: emb.employee for emb in nearest}
+    ranked = _rank_employees(
+        ((emb.employee_id, distance_to_similarity(emb.distance)) for emb in nearest), top_k, fuse_k)
+    candidates = [MatchCandidate(employees[pk], score) for pk, score in ranked]
+    return candidates, _margin(candidates)
+
+def find_matching_candidates_many(input_embeddings, top_k=3, fuse_k=None, ef_search=None, probes=None):
+    """Phiên bản theo lô của find_matching_candidates: so khớp nhiều embedding cùng lúc.
+
+    Backend 'memory' dùng một phép nhân ma trận cho cả lô; backend 'pgvector'
+    dùng một truy vấn LATERAL (mỗi embedding vẫn dùng được HNSW index) và một
+    truy vấn nạp nhân viên. Trả về list (candidates, margin) theo thứ tự đầu vào.
+    """
+    if fuse_k is None:
+        fuse_k = settings.FACE_TOP_K_FUSION
+    pool = max(settings.FACE_CANDIDATE_POOL, top_k * fuse_k)
+    if not input_embeddings:
+        return []
+
+    queries = normalize_rows(np.asarray(input_embeddings, dtype=np.float32))
+
+    if settings.FACE_MATCH_BACKEND == 'memory':
+        rows_per_query = [
+            zip(pks.tolist(), scores.tolist())
+            for pks, scores in get_face_gallery().search_top_many(queries, pool)
+        ]
+    else:
+        apply_ann_search_params(ef_search, probes)
+        embedding_table = EmployeeFaceEmbedding._meta.db_table
+        employee_table = Employee._meta.db_table
+        centroid_table = EmployeeFaceCentroid._meta.db_table
+        shortlist = settings.FACE_SHORTLIST_SIZE
+        shortlist_filter = f"""
+                    AND emb.employee_id IN (
+                        SELECT c.employee_id
+                        FROM {centroid_table} c
+                        JOIN {employee_table} ce ON ce.id = c.employee_id
+                        WHERE ce.is_active
+                        ORDER BY c.centroid <#> q.vec
+                        LIMIT %s
+                    )""" if shortlist > 0 else ""
+        quantized = settings.FACE_QUANTIZED_CANDIDATES
+        params = [[str(q.tolist()) for q in queries]]
+        if quantized > 0:
+            # Ứng viên theo khoảng cách Hamming trên cột bit, rồi xếp hạng lại bằng cosine
+            params.append([EmployeeFaceEmbedding.quantize_binary(q) for q in queries])
+            source = f"""
+                    SELECT emb.employee_id, emb.embedding <#> q.vec AS distance
+                    FROM (
+                        SELECT emb.employee_id, emb.embedding
+                        FROM {embedding_table} emb
+                        JOIN {employee_table} e ON e.id = emb.employee_id
+                        WHERE e.is_active{shortlist_filter}
+                        ORDER BY bit_count(emb.embedding_binary # q.bits)
+                        LIMIT %s
+                    ) emb
+                    ORDER BY distance"""
+            queries_sql = "unnest(%s::vector[], %s::bit(512)[]) WITH ORDINALITY AS q(vec, bits, idx)"
+        else:
+            source = f"""
+                    SELECT emb.employee_id, emb.embedding <#> q.vec AS distance
+                    FROM {embedding_table} emb
+                    JOIN {employee_table} e ON e.id = emb.employee_id
+                    WHERE e.is_active{shortlist_filter}
+                    ORDER BY emb.embedding <#> q.vec"""
+            queries_sql = "unnest(%s::vector[]) WITH ORDINALITY AS q(vec, idx)"
+        if shortlist > 0:
+            params.append(shortlist)
+        if quantized > 0:
+            params.append(quantized)
+        params.append(pool)
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT q.idx, m.employee_id, m.distance
+                FROM {queries_sql}
+                CROSS JOIN LATERAL ({source}
+                    LIMIT %s
+                ) m
+                ORDER BY q.idx, m.distance
+            """, params)
+            rows_per_query = [[] for _ in range(len(queries))]
+            for idx, employee_pk, distance in cursor.fetchall():
+                rows_per_query[idx - 1].append((employee_pk, distance_to_similarity(distance)))
+
+    ranked_per_query = [_rank_employees(rows, top_k, fuse_k) for rows in rows_per_query]
+    employee_pks = {pk for ranked in ranked_per_query for pk, _ in ranked}
+    employees = Employee.objects.select_related('department').filter(is_active=True).in_bulk(employee_pks)
+
+    results = []
+    for ranked in ranked_per_query:
+        candidates = [MatchCandidate(employees[pk], score) for pk, score in ranked if pk in employees]
+        results.append((candidates, _margin(candidates)))
+    return results
+
+def _select_match(candidates, margin, threshold, min_margin):
+    if not candidates:
+        return None, 0.0
+
+    best = candidates[0]
+    logger.debug(f"Best match: {best.employee.get_full_name()} (score: {best.score:.4f}, margin: {margin:.4f})")
+
+    if best.score >= threshold and margin >= min_margin:
+        return best.employee, best.score
+
+    return None, best.score
+
+def find_matching_employee(input_embedding, threshold=0.65, ef_search=None, probes=None, min_margin=None):
+    if min_margin is None:
+        min_margin = settings.FACE_MIN_MARGIN
+
+    candidates, margin = find_matching_candidates(input_embedding, ef_search=ef_search, probes=probes)
+    return _select_match(candidates, margin, threshold, min_margin)
+
+def find_matching_employees(input_embeddings, threshold=0.65, min_margin=None):
+    """So khớp nhiều embedding trong một lượt, trả về list (employee, score) theo thứ tự đầu vào"""
+    if min_margin is None:
+        min_margin = settings.FACE_MIN_MARGIN
+
+    return [
+        _select_match(candidates, margin, threshold, min_margin)
+        for candidates, margin in find_matching_candidates_many(input_embeddings)
+    ]
+
+def find_registration_conflict(input_embeddings, employee, threshold=0.65):
+    """Nhân viên khác có khuôn mặt trùng với bất kỳ mẫu nào sắp đăng ký.
+
+    So khớp toàn bộ mẫu trong một lượt (find_matching_candidates_many) và bỏ
+    qua chính nhân viên đang đăng ký lại. Không xét margin: hai người giống
+    nhau vẫn phải bị chặn. Trả về (employee, score) trùng cao nhất hoặc (None, 0.0).
+    """
+    conflict, best = None, 0.0
+    for candidates, _ in find_matching_candidates_many(input_embeddings, top_k=2):
+        for candidate in candidates:
+            if candidate.employee.pk != employee.pk and candidate.score >= threshold and candidate.score > best:
+                conflict, best = candidate.employee, candidate.score
+    return conflict, best
+
+def request_data(request):
+    """Dữ liệu request: form multipart (khi gửi kèm file ảnh) hoặc JSON body"""
+    if request.content_type.startswith('multipart/'):
+        return request.POST
+    return json.loads(request.body)
+
+def _request_landmarks(data, count):
+    """Landmark 5 điểm kèm ảnh: [[x, y] x 5] cho một ảnh hoặc list cho từng ảnh (multipart: chuỗi JSON)"""
+    value = data.get('landmarks')
+    if value in (None, ''):
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            raise FaceImageError('Landmark không hợp lệ')
+    if np.ndim(value) == 2:
+        value = [value]
+    if len(value) != count:
+        raise FaceImageError('Số bộ landmark phải bằng số ảnh')
+    return [parse_landmarks(points) for points in value]
+
+def embed_request_images(request, data, field):
+    """Tính embedding phía server từ ảnh khuôn mặt gửi kèm request.
+
+    Ảnh là file multipart hoặc chuỗi base64 (một chuỗi hoặc list) trong JSON,
+    có thể kèm 'landmarks' (5 điểm trên ảnh gốc) để server tự căn chỉnh.
+    Trả về list embedding ([] nếu không có ảnh); raise FaceImageError nếu ảnh
+    không hợp lệ hoặc server không bật FACE_SERVER_INFERENCE.
+    """
+    files = request.FILES.getlist(field)
+    if files:
+        images = [f.read() for f in files]
+    else:
+        value = data.getlist(field) if hasattr(data, 'getlist') else data.get(field)
+        if not value:
+            return []
+        images = [decode_base64_image(v) for v in (value if isinstance(value, list) else [value])]
+
+    embedder = get_face_embedder()
+    if embedder is None:
+        raise FaceImageError('Server không hỗ trợ xử lý ảnh, vui lòng gửi embedding')
+    return embedder.embed(images, _request_landmarks(data, len(images))).tolist()
 
 @csrf_exempt
 def check_duplicate(request):
@@ -61,7 +337,8 @@ def check_duplicate(request):
             
             if not embedding:
                 return JsonResponse({'success': False, 'error': 'No embedding provided'}, status=400)
-            
+
+            embedding = decode_embedding(embedding, data.get('embedding_dtype'))
             existing_employee, score = find_matching_employee(embedding)
             
             if existing_employee:
@@ -77,7 +354,9 @@ def check_duplicate(request):
                     'success': True,
                     'is_duplicate': False
                 })
-                
+
+        except EmbeddingFormatError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)}, status=500)
     
@@ -103,43 +382,42 @@ def register_face(request):
     if request.method == 'GET':
          employees = Employee.objects.filter(
             is_active=True,
-            face_embeddings__isnull=True
+            face_sample_count=0
         ).order_by('first_name', 'last_name')
          from django.shortcuts import render
          return render(request, 'attendance/register_face.html', {'employees': employees})
 
     if request.method == 'POST':
         try:
-            data = json.loads(request.body)
+            data = request_data(request)
             employee_id = data.get('employee_id')
             embeddings = data.get('embeddings', []) # Expecting list of embeddings
+
+            # Kiosk không tự tính được embedding: gửi ảnh khuôn mặt để server tính
+            if not embeddings:
+                embeddings = embed_request_images(request, data, 'images')
             
             logger.info(f"[register_face] Employee ID: {employee_id}")
             logger.info(f"[register_face] Embeddings count: {len(embeddings)}")
-            
-            # Legacy support if frontend sends 'images' - though we prefer embeddings
-            if not embeddings and 'images' in data:
-                 return JsonResponse({'error': 'Backend no longer supports image processing. Please update frontend.'}, status=400)
 
             if not embeddings:
                 return JsonResponse({'error': 'Không có dữ liệu khuôn mặt (embeddings)'}, status=400)
+            embeddings = [decode_embedding(e, data.get('embedding_dtype')) for e in embeddings]
 
             employee = Employee.objects.get(employee_id=employee_id)
 
-            if employee.face_embeddings:
+            if employee.has_face:
                 return JsonResponse({
                     'error': 'Nhân viên này đã đăng ký khuôn mặt',
                     'details': 'Vui lòng chọn nhân viên khác'
                 }, status=400)
             
-            # Simple server-side duplicate check using the first embedding
-            # (Optional: check all)
-            first_embedding = embeddings[0]
-            existing_emp, score = find_matching_employee(first_embedding)
-             
-            if existing_emp and existing_emp.employee_id != employee.employee_id:
+            # Kiểm tra trùng trên tất cả các mẫu (một truy vấn cho cả lô)
+            existing_emp, score = find_registration_conflict(embeddings, employee)
+
+            if existing_emp:
                  return JsonResponse({
-                    'error': f"Khuôn mặt này đã tồn tại trong hệ thống",
+                    'error': "Khuôn mặt này đã tồn tại trong hệ thống",
                     'details': f"Trùng với nhân viên: {existing_emp.get_full_name()} ({existing_emp.employee_id})"
                 }, status=400)
 
@@ -164,6 +442,8 @@ def register_face(request):
                 'timestamp': now.strftime('%d/%m/%Y %H:%M:%S')
             })
 
+        except (FaceImageError, ValueError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Employee.DoesNotExist:
             logger.error(f"[register_face] Employee not found: {employee_id}")
             return JsonResponse({
@@ -212,7 +492,7 @@ def delete_face(request):
             employee = Employee.objects.get(employee_id=employee_id)
             logger.info(f"[delete_face] Found employee: {employee.get_full_name()}")
             
-            if not employee.face_embeddings:
+            if not employee.has_face:
                 logger.warning(f"[delete_face] Employee {employee_id} has no face embeddings")
                 return JsonResponse({'error': 'Nhân viên chưa đăng ký khuôn mặt'}, status=400)
                 
@@ -50,7 +50,7 @@ def dashboard_api(request):
     ).select_related('employee', 'employee__user').order_by('-check_in_time')
     
     recent_employee_ids = list(recent_records.values_list('employee_id', flat=True).distinct()[:10])
-    employees_qs = Employee.objects.filter(id__in=recent_employee_ids).select_related('user')
+    employees_qs = Employee.objects.filter(id__in=recent_employee_ids).select_related('user', 'department')
     
     employees = []
     for emp in employees_qs:
@@ -61,7 +61,7 @@ def dashboard_api(request):
             'position': emp.position,
             'work_status': emp.work_status,
             'current_status': emp.current_status,
-            'has_face': emp.face_embeddings is not None,
+            'has_face': emp.has_face,
         })
     
     return json_response({
@@ -109,7 +109,7 @@ def employees_api(request):
                 'work_status_display': emp.get_work_status_display(),
                 'current_status': emp.current_status,
                 'join_date': emp.join_date.isoformat() if emp.join_date else None,
-                'has_face': emp.face_embeddings is not None,
+                'has_face': emp.has_face,
                 'has_account': emp.user is not None,
             })
         
@@ -235,7 +235,7 @@ def employee_detail_api(request, employee_id):
                 'work_status_display': employee.get_work_status_display(),
                 'current_status': employee.current_status,
                 'join_date': employee.join_date.isoformat() if employee.join_date else None,
-                'has_face': employee.face_embeddings is not None,
+                'has_face': employee.has_face,
                 'has_account': employee.user is not None,
             },
             'attendance_history': history,
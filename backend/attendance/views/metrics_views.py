@@ -0,0 +1,26 @@
+"""
+Metrics vận hành của tiến trình hiện tại (JSON), dùng cho giám sát
+"""
+from django.views.decorators.csrf import csrf_exempt
+
+from ..face_recognition.onnx_embedder import face_embedder_stats
+from ..push.dispatcher import notification_dispatcher_stats
+from ..push.expo import expo_batcher_stats, expo_client_stats
+from ..push.fcm import fcm_batcher_stats
+from .frontend_api import json_response, error_response
+
+
+@csrf_exempt
+def metrics_api(request):
+    """Độ sâu hàng đợi, kích thước lô và thời gian chờ của suy luận embedding phía server và push notification"""
+    if request.method != 'GET':
+        return error_response('Method not allowed', 405)
+
+    return json_response({
+        'success': True,
+        'face_inference': face_embedder_stats(),
+        'push_notifications': notification_dispatcher_stats(),
+        'fcm_batches': fcm_batcher_stats(),
+        'expo': expo_client_stats(),
+        'expo_batches': expo_batcher_stats(),
+    })
@@ -1,74 +1,29 @@
 import json
-import os
+from concurrent.futures import Future
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.conf import settings
 from ..models import Employee
-import firebase_admin
-from firebase_admin import credentials, messaging
-
-_firebase_app = None
-
-def get_firebase_app():
-    global _firebase_app
-    if _firebase_app is None:
-        try:
-            service_account_path = os.path.join(
-                settings.BASE_DIR, 
-                'config', 
-                'datastoragedemo-99ff9-3abc57b4ec78.json'
-            )
-            
-            if os.path.exists(service_account_path):
-                cred = credentials.Certificate(service_account_path)
-                _firebase_app = firebase_admin.initialize_app(cred)
-                print("Firebase Admin SDK initialized from file")
-            else:
-                firebase_creds_json = os.environ.get('FIREBASE_CREDENTIALS')
-                if firebase_creds_json:
-                    import json as json_module
-                    cred_dict = json_module.loads(firebase_creds_json)
-                    cred = credentials.Certificate(cred_dict)
-                    _firebase_app = firebase_admin.initialize_app(cred)
-                    print("Firebase Admin SDK initialized from env var")
-                else:
-                    print(f"Firebase: no service account file ({service_account_path}) and no FIREBASE_CREDENTIALS env var")
-                    return None
-        except Exception as e:
-            print(f"Error initializing Firebase: {e}")
-            return None
-    return _firebase_app
+from ..push.expo import get_expo_batcher, send_expo_batch
+from ..push.fcm import build_fcm_message, get_fcm_batcher, get_fcm_transport, send_fcm_batch
+from ..push.messages import attendance_content, is_expo_token
 
 
 def send_fcm_notification(fcm_token, title, body, data=None):
     if not fcm_token:
         return False
     
-    app = get_firebase_app()
-    if app is None:
+    transport = get_fcm_transport()
+    if transport is None:
         print("Firebase not initialized, skipping push notification")
         return False
     
+    send_each, app = transport
     try:
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
-            ),
-            data=data or {},
-            token=fcm_token,
-            android=messaging.AndroidConfig(
-                priority='high',
-                notification=messaging.AndroidNotification(
-                    sound='default',
-                    priority='high',
-                    channel_id='attendance',
-                ),
-            ),
-        )
-        
-        response = messaging.send(message)
-        print(f"FCM notification sent successfully: {response}")
+        response = send_each([build_fcm_message(fcm_token, title, body, data)], app=app).responses[0]
+        if not response.success:
+            print(f"Error sending FCM notification: {response.exception}")
+            return False
+        print(f"FCM notification sent successfully: {response.message_id}")
         return True
         
     except Exception as e:
@@ -76,78 +31,66 @@ def send_fcm_notification(fcm_token, title, body, data=None):
         return False
 
 
+def _single_result(batch_future):
+    """Future bool của thông báo duy nhất trong một lần submit vào MicroBatcher"""
+    result = Future()
+
+    def done(future):
+        error = future.exception()
+        if error is not None:
+            result.set_exception(error)
+        else:
+            result.set_result(bool(future.result()[0]))
+
+    batch_future.add_done_callback(done)
+    return result
+
+
 def send_attendance_notification(employee, is_check_in, time_str):
+    """Gửi thông báo chấm công, trả về bool.
+
+    Khi bật gom lô (PUSH_FCM_BATCH_WINDOW_MS / PUSH_EXPO_BATCH_WINDOW_MS > 0), thông báo
+    được đưa vào batcher của nhà cung cấp và hàm trả về ngay một Future bool:
+    NotificationDispatcher không giữ worker chờ lô, nên một lô gom được thông báo
+    từ cả hàng đợi.
+    """
     if not employee.expo_push_token:
         print(f"No push token for employee {employee.employee_id}")
         return False
     
-    fcm_token = employee.expo_push_token
-    
-    if fcm_token.startswith('ExponentPushToken'):
+    is_expo = is_expo_token(employee.expo_push_token)
+    batcher = get_expo_batcher() if is_expo else get_fcm_batcher()
+    if batcher is not None:
+        # Gom với các thông báo khác trong cửa sổ gom lô của nhà cung cấp
+        return _single_result(batcher.submit([(employee, is_check_in, time_str)]))
+
+    if is_expo:
         return send_expo_push_notification(employee, is_check_in, time_str)
-    
-    if is_check_in:
-        title = "✅ Check-in thành công!"
-        body = f"Bạn đã check-in lúc {time_str}. Chúc bạn một ngày làm việc hiệu quả!"
-    else:
-        title = "✅ Check-out thành công!"
-        body = f"Bạn đã check-out lúc {time_str}. Hẹn gặp lại ngày mai!"
-    
-    data = {
-        'type': 'attendance',
-        'action': 'check_in' if is_check_in else 'check_out',
-        'time': time_str,
-        'employee_id': employee.employee_id,
-        'realtime_update': 'true',
-    }
-    
-    return send_fcm_notification(fcm_token, title, body, data)
+
+    title, body, data = attendance_content(employee, is_check_in, time_str)
+    return send_fcm_notification(employee.expo_push_token, title, body, data)
+
+
+def send_attendance_notifications(notifications):
+    """Gửi nhiều thông báo (employee, is_check_in, time_str), trả về list bool theo thứ tự.
+
+    Thông báo FCM được gửi chung bằng send_each, Expo theo lô 100 message mỗi POST.
+    """
+    results = [False] * len(notifications)
+    fcm, expo = [], []
+    for i, (employee, _, _) in enumerate(notifications):
+        if employee.expo_push_token:
+            (expo if is_expo_token(employee.expo_push_token) else fcm).append(i)
+    for indexes, send_batch in ((fcm, send_fcm_batch), (expo, send_expo_batch)):
+        for i, ok in zip(indexes, send_batch([notifications[i] for i in indexes])):
+            results[i] = ok
+    return results
 
 
 def send_expo_push_notification(employee, is_check_in, time_str):
-    import requests
-    
-    push_token = employee.expo_push_token
-    if not push_token:
-        return False
-    
-    if is_check_in:
-        title = "✅ Check-in thành công!"
-        body = f"Bạn đã check-in lúc {time_str}. Chúc bạn một ngày làm việc hiệu quả!"
-    else:
-        title = "✅ Check-out thành công!"
-        body = f"Bạn đã check-out lúc {time_str}. Hẹn gặp lại ngày mai!"
-    
-    message = {
-        'to': push_token,
-        'sound': 'default',
-        'title': title,
-        'body': body,
-        'data': {
-            'type': 'attendance',
-            'action': 'check_in' if is_check_in else 'check_out',
-            'time': time_str,
-            'employee_id': employee.employee_id,
-            'realtime_update': 'true',
-        },
-    }
-    
-    try:
-        response = requests.post(
-            'https://exp.host/--/api/v2/push/send',
-            headers={
-                'Accept': 'application/json',
-                'Content-Type': 'application/json',
-            },
-            data=json.dumps(message),
-            timeout=10
-        )
-        result = response.json()
-        print(f"Expo Push notification sent: {result}")
-        return True
-    except Exception as e:
-        print(f"Error sending Expo push notification: {e}")
+    if not employee.expo_push_token:
         return False
+    return send_expo_batch([(employee, is_check_in, time_str)])[0]
 
 
 @csrf_exempt
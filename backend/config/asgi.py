@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_asgi_application()
+
+# Backend 'memory': nạp gallery khuôn mặt khi khởi động. Với FACE_GALLERY_SHARED_PATH,
+# mọi worker map chung một file (chạy gunicorn --preload để chia sẻ cả mapping từ master).
+from attendance.face_recognition.gallery import preload_face_gallery  # noqa: E402
+
+preload_face_gallery()
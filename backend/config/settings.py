@@ -122,6 +122,107 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Face matching (pgvector ANN index)
+# hnsw.ef_search / ivfflat.probes: tăng để chính xác hơn, giảm để nhanh hơn
+FACE_ANN_EF_SEARCH = int(os.environ.get('FACE_ANN_EF_SEARCH', '40'))
+FACE_ANN_PROBES = int(os.environ.get('FACE_ANN_PROBES', '10'))
+
+# Backend so khớp khuôn mặt: 'pgvector' (truy vấn database) hoặc 'memory'
+# (ma trận NumPy trong từng worker)
+FACE_MATCH_BACKEND = os.environ.get('FACE_MATCH_BACKEND', 'pgvector')
+# Số giây tối đa trước khi gallery trong bộ nhớ nạp lại toàn bộ (0 = không bao giờ). Thay đổi từ
+# worker khác đã được áp dụng tăng dần qua nhật ký thay đổi, đây chỉ là lần đồng bộ lại định kỳ
+FACE_GALLERY_TTL = int(os.environ.get('FACE_GALLERY_TTL', '3600'))
+# Chu kỳ (giây) mỗi worker đọc nhật ký FaceGalleryChange và chỉ nạp lại mẫu của nhân viên đã thay đổi
+# (0 = tắt: mỗi thay đổi nạp lại toàn bộ gallery / xuất bản lại file dùng chung)
+FACE_GALLERY_CHANGE_POLL_INTERVAL = float(os.environ.get('FACE_GALLERY_CHANGE_POLL_INTERVAL', '1'))
+# Gộp các thay đổi tăng dần vào gallery chính khi số mẫu thay đổi vượt tỉ lệ này
+FACE_GALLERY_COMPACT_RATIO = float(os.environ.get('FACE_GALLERY_COMPACT_RATIO', '0.1'))
+# Thời gian (giây) giữ nhật ký thay đổi. Xóa nhật ký cũ bằng: manage.py prune_face_gallery_changes
+FACE_GALLERY_CHANGE_RETENTION = int(os.environ.get('FACE_GALLERY_CHANGE_RETENTION', '86400'))
+# File gallery dùng chung giữa các worker (mmap read-only, '' = mỗi worker tự nạp từ database).
+# Xuất bản lại bằng: manage.py publish_face_gallery
+FACE_GALLERY_SHARED_PATH = os.environ.get('FACE_GALLERY_SHARED_PATH', '')
+# Chu kỳ (giây) mỗi worker kiểm tra file gallery dùng chung đã được xuất bản lại chưa
+FACE_GALLERY_SHARED_CHECK_INTERVAL = float(os.environ.get('FACE_GALLERY_SHARED_CHECK_INTERVAL', '1'))
+# Nạp gallery bằng COPY nhị phân thay vì ORM (chỉ PostgreSQL). Đo bằng: manage.py benchmark_gallery_load
+FACE_GALLERY_BULK_LOAD = os.environ.get('FACE_GALLERY_BULK_LOAD', 'True') == 'True'
+# Số mẫu gần nhất lấy về trong một truy vấn để xếp hạng top-k nhân viên
+FACE_CANDIDATE_POOL = int(os.environ.get('FACE_CANDIDATE_POOL', '50'))
+# Điểm mỗi nhân viên = trung bình FACE_TOP_K_FUSION mẫu tốt nhất (1 = mẫu tốt nhất)
+FACE_TOP_K_FUSION = int(os.environ.get('FACE_TOP_K_FUSION', '1'))
+# Khoảng cách điểm tối thiểu giữa hạng nhất và hạng nhì (0 = không kiểm tra)
+FACE_MIN_MARGIN = float(os.environ.get('FACE_MIN_MARGIN', '0'))
+# Tìm kiếm hai bước: lọc top-M nhân viên theo centroid trước khi xếp hạng từng mẫu (0 = tắt).
+# Đo bằng: manage.py benchmark_face_search
+FACE_SHORTLIST_SIZE = int(os.environ.get('FACE_SHORTLIST_SIZE', '0'))
+# Lọc ứng viên bằng embedding nhị phân (khoảng cách Hamming) rồi tính lại cosine chính xác
+# trên FACE_QUANTIZED_CANDIDATES mẫu (0 = tắt, chỉ áp dụng cho backend pgvector)
+FACE_QUANTIZED_CANDIDATES = int(os.environ.get('FACE_QUANTIZED_CANDIDATES', '0'))
+
+# Trích xuất embedding phía server (onnxruntime, CPU) cho kiosk gửi ảnh khuôn mặt thay vì embedding.
+# Cần cài onnxruntime; model phải là model nhận diện (output 512 chiều) giống model frontend dùng.
+FACE_SERVER_INFERENCE = os.environ.get('FACE_SERVER_INFERENCE', 'False') == 'True'
+FACE_EMBEDDING_MODEL_PATH = os.environ.get(
+    'FACE_EMBEDDING_MODEL_PATH', str(BASE_DIR.parent / 'model' / 'mobilefacenet_insightface.onnx'))
+# Biến thể model: 'fp32' hoặc 'int8' (tạo bằng manage.py quantize_face_model, kiểm tra độ lệch so với
+# FP32 bằng manage.py benchmark_face_quantization). Mặc định model INT8 nằm cạnh model FP32 (*_int8.onnx)
+FACE_MODEL_VARIANT = os.environ.get('FACE_MODEL_VARIANT', 'fp32')
+FACE_EMBEDDING_INT8_MODEL_PATH = os.environ.get('FACE_EMBEDDING_INT8_MODEL_PATH', '')
+# Số InferenceSession trong pool (0 = số lõi CPU / FACE_ONNX_INTRA_OP_THREADS)
+FACE_ONNX_POOL_SIZE = int(os.environ.get('FACE_ONNX_POOL_SIZE', '0'))
+FACE_ONNX_INTRA_OP_THREADS = int(os.environ.get('FACE_ONNX_INTRA_OP_THREADS', '1'))
+FACE_ONNX_INTER_OP_THREADS = int(os.environ.get('FACE_ONNX_INTER_OP_THREADS', '1'))
+# Gom ảnh từ các request đồng thời thành một lô: chờ tối đa FACE_INFERENCE_BATCH_WINDOW_MS
+# (0 = tắt) hoặc đến khi đủ FACE_INFERENCE_MAX_BATCH ảnh. Đo bằng: manage.py benchmark_face_inference
+FACE_INFERENCE_BATCH_WINDOW_MS = float(os.environ.get('FACE_INFERENCE_BATCH_WINDOW_MS', '0'))
+FACE_INFERENCE_MAX_BATCH = int(os.environ.get('FACE_INFERENCE_MAX_BATCH', '16'))
+
+# Chấm công theo lô (process-attendance/batch/)
+FACE_BATCH_MAX_ITEMS = int(os.environ.get('FACE_BATCH_MAX_ITEMS', '50'))
+# Độ lệch đồng hồ tối đa (giây) cho phép giữa timestamp của kiosk và server
+FACE_BATCH_MAX_CLOCK_SKEW = int(os.environ.get('FACE_BATCH_MAX_CLOCK_SKEW', '60'))
+# Các lượt quét cùng một nhân viên cách nhau ít hơn số giây này trong một lô chỉ tính một lần
+FACE_BATCH_DEDUP_SECONDS = int(os.environ.get('FACE_BATCH_DEDUP_SECONDS', '60'))
+
+# Cách gửi push notification chấm công: 'dispatcher' (pool thread trong tiến trình web) hoặc
+# 'outbox' (ghi bảng PushNotificationOutbox cùng bản ghi chấm công, gửi bằng manage.py process_push_outbox)
+PUSH_DELIVERY = os.environ.get('PUSH_DELIVERY', 'dispatcher')
+# Outbox: số dòng mỗi lô, số lần gửi tối đa, backoff lũy thừa (giây) giữa các lần thử lại
+# và thời gian giữ các dòng đã gửi / thất bại
+PUSH_OUTBOX_BATCH_SIZE = int(os.environ.get('PUSH_OUTBOX_BATCH_SIZE', '100'))
+PUSH_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('PUSH_OUTBOX_MAX_ATTEMPTS', '8'))
+PUSH_OUTBOX_BACKOFF_BASE = float(os.environ.get('PUSH_OUTBOX_BACKOFF_BASE', '5'))
+PUSH_OUTBOX_BACKOFF_MAX = float(os.environ.get('PUSH_OUTBOX_BACKOFF_MAX', '3600'))
+PUSH_OUTBOX_RETENTION = int(os.environ.get('PUSH_OUTBOX_RETENTION', '604800'))
+# Gửi push notification bằng pool worker cố định với hàng đợi có giới hạn (xem attendance/push/dispatcher.py).
+# PUSH_DISPATCH_OVERFLOW khi hàng đợi đầy: 'drop' (bỏ thông báo) hoặc 'inline' (gửi ngay trong request)
+PUSH_DISPATCH_WORKERS = int(os.environ.get('PUSH_DISPATCH_WORKERS', '4'))
+PUSH_DISPATCH_QUEUE_SIZE = int(os.environ.get('PUSH_DISPATCH_QUEUE_SIZE', '1000'))
+PUSH_DISPATCH_OVERFLOW = os.environ.get('PUSH_DISPATCH_OVERFLOW', 'drop')
+# Số giây tối đa gửi nốt hàng đợi khi tiến trình thoát
+PUSH_DISPATCH_SHUTDOWN_TIMEOUT = float(os.environ.get('PUSH_DISPATCH_SHUTDOWN_TIMEOUT', '5'))
+# Gom thông báo FCM trong hàng đợi dispatcher thành một lần messaging.send_each (tối đa 500),
+# chờ tối đa PUSH_FCM_BATCH_WINDOW_MS (0 = gửi từng thông báo). Outbox luôn gửi FCM theo lô
+PUSH_FCM_BATCH_WINDOW_MS = float(os.environ.get('PUSH_FCM_BATCH_WINDOW_MS', '0'))
+# Tương tự cho Expo: gom thành một POST (tối đa 100 message), chờ tối đa PUSH_EXPO_BATCH_WINDOW_MS
+PUSH_EXPO_BATCH_WINDOW_MS = float(os.environ.get('PUSH_EXPO_BATCH_WINDOW_MS', '0'))
+# Expo Push API (attendance/push/expo.py): URL gốc, access token (nếu bật "enhanced push security"),
+# số connection keep-alive giữ trong pool và timeout mỗi request (giây)
+EXPO_PUSH_API_URL = os.environ.get('EXPO_PUSH_API_URL', 'https://exp.host/--/api/v2/push')
+EXPO_ACCESS_TOKEN = os.environ.get('EXPO_ACCESS_TOKEN', '')
+EXPO_POOL_SIZE = int(os.environ.get('EXPO_POOL_SIZE', '10'))
+EXPO_TIMEOUT = float(os.environ.get('EXPO_TIMEOUT', '10'))
+# Số giây sau khi gửi mới lấy receipt (Expo khuyến nghị chờ khoảng 15 phút)
+EXPO_RECEIPT_DELAY = int(os.environ.get('EXPO_RECEIPT_DELAY', '900'))
+# Nhà cung cấp push giả lập cho kiểm thử tải (attendance/push/fake_provider.py): PUSH_FCM_TRANSPORT = 'fake'
+# gửi FCM tới stub trong tiến trình thay vì Firebase; Expo: trỏ EXPO_PUSH_API_URL tới manage.py run_fake_push_server.
+# Độ trễ mỗi request (ms, ± jitter), tỷ lệ message lỗi và giới hạn tốc độ (message/giây, 0 = không giới hạn)
+PUSH_FCM_TRANSPORT = os.environ.get('PUSH_FCM_TRANSPORT', 'firebase')
+PUSH_FAKE_LATENCY_MS = float(os.environ.get('PUSH_FAKE_LATENCY_MS', '50'))
+PUSH_FAKE_JITTER_MS = float(os.environ.get('PUSH_FAKE_JITTER_MS', '20'))
+PUSH_FAKE_ERROR_RATE = float(os.environ.get('PUSH_FAKE_ERROR_RATE', '0'))
+PUSH_FAKE_RATE_LIMIT = float(os.environ.get('PUSH_FAKE_RATE_LIMIT', '0'))
 
 
 LOGIN_REDIRECT_URL = '/'